@@ -39,6 +39,9 @@ options = AttributeDict({
     'skymodel': True,
     'csv': True,
     'force_beam': True,
+    'fit_workers': 0,
+    'single_precision': False,
+    'tile_size': 0,
     'alpha': .1,
     'detection_image': False,
     'mode': 'threshold'
@@ -95,6 +98,20 @@ class TestPyse(unittest.TestCase):
         # one file
         tkp.bin.pyse.run_sourcefinder([self.filename], options)
 
+    def test_run_sourcefinder_tiled(self):
+        tiled_options = AttributeDict(options)
+        tiled_options.update(tile_size=100, residuals=False, islands=False,
+                             rmsmap=False, sigmap=False)
+        tkp.bin.pyse.run_sourcefinder([self.filename], tiled_options)
+
+    def test_run_sourcefinder_tiled_not_fits(self):
+        tiled_options = AttributeDict(options)
+        tiled_options.update(tile_size=100, residuals=False, islands=False,
+                             rmsmap=False, sigmap=False)
+        with tempfile.NamedTemporaryFile(suffix='.h5') as temp_file:
+            with self.assertRaises(SystemExit):
+                tkp.bin.pyse.run_sourcefinder([temp_file.name], tiled_options)
+
     def test_bailout(self):
         import sys
         old_exit = sys.exit
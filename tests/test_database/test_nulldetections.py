@@ -507,3 +507,31 @@ class TestForcedFit(unittest.TestCase):
         self.assertEqual(result[5][3], result[4][3])
         self.assertEqual(result[5][4], taustart_tss[2])
 
+
+
+@requires_database()
+class TestLastMeasurements(unittest.TestCase):
+    """
+    Forced fits may start from the last blind measurement of a source.
+    """
+    def tearDown(self):
+        tkp.db.rollback()
+
+    def test_last_measurements(self):
+        dataset = DataSet(data={'description': self._testMethodName})
+        image = tkp.db.Image(
+            dataset=dataset,
+            data=db_subs.generate_timespaced_dbimages_data(1)[0])
+        src = db_subs.example_extractedsource_tuple(ra=122.5, dec=9.5,
+                                                    peak=0.25)
+        dbgen.insert_extracted_sources(image.id, [src], 'blind')
+        dbass.associate_extracted_sources(image.id, deRuiter_r=5.68,
+                                          new_source_sigma_margin=3)
+        runcat_id = dbgen.runcat_entries(dataset.id)[0]['runcat']
+
+        last = dbgen.last_measurements([runcat_id])
+        self.assertEqual(last.keys(), [runcat_id])
+        self.assertEqual(tuple(last[runcat_id]),
+                         (src.peak, src.beam_maj, src.beam_min,
+                          src.beam_angle))
+        self.assertEqual(dbgen.last_measurements([]), {})
@@ -1,6 +1,8 @@
 import unittest
 
-from tkp.sourcefinder.deconv import deconv
+import numpy
+
+from tkp.sourcefinder.deconv import deconv, deconv_many
 
 class DecovolutionTestCase(unittest.TestCase):
     """
@@ -29,3 +31,22 @@ class DecovolutionTestCase(unittest.TestCase):
         for args, result in known_good:
             for i, val in enumerate(deconv(*args)):
                 self.assertAlmostEqual(val, result[i])
+
+    def test_many_matches_single(self):
+        random = numpy.random.RandomState(1)
+        fmaj = random.uniform(0.5, 10, 500)
+        fmin = random.uniform(0.5, 10, 500)
+        fpa = random.uniform(-100, 200, 500)
+        # Circular components and position angles along the beam.
+        fmaj[::10] = fmin[::10]
+        fpa[::7] = 45.
+        for beam in ((3., 2., 17.), (2., 2., 0.), (3., 3., 45.)):
+            many = deconv_many(fmaj, fmin, fpa, *beam)
+            for index in range(len(fmaj)):
+                self.assertEqual(
+                    tuple(value[index] for value in many),
+                    deconv(fmaj[index], fmin[index], fpa[index], *beam))
+
+    def test_many_infinite_angle(self):
+        self.assertRaises(ValueError, deconv_many, [2., 2.], [1., 1.],
+                          [0., numpy.inf], 1., 1., 0.)
@@ -0,0 +1,255 @@
+import copy
+import cPickle
+import unittest
+from collections import namedtuple
+
+import numpy
+from scipy import ndimage
+
+from tkp.sourcefinder import extract
+from tkp.sourcefinder.image import (DEBLEND_MINCONT, STRUCTURING_ELEMENT,
+                                    ImageData)
+from tkp.testutil.mock import make_wcs
+from tkp.utility.uncertain import Uncertain
+
+BEAM = (2., 2., 0.)
+
+
+def make_island(sources, nthresh, shape=(40, 60)):
+    """
+    An Island containing the given (x, y, peak) Gaussians, cut off at unit
+    analysis threshold and with a detection threshold of 5.
+    """
+    x, y = numpy.indices(shape, dtype=float)
+    data = numpy.zeros(shape)
+    for xpos, ypos, peak in sources:
+        data += peak * numpy.exp(-numpy.log(2) * ((x - xpos)**2 +
+                                                  (y - ypos)**2) / 4.)
+    data = numpy.where(data > 1., data, -extract.BIGNUM)
+    chunk = (slice(10, 10 + shape[0]), slice(20, 20 + shape[1]))
+    return extract.Island(data, numpy.ones(shape), chunk, 1.,
+                          numpy.ones(shape) * 5., BEAM, nthresh,
+                          DEBLEND_MINCONT, STRUCTURING_ELEMENT)
+
+
+def peak_positions(islands):
+    return [tuple(numpy.array(ndimage.maximum_position(
+                island.data.filled(fill_value=0))) +
+            (island.chunk[0].start, island.chunk[1].start))
+            for island in islands]
+
+
+class TestDeblend(unittest.TestCase):
+    def test_single_source(self):
+        island = make_island([(20, 30, 50)], 32)
+        self.assertIs(island.deblend(), island)
+
+    def test_two_sources(self):
+        island = make_island([(20, 20, 50), (20, 30, 40)], 32)
+        subislands = island.deblend()
+        self.assertEqual(len(subislands), 2)
+        self.assertEqual(peak_positions(subislands), [(30, 40), (30, 50)])
+        for subisland in subislands:
+            self.assertEqual(subisland.flux_orig, island.flux_orig)
+            # Subislands are cut off flat at the level they split at.
+            self.assertEqual(subisland.threshold(), subisland.rms.max())
+            self.assertTrue(subisland.data.min() >= subisland.threshold())
+
+    def test_nested_split(self):
+        # The two close sources split off from each other at a higher
+        # level than they split from the third.
+        island = make_island(
+            [(20, 10, 60), (20, 30, 50), (20, 36, 50)], 64)
+        subislands = island.deblend()
+        self.assertEqual(len(subislands), 3)
+        self.assertEqual(peak_positions(subislands),
+                         [(30, 30), (30, 50), (30, 56)])
+        self.assertTrue(subislands[1].threshold() >
+                        subislands[0].threshold())
+
+    def test_insignificant_source(self):
+        # The fainter source is below the detection threshold, so it stays
+        # part of the brighter one.
+        island = make_island([(20, 20, 50), (20, 30, 4)], 32)
+        self.assertIs(island.deblend(), island)
+
+    def test_many_subthresholds(self):
+        # There is no limit on the number of subthresholds.
+        sources = [(20, 20, 50), (20, 30, 40), (20, 45, 30)]
+        subislands = make_island(sources, 2000).deblend()
+        self.assertEqual(peak_positions(subislands),
+                         peak_positions(make_island(sources, 32).deblend()))
+
+
+class TestPhysicalCoordinates(unittest.TestCase):
+    def setUp(self):
+        self.image = namedtuple("Image", "wcs")(make_wcs())
+        islands = make_island([(20, 20, 50), (20, 30, 40)], 32).deblend()
+        self.measurements = [island.fit()[0] for island in islands]
+        # A position beyond the edge of the projection.
+        outside = copy.deepcopy(self.measurements[0])
+        outside['xbar'] = Uncertain(1e6, 0.1)
+        self.measurements.append(outside)
+
+    def test_batch_matches_single(self):
+        detections = [
+            extract.Detection(measurement, self.image,
+                              physical_coordinates=False)
+            for measurement in self.measurements
+        ]
+        located = extract.calculate_physical_coordinates(detections)
+        self.assertEqual(list(located), [True, True, False])
+        for measurement, batched in zip(self.measurements, detections[:2]):
+            single = extract.Detection(measurement, self.image)
+            for attr in ('ra', 'dec', 'theta_celes', 'theta_dc_celes',
+                         'smaj_asec', 'smin_asec'):
+                self.assertEqual(getattr(batched, attr).value,
+                                 getattr(single, attr).value)
+                self.assertEqual(getattr(batched, attr).error,
+                                 getattr(single, attr).error)
+            self.assertEqual(batched.error_radius, single.error_radius)
+            self.assertEqual(batched.end_smaj_x, single.end_smaj_x)
+        self.assertRaises(RuntimeError, extract.Detection,
+                          self.measurements[2], self.image)
+
+
+class TestBatchErrors(unittest.TestCase):
+    def make_params(self):
+        random = numpy.random.RandomState(5)
+        params = []
+        for index in range(60):
+            param = extract.ParamSet()
+            param.gaussian = index % 3 != 0
+            param.moments = True
+            peak = random.uniform(1, 50)
+            param.update({
+                'peak': peak, 'flux': peak * random.uniform(0.5, 3),
+                'xbar': random.uniform(0, 50), 'ybar': random.uniform(0, 50),
+                'semimajor': random.uniform(0.5, 6),
+                'semiminor': random.uniform(0.5, 6),
+                'theta': random.uniform(-1.6, 1.6)})
+            params.append(param)
+        noise = list(random.uniform(0.1, 2, len(params)))
+        threshold = [3 * value for value in noise]
+        return params, noise, threshold
+
+    def test_batch_matches_single(self):
+        beam = (2.5, 1.5, 0.4)
+        single, noise, threshold = self.make_params()
+        for param, my_noise, my_threshold in zip(single, noise, threshold):
+            param.calculate_errors(my_noise, beam, my_threshold)
+            param.deconvolve_from_clean_beam(beam)
+        batch = self.make_params()[0]
+        extract.calculate_errors_many(batch, noise, beam, threshold)
+        extract.deconvolve_from_clean_beam_many(batch, beam)
+        for single_param, batch_param in zip(single, batch):
+            self.assertEqual(batch_param.deconv_imposs,
+                             single_param.deconv_imposs)
+            for key in single_param.keys():
+                numpy.testing.assert_array_equal(
+                    [batch_param[key].value, batch_param[key].error],
+                    [single_param[key].value, single_param[key].error])
+
+    def test_cannot_deconvolve(self):
+        params = self.make_params()[0][:3]
+        for param in params:
+            param['theta'] = Uncertain(0.5, float('inf'))
+        self.assertRaises(ValueError, extract.deconvolve_from_clean_beam_many,
+                          params, BEAM)
+        self.assertEqual(params[0].deconv_imposs, 2)
+
+
+class TestMomentsOnly(unittest.TestCase):
+    def setUp(self):
+        self.island = make_island([(20, 30, 50)], 32)
+
+    def test_is_compact(self):
+        beams = (self.island.data.count() /
+                 (numpy.pi * BEAM[0] * BEAM[1]))
+        self.assertTrue(self.island.is_compact(beams))
+        self.assertFalse(self.island.is_compact(beams - 0.1))
+        self.assertTrue(self.island.is_compact(beams, 100.))
+        self.assertFalse(self.island.is_compact(beams, 10.))
+
+    def test_moments_only(self):
+        fitted = self.island.fit()[0]
+        self.assertTrue(fitted.gaussian)
+        measured = self.island.fit(moments_only=True)[0]
+        self.assertFalse(measured.gaussian)
+        self.assertTrue(measured.moments)
+        for key in ('peak', 'flux', 'xbar', 'ybar', 'semimajor'):
+            self.assertTrue(numpy.isfinite(measured[key].error))
+            self.assertAlmostEqual(measured[key].value, fitted[key].value,
+                                   delta=0.1 * abs(fitted[key].value))
+
+    def test_fixed(self):
+        fixed = {'semimajor': BEAM[0], 'semiminor': BEAM[1],
+                 'theta': BEAM[2]}
+        measured = self.island.fit(fixed=fixed, moments_only=True)[0]
+        self.assertFalse(measured.gaussian)
+        self.assertEqual(measured['semimajor'].value, BEAM[0])
+        self.assertEqual(measured['theta'].value, BEAM[2])
+
+
+class TestDetachedDetection(unittest.TestCase):
+    def setUp(self):
+        data = numpy.random.RandomState(8).normal(0, 1, (200, 200))
+        data[100, 100] += 50
+        self.image = ImageData(data, BEAM, make_wcs())
+        self.detection = self.image.extract(5, 3)[0]
+
+    def test_pickle(self):
+        pickled = cPickle.dumps(self.detection, 2)
+        # Just the measurement, not the image.
+        self.assertTrue(len(pickled) < 4096)
+        unpickled = cPickle.loads(pickled)
+        self.assertIsNone(unpickled.imagedata)
+        self.assertEqual(unpickled.serialize(10, 10),
+                         self.detection.serialize(10, 10))
+        self.assertEqual(unpickled.chunk, self.detection.chunk)
+        self.assertEqual(unpickled.wcs.p2s((10, 20)),
+                         self.image.wcs.p2s((10, 20)))
+        self.assertIs(unpickled.attach(self.image).imagedata, self.image)
+        self.assertIs(unpickled.wcs, self.image.wcs)
+
+    def test_old_format(self):
+        state = {'imagedata': self.image, 'chunk': (99, 102, 99, 102),
+                 'peak': self.detection.peak, 'x': self.detection.x}
+        detection = extract.Detection.__new__(extract.Detection)
+        self.assertRaises(ValueError, detection.__setstate__, state)
+
+    def test_detach(self):
+        self.assertIs(self.detection.detach(), self.detection)
+        self.assertIsNone(self.detection.imagedata)
+        self.assertIs(self.detection.wcs, self.image.wcs)
+        # The coordinates can still be calculated again.
+        ra = self.detection.ra
+        extract.calculate_physical_coordinates([self.detection])
+        self.assertEqual(self.detection.ra.value, ra.value)
+
+
+class TestPrior(unittest.TestCase):
+    def setUp(self):
+        self.island = make_island([(20, 30, 50)], 32)
+        self.fixed = {'semimajor': BEAM[0], 'semiminor': BEAM[1],
+                      'theta': BEAM[2]}
+
+    def profile(self, prior):
+        return extract.source_profile(
+            self.island.data, self.island.threshold(), self.island.noise(),
+            BEAM, fixed=self.fixed, prior=prior)
+
+    def test_prior(self):
+        cold = self.profile(None)
+        warm = self.profile({'peak': 45.})
+        self.assertTrue(warm.gaussian)
+        self.assertAlmostEqual(warm['peak'].value, cold['peak'].value,
+                               places=4)
+
+    def test_fallback_to_moments(self):
+        # Fitting from this prior fails; fitting from the moments does not.
+        cold = self.profile(None)
+        with numpy.errstate(all='ignore'):
+            warm = self.profile({'peak': float('inf')})
+        self.assertTrue(warm.gaussian)
+        self.assertEqual(warm['peak'].value, cold['peak'].value)
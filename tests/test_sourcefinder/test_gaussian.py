@@ -5,8 +5,9 @@ import numpy
 
 import unittest
 
-from tkp.sourcefinder.gaussian import gaussian
-from tkp.sourcefinder.fitting import moments, fitgaussian, FIT_PARAMS
+from tkp.sourcefinder.gaussian import gaussian, jac_gaussian
+from tkp.sourcefinder.fitting import (moments, moments_many, fitgaussian,
+                                      FIT_PARAMS)
 from tkp.sourcefinder.extract import source_profile_and_errors
 
 
@@ -282,3 +283,74 @@ class NoisyGaussTest(unittest.TestCase):
         self.assertTrue( 0.9 < self.fit_w_errs.chisq / npix < 1.1)
 
 
+
+
+class TestJacobian(unittest.TestCase):
+    """The analytic derivatives used in fitting match finite differences"""
+    def setUp(self):
+        self.params = numpy.array([2.0, 10.3, 11.7, 4.0, 2.5, 0.7])
+        self.Xin, self.Yin = numpy.indices((25, 25), dtype=float)
+
+    def test_finite_differences(self):
+        jacobian = jac_gaussian(*self.params)(self.Xin, self.Yin)
+        for index, param in enumerate(FIT_PARAMS):
+            step = numpy.zeros(len(self.params))
+            step[index] = 1e-6
+            estimate = (
+                gaussian(*(self.params + step))(self.Xin, self.Yin) -
+                gaussian(*(self.params - step))(self.Xin, self.Yin)
+            ) / 2e-6
+            self.assertTrue(numpy.allclose(jacobian[index], estimate,
+                                           atol=1e-8), msg=param)
+
+    def test_fixed_and_masked(self):
+        mygauss = numpy.ma.MaskedArray(
+            gaussian(*self.params)(self.Xin, self.Yin))
+        mygauss[mygauss < 0.1] = numpy.ma.masked
+        fixed = {'semimajor': 4.0, 'theta': 0.7}
+        initial = moments(mygauss, beam, 0.1)
+        fit = fitgaussian(mygauss, initial, fixed=fixed)
+        for index, param in enumerate(FIT_PARAMS):
+            self.assertAlmostEqual(fit[param], self.params[index], places=5)
+
+
+class TestMomentsMany(unittest.TestCase):
+    """Moments of many islands at once match those of each in turn"""
+    def setUp(self):
+        random = numpy.random.RandomState(3)
+        Xin, Yin = numpy.indices((30, 40))
+        self.islands = []
+        self.thresholds = []
+        for height, theta, threshold in ((10, 0.3, 0.5), (-8, 1.2, -0.4),
+                                         (5, -0.7, 0), (3, 2.0, 0.5)):
+            island = numpy.ma.array(
+                gaussian(height, 15, 20, 5, 3, theta)(Xin, Yin) +
+                random.normal(0, 0.1, Xin.shape))
+            if threshold:
+                island[numpy.fabs(island) < numpy.fabs(threshold)] = (
+                    numpy.ma.masked)
+            self.islands.append(island)
+            self.thresholds.append(threshold)
+        # A single pixel, and an island moments() cannot handle.
+        self.islands.append(numpy.ma.array([[0., 2., 0.]]))
+        self.thresholds.append(1.)
+        self.islands.append(numpy.ma.array([[1., -1.], [-1., 1.]]))
+        self.thresholds.append(0.5)
+
+    def test_matches_moments(self):
+        batched = moments_many(self.islands, beam, self.thresholds)
+        self.assertEqual(len(batched), len(self.islands))
+        for island, threshold, result in zip(self.islands, self.thresholds,
+                                             batched):
+            try:
+                expected = moments(island, beam, threshold)
+            except ValueError:
+                self.assertIsNone(result)
+                continue
+            for param in expected:
+                self.assertAlmostEqual(result[param], expected[param],
+                                       places=10, msg=param)
+        self.assertIsNone(batched[-1])
+
+    def test_empty(self):
+        self.assertEqual(moments_many([], beam, []), [])
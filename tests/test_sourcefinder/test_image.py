@@ -3,6 +3,8 @@ import os
 
 import unittest
 
+from scipy import ndimage
+
 from tkp.testutil.decorators import requires_data
 import tkp.sourcefinder
 from tkp.sourcefinder import image as sfimage
@@ -11,7 +13,7 @@ from tkp import accessors
 from tkp.utility.uncertain import Uncertain
 from tkp.testutil.data import DATAPATH
 from tkp.testutil.data import fits_file
-from tkp.testutil.mock import SyntheticImage
+from tkp.testutil.mock import SyntheticImage, make_wcs
 
 BOX_IN_BEAMPIX = 10 #HARDCODING - FIXME! (see also monitoringlist recipe)
 
@@ -44,6 +46,26 @@ class TestNumpySubroutines(unittest.TestCase):
                               list(chunk_3_by_3_round_down.reshape(9))
                               )
 
+    def testInterpolateLinear(self):
+        """
+        Bilinear interpolation on a regular mesh matches map_coordinates().
+        """
+        random = np.random.RandomState(3)
+        grid = random.uniform(0, 5, (7, 4))
+        xcoords = np.linspace(-0.5, 6.7, 50)
+        ycoords = np.linspace(-0.9, 3.5, 33)
+        coords = np.empty((2, len(xcoords), len(ycoords)))
+        coords[0] = xcoords[:, np.newaxis]
+        coords[1] = ycoords[np.newaxis, :]
+        expected = ndimage.map_coordinates(grid, coords, mode='nearest',
+                                           order=1)
+        for block_size in (1, 100, 2**16):
+            interpolated = np.zeros(expected.shape)
+            sfimage._interpolate_linear(grid, xcoords, ycoords, interpolated,
+                                        block_size=block_size)
+            self.assertTrue(np.array_equal(interpolated, expected))
+
+
 class TestMapsType(unittest.TestCase):
     """
     Check that rms, bg maps are of correct type.
@@ -416,3 +438,423 @@ class TestFailureModes(unittest.TestCase):
                         msg = "Data should be flat")
         with self.assertRaises(RuntimeError):
             sfimage.extract(det=5,anl=3)
+
+
+class TestParallelFitting(unittest.TestCase):
+    """
+    Fitting islands concurrently gives the same results, in the same order,
+    as fitting them one after another.
+    """
+    def setUp(self):
+        np.random.seed(42)
+        data = np.random.normal(0, 1, (256, 256))
+        x, y = np.indices(data.shape)
+        for xpos, ypos, peak in ((40, 50, 30), (120, 200, 50), (200, 80, 20),
+                                 (60, 180, 40), (180, 180, 25)):
+            data += peak * np.exp(-np.log(2) * ((x - xpos)**2 +
+                                                (y - ypos)**2) / 2.25)
+        self.data = data
+
+    def extract(self, **kwargs):
+        image = accessors.sourcefinder_image_from_accessor(
+            SyntheticImage(data=self.data), **kwargs)
+        results = image.extract(det=10, anl=3)
+        return image, [result.serialize(0, 0) for result in results]
+
+    def test_parallel_fitting(self):
+        serial_image, serial_results = self.extract()
+        self.assertEqual(len(serial_results), 5)
+        for kwargs in ({'fit_workers': 3}, {'fit_workers': 3,
+                                            'fit_threads': True}):
+            image, results = self.extract(**kwargs)
+            self.assertEqual(results, serial_results)
+            self.assertTrue((image.residuals_from_gauss_fitting ==
+                             serial_image.residuals_from_gauss_fitting).all())
+            self.assertTrue((image.residuals_from_deblending ==
+                             serial_image.residuals_from_deblending).all())
+
+    def test_pool_reused(self):
+        self.extract(fit_workers=2, fit_threads=True)
+        pool = sfimage._fit_pool(2, True)
+        self.extract(fit_workers=2, fit_threads=True)
+        self.assertIs(sfimage._fit_pool(2, True), pool)
+        sfimage.close_fit_pools()
+        self.assertIsNot(sfimage._fit_pool(2, True), pool)
+        sfimage.close_fit_pools()
+
+
+class TestSinglePrecision(unittest.TestCase):
+    """
+    Processing an image in single precision gives (nearly) the same sources
+    as in double precision.
+    """
+    def setUp(self):
+        np.random.seed(42)
+        data = np.random.normal(0, 1, (256, 256))
+        x, y = np.indices(data.shape)
+        for xpos, ypos, peak in ((40, 50, 30), (120, 200, 50), (200, 80, 20)):
+            data += peak * np.exp(-np.log(2) * ((x - xpos)**2 +
+                                                (y - ypos)**2) / 2.25)
+        self.data = data
+
+    def test_single_precision(self):
+        double = accessors.sourcefinder_image_from_accessor(
+            SyntheticImage(data=self.data))
+        single = accessors.sourcefinder_image_from_accessor(
+            SyntheticImage(data=self.data), dtype=np.float32)
+        double_results = double.extract(det=10, anl=3)
+        single_results = single.extract(det=10, anl=3)
+
+        for image_map in (single.rawdata, single.data, single.backmap,
+                          single.rmsmap, single.data_bgsubbed,
+                          single.residuals_from_gauss_fitting,
+                          single.residuals_from_deblending):
+            self.assertEqual(image_map.dtype, np.float32)
+
+        self.assertEqual(len(single_results), len(double_results))
+        for single_result, double_result in zip(single_results,
+                                                double_results):
+            self.assertAlmostEqual(single_result.x.value,
+                                   double_result.x.value, places=3)
+            self.assertAlmostEqual(single_result.y.value,
+                                   double_result.y.value, places=3)
+            self.assertAlmostEqual(single_result.peak.value,
+                                   double_result.peak.value, places=3)
+
+    def test_default_keeps_data(self):
+        # Without a dtype, single precision data is used as it is given,
+        # while the maps are double precision.
+        data = self.data.astype(np.float32)
+        image = ImageData(data, (1.5, 1.5, 0), make_wcs())
+        self.assertIs(image.rawdata, data)
+        self.assertEqual(image.rmsmap.dtype, np.float64)
+        self.assertEqual(len(image.extract(det=10, anl=3)), 3)
+        integers = ImageData(np.zeros((20, 20), dtype=int), (1.5, 1.5, 0),
+                             make_wcs())
+        self.assertEqual(integers.rawdata.dtype, np.float64)
+
+
+class TestUsefulChunk(unittest.TestCase):
+    """
+    The useful chunk is the bounding box of the unmasked data, whether that
+    is bounded by the margin, the radius or bad data.
+    """
+    def test_useful_chunk(self):
+        data = np.random.RandomState(1).normal(0, 1, (100, 120))
+        data[:15] = np.nan
+        data[:, 110:] = np.nan
+        for margin, radius in ((0, 0), (10, 0), (0, 40), (20, 45)):
+            image = ImageData(data, (1.5, 1.5, 0), None, margin=margin,
+                              radius=radius)
+            expected = ndimage.find_objects(
+                np.where(image.data.mask, 0, 1))[0]
+            self.assertEqual(image.useful_chunk, expected)
+            # Images of the same geometry share their margin and radius.
+            other = ImageData(data * 2, (1.5, 1.5, 0), None, margin=margin,
+                              radius=radius)
+            self.assertTrue((other.data.mask == image.data.mask).all())
+
+
+class TestClipBlocks(unittest.TestCase):
+    """
+    The background tiles are sigma clipped a block of grid rows at a time,
+    which does not change the result.
+    """
+    def setUp(self):
+        self.block_pixels = sfimage.CLIP_BLOCK_PIXELS
+
+    def tearDown(self):
+        sfimage.CLIP_BLOCK_PIXELS = self.block_pixels
+
+    def clip(self, data, seed=None):
+        return sfimage._clip_tiles(data, 32, 20, (1.5, 1.5, 0), seed=seed,
+                                   return_state=True)
+
+    def test_blocks(self):
+        data = np.random.RandomState(1).normal(0, 1, (250, 230))
+        data = np.ma.MaskedArray(data, mask=data > 2.5)
+        whole = self.clip(data)
+        seeded = self.clip(data * 1.1, seed=whole[5])
+        # Blocks of one grid row and of three, the last of them partial.
+        for block_pixels in (1, 3 * 32 * 20 * 12):
+            sfimage.CLIP_BLOCK_PIXELS = block_pixels
+            for expected, blocks in ((whole, self.clip(data)),
+                                     (seeded, self.clip(data * 1.1,
+                                                        seed=whole[5]))):
+                self.assertEqual(blocks[0].shape, (8, 12))
+                for value, block_value in zip(expected[:5] + expected[5],
+                                              blocks[:5] + blocks[5]):
+                    np.testing.assert_array_equal(block_value, value)
+
+
+class TestWarmStartedBackground(unittest.TestCase):
+    """
+    The background clipping of an image can be seeded from that of a
+    previous image of the same field.
+    """
+    def make_image(self, seed, **kwargs):
+        data = np.random.RandomState(seed).normal(0, 1, (256, 256))
+        return ImageData(data, (1.5, 1.5, 0), None, back_size_x=32,
+                         back_size_y=32, **kwargs)
+
+    def test_warm_start(self):
+        first = self.make_image(1)
+        first.rmsmap
+        cold = self.make_image(2)
+        warm = self.make_image(2, clip_seed=first.clip_state)
+        self.assertTrue(np.allclose(warm.rmsmap, cold.rmsmap, rtol=0.05))
+        self.assertTrue(np.allclose(warm.backmap, cold.backmap, atol=0.02))
+        self.assertTrue(warm.clip_iterations < cold.clip_iterations)
+
+    def test_different_geometry(self):
+        first = self.make_image(1, margin=10)
+        first.rmsmap
+        cold = self.make_image(2)
+        warm = self.make_image(2, clip_seed=first.clip_state)
+        self.assertTrue((warm.rmsmap == cold.rmsmap).all())
+        self.assertEqual(warm.clip_iterations, cold.clip_iterations)
+
+
+class TestLabelIslands(unittest.TestCase):
+    """
+    Islands are the connected pixels above the analysis threshold which
+    are not masked, and are kept if any pixel reaches the detection
+    threshold.
+    """
+    def setUp(self):
+        random = np.random.RandomState(3)
+        data = random.normal(0, 1, (200, 200))
+        x, y = np.indices(data.shape)
+        for xpos, ypos, peak in ((40, 50, 30), (120, 150, 4.5), (160, 60, 50)):
+            data += peak * np.exp(-np.log(2) * ((x - xpos)**2 +
+                                                (y - ypos)**2) / 2.25)
+        # Mask out the middle of the last source.
+        data[159:162, 59:62] = np.nan
+        self.image = ImageData(data, (1.5, 1.5, 0), None)
+
+    def test_label_islands(self):
+        image = self.image
+        self.assertEqual(image.rms_median, np.ma.median(image.rmsmap))
+        labels, labelled_data = image.label_islands(5 * image.rmsmap,
+                                                    3 * image.rmsmap)
+        self.assertEqual(sorted(set(labelled_data.ravel()) - set([0])),
+                         labels)
+        self.assertFalse(labelled_data[image.data.mask].any())
+        islands = ndimage.find_objects(labelled_data)
+        for label in labels:
+            island = labelled_data[islands[label - 1]] == label
+            self.assertTrue(
+                (image.data_bgsubbed[islands[label - 1]][island] >
+                 3 * image.rmsmap[islands[label - 1]][island]).all())
+        # The faint source is not significant, and masking the peak of the
+        # last leaves only pixels around it.
+        self.assertEqual(labelled_data[120, 150], 0)
+        self.assertNotEqual(labelled_data[40, 50], 0)
+        self.assertNotEqual(labelled_data[158, 60], 0)
+
+    def test_masked_threshold(self):
+        # Pixels where the detection threshold is masked do not count
+        # towards detecting an island.
+        image = self.image
+        detectionthresholdmap = 5 * image.rmsmap
+        detectionthresholdmap[35:45, 45:55] = np.ma.masked
+        labelled_data = image.label_islands(detectionthresholdmap,
+                                            3 * image.rmsmap)[1]
+        self.assertEqual(labelled_data[40, 50], 0)
+        self.assertNotEqual(labelled_data[158, 60], 0)
+
+
+class TestLocalBackground(unittest.TestCase):
+    """
+    Forced fits can estimate the background and RMS about the fitted
+    positions only, rather than over the whole image.
+    """
+    def setUp(self):
+        random = np.random.RandomState(4)
+        data = random.normal(0, 1, (200, 170))
+        x, y = np.indices(data.shape)
+        for xpos, ypos, peak in ((40, 50, 30), (120, 150, 4.5), (160, 60, 50)):
+            data += peak * np.exp(-np.log(2) * ((x - xpos)**2 +
+                                                (y - ypos)**2) / 2.25)
+        data[100:103, 20:40] = np.nan
+        self.data = data
+
+    def make_image(self):
+        return ImageData(self.data, (1.5, 1.5, 0), make_wcs(), margin=5,
+                         back_size_x=24, back_size_y=40)
+
+    def test_local_maps(self):
+        image = self.make_image()
+        for window in ((slice(0, 200), slice(0, 170)),
+                       (slice(90, 110), slice(15, 60)),
+                       (slice(190, 200), slice(160, 170))):
+            data, data_bgsubbed, rmsmap = image._local_maps(window)
+            self.assertTrue((data.mask == image.data.mask[window]).all())
+            self.assertTrue((data_bgsubbed.filled(0) ==
+                             image.data_bgsubbed[window].filled(0)).all())
+            self.assertTrue((rmsmap.filled(0) ==
+                             image.rmsmap[window].filled(0)).all())
+
+    def test_fit_to_point(self):
+        local = self.make_image()
+        whole = self.make_image()
+        for x, y in ((40, 50), (120.3, 150.6), (160.5, 59.2), (101, 30),
+                     (2, 2)):
+            local_fit = local.fit_to_point(x, y, 15, None, 'position+shape',
+                                           local_background=True)
+            whole_fit = whole.fit_to_point(x, y, 15, None, 'position+shape')
+            if whole_fit is None:
+                self.assertIsNone(local_fit)
+                continue
+            self.assertEqual(local_fit.peak.value, whole_fit.peak.value)
+            self.assertEqual(local_fit.peak.error, whole_fit.peak.error)
+            self.assertEqual(local_fit.sig, whole_fit.sig)
+        # The background was never mapped over the whole image.
+        self.assertIsNone(local.clip_iterations)
+
+
+class TestGivenBackgroundGrids(unittest.TestCase):
+    """
+    The background grids of one ImageData can be handed to another of the
+    same image, rather than calculated again.
+    """
+    def make_image(self, **kwargs):
+        data = np.random.RandomState(5).normal(0, 1, (150, 130))
+        data[:, :12] = np.nan
+        return ImageData(data, (1.5, 1.5, 0), make_wcs(), back_size_x=24,
+                         back_size_y=24, **kwargs)
+
+    def test_reuse(self):
+        first = self.make_image()
+        second = self.make_image(background_grids=first.background_grids)
+        self.assertTrue((second.rmsmap == first.rmsmap).all())
+        self.assertTrue((second.backmap == first.backmap).all())
+        self.assertIsNone(second.clip_iterations)
+        # Local maps about a forced fit come from the whole image's grids.
+        window = (slice(140, 150), slice(0, 40))
+        self.assertTrue((second._local_maps(window)[2].filled(0) ==
+                         first.rmsmap[window].filled(0)).all())
+
+    def test_different_region(self):
+        first = self.make_image(margin=10)
+        second = self.make_image(background_grids=first.background_grids)
+        cold = self.make_image()
+        self.assertTrue((second.rmsmap == cold.rmsmap).all())
+        self.assertEqual(second.clip_iterations, cold.clip_iterations)
+
+
+class TestCacheBudget(unittest.TestCase):
+    """
+    Maps of the size of the image are discarded to stay within the cache
+    budget, and calculated again when needed.
+    """
+    def test_budget(self):
+        data = np.random.RandomState(6).normal(0, 1, (128, 128))
+        data[60, 60] += 50
+        unbounded = ImageData(data, (1.5, 1.5, 0), make_wcs())
+        bounded = ImageData(data, (1.5, 1.5, 0), make_wcs(),
+                            cache_budget=data.nbytes * 2)
+        expected = unbounded.extract(5, 3)
+        results = bounded.extract(5, 3)
+        self.assertEqual([r.peak.value for r in results],
+                         [r.peak.value for r in expected])
+        statistics = bounded.memo_cache.statistics()
+        self.assertTrue(statistics['evictions'] > 0)
+        self.assertTrue(bounded.memo_cache.evictable_bytes <= data.nbytes * 2)
+        self.assertEqual(unbounded.memo_cache.statistics()['evictions'], 0)
+        bounded.clearcache()
+        self.assertEqual(bounded.memo_cache.nbytes, 0)
+
+
+class TestLazyResiduals(unittest.TestCase):
+    """
+    The residual maps are only assembled, from cutouts about each island,
+    when asked for.
+    """
+    def setUp(self):
+        data = np.random.RandomState(7).normal(0, 1, (128, 128))
+        x, y = np.indices(data.shape)
+        for xpos, ypos, peak in ((30, 40, 40), (90, 100, 20)):
+            data += peak * np.exp(-np.log(2) * ((x - xpos)**2 +
+                                                (y - ypos)**2) / 2.25)
+        self.data = data
+
+    def test_lazy(self):
+        image = ImageData(self.data, (1.5, 1.5, 0), make_wcs())
+        results = image.extract(5, 3)
+        self.assertEqual(len(results), 2)
+        held = image.memo_cache.nbytes
+        residuals = image.residuals_from_gauss_fitting
+        self.assertEqual(image.memo_cache.nbytes, held + residuals.nbytes)
+        self.assertEqual(residuals.shape, self.data.shape)
+        self.assertFalse(residuals[:20].any())
+        self.assertTrue(residuals[25:35, 35:45].any())
+        # Every island was fitted, so nothing is left over from deblending.
+        self.assertFalse(image.residuals_from_deblending.any())
+
+    def test_no_residuals(self):
+        image = ImageData(self.data, (1.5, 1.5, 0), make_wcs(),
+                          residuals=False)
+        image.extract(5, 3)
+        self.assertFalse(hasattr(image, 'residuals_from_gauss_fitting'))
+        self.assertFalse(hasattr(image, 'residuals_from_deblending'))
+
+
+class TestForcedFitPriors(unittest.TestCase):
+    """
+    Forced fits can start from a previous measurement of the source, given
+    in celestial terms, rather than from moments.
+    """
+    def setUp(self):
+        data = np.random.RandomState(7).normal(0, 0.1, (120, 120))
+        x, y = np.indices(data.shape)
+        # An elongated source, tilted with respect to the axes.
+        u = (x - 60) * np.cos(0.6) + (y - 55) * np.sin(0.6)
+        v = -(x - 60) * np.sin(0.6) + (y - 55) * np.cos(0.6)
+        data += 20 * np.exp(-np.log(2) * (u**2 / 9. + v**2 / 4.))
+        self.image = ImageData(data, (1.5, 1.5, 0), make_wcs())
+        self.detection = self.image.extract(10, 3)[0]
+
+    def prior(self):
+        det = self.detection
+        return {'peak': det.peak.value, 'semimajor': det.smaj_asec.value,
+                'semiminor': det.smin_asec.value,
+                'theta': det.theta_celes.value}
+
+    def test_pixel_priors(self):
+        det = self.detection
+        positions = [(det.ra.value, det.dec.value), (det.ra.value, 0.)]
+        pixel_x, pixel_y = self.image.wcs.s2p_many(positions)
+        pixel_priors = self.image._pixel_priors(
+            positions, pixel_x, pixel_y, [self.prior(), None])
+        self.assertIsNone(pixel_priors[1])
+        prior = pixel_priors[0]
+        self.assertEqual(prior['peak'], det.peak.value)
+        self.assertAlmostEqual(prior['semimajor'], det.smaj.value, places=2)
+        self.assertAlmostEqual(prior['semiminor'], det.smin.value, places=2)
+        self.assertAlmostEqual(np.cos(2 * (prior['theta'] - det.theta.value)),
+                               1., places=5)
+        # Nothing is converted for parameters held fixed.
+        held = self.image._pixel_priors(
+            positions, pixel_x, pixel_y, [self.prior(), {'theta': 10.}],
+            ('semimajor', 'semiminor', 'theta'))
+        self.assertEqual(held, [{'peak': det.peak.value}, None])
+
+    def test_fit_fixed_positions(self):
+        det = self.detection
+        positions = [(det.ra.value, det.dec.value)]
+        cold = self.image.fit_fixed_positions(positions, 15, fixed='position')
+        unchanged = self.image.fit_fixed_positions(
+            positions, 15, fixed='position', priors=[None])
+        warm = self.image.fit_fixed_positions(
+            positions, 15, fixed='position', priors=[self.prior()])
+        self.assertEqual(unchanged[0].peak.value, cold[0].peak.value)
+        for attr in ('peak', 'smaj', 'smin'):
+            self.assertAlmostEqual(getattr(warm[0], attr).value,
+                                   getattr(cold[0], attr).value, places=4)
+        # Only the peak is fitted if the shape is held fixed too.
+        warm = self.image.fit_fixed_positions(positions, 15,
+                                              priors=[{'peak': 1.}])
+        cold = self.image.fit_fixed_positions(positions, 15)
+        self.assertAlmostEqual(warm[0].peak.value, cold[0].peak.value,
+                               places=4)
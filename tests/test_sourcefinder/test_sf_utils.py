@@ -6,9 +6,13 @@ from tkp.utility.uncertain import Uncertain
 import unittest
 
 from tkp.sourcefinder.utils import maximum_pixel_method_variance, fudge_max_pix
+from tkp.sourcefinder.utils import max_pix_corrections, MaxPixGrid, set_max_pix_grid
 from tkp.sourcefinder.utils import generate_result_maps
 from tkp.sourcefinder.utils import circular_mask
+from tkp.sourcefinder.utils import bounding_box, geometry_mask
 from tkp.sourcefinder.utils import generate_subthresholds
+from tkp.sourcefinder.utils import get_error_radius, get_error_radii
+from tkp.testutil.mock import make_wcs
 
 
 class TestCircularMask(unittest.TestCase):
@@ -27,6 +31,36 @@ class TestCircularMask(unittest.TestCase):
             assert_array_equal(circular_mask(*parameters), result)
 
 
+class TestGeometryMask(unittest.TestCase):
+    def test_geometry(self):
+        mask, chunk = geometry_mask(20, 30, 2, 9)
+        expected = numpy.ones((20, 30), dtype=bool)
+        expected[2:-2, 2:-2] = False
+        expected |= circular_mask(20, 30, 9)
+        assert_array_equal(mask, expected)
+        self.assertEqual(chunk, (slice(2, 18), slice(6, 24)))
+        self.assertRaises(ValueError, mask.__setitem__, (0, 0), False)
+
+    def test_shared(self):
+        geometry_mask.clear()
+        first = geometry_mask(20, 30, 2, 9)
+        self.assertIs(geometry_mask(20, 30, 2, 9), first)
+        self.assertIsNot(geometry_mask(20, 30, 2, 0), first)
+        self.assertEqual(geometry_mask.cache.hits, 1)
+
+    def test_no_geometry(self):
+        mask, chunk = geometry_mask(5, 6, 0, 0)
+        self.assertFalse(mask.any())
+        self.assertEqual(chunk, (slice(0, 5), slice(0, 6)))
+        self.assertEqual(geometry_mask(5, 6, 3, 0)[1], None)
+
+    def test_bounding_box(self):
+        unmasked = numpy.zeros((10, 10), dtype=bool)
+        self.assertEqual(bounding_box(unmasked), None)
+        unmasked[3, 7] = unmasked[5, 2] = True
+        self.assertEqual(bounding_box(unmasked), (slice(3, 6), slice(2, 8)))
+
+
 class TestResultMaps(unittest.TestCase):
     def testPositions(self):
         # The pixel position x, y of the source should be the same as the
@@ -66,6 +100,48 @@ class UtilsTest(unittest.TestCase):
         for (semimajor, semiminor, theta, correction, variance) in self.correct_data:
             self.assertAlmostEqual(fudge_max_pix(semimajor, semiminor, theta), correction)
 
+    def testCorrectionsCached(self):
+        max_pix_corrections.clear()
+        semimajor, semiminor, theta = self.correct_data[0][:3]
+        fudge_max_pix(semimajor, semiminor, theta)
+        maximum_pixel_method_variance(semimajor, semiminor, theta)
+        self.assertEqual(max_pix_corrections.cache.misses, 1)
+        self.assertEqual(max_pix_corrections.cache.hits, 1)
+
+    def testInterpolationGrid(self):
+        grid = MaxPixGrid(numpy.linspace(1.4, 1.6, 5),
+                          numpy.linspace(1.2, 1.4, 5))
+        self.assertEqual(grid(3.0, 1.3, 0.), None)
+        set_max_pix_grid(grid)
+        try:
+            for (semimajor, semiminor, theta, correction, variance) in self.correct_data:
+                self.assertAlmostEqual(fudge_max_pix(semimajor, semiminor, theta),
+                                       correction, places=4)
+                self.assertAlmostEqual(
+                    maximum_pixel_method_variance(semimajor, semiminor, theta),
+                    variance, places=5)
+                # Swapping the axes is equivalent to a rotation by 90 degrees.
+                numpy.testing.assert_allclose(
+                    grid(semimajor, semiminor, theta),
+                    grid(semiminor, semimajor, theta + numpy.pi / 2))
+        finally:
+            set_max_pix_grid(None)
+
+
+class TestErrorRadii(unittest.TestCase):
+    def test_matches_error_radius(self):
+        wcs = make_wcs()
+        x = numpy.array([10., 256., 500., 1e6])
+        y = numpy.array([20., 256., 3., 1e6])
+        x_error = numpy.array([0.1, 2., 0.5, 0.1])
+        y_error = numpy.array([0.3, 1., 0., 0.1])
+        radii = get_error_radii(wcs, x, x_error, y, y_error)
+        for i in range(len(x)):
+            self.assertAlmostEqual(
+                radii[i], get_error_radius(wcs, x[i], x_error[i], y[i],
+                                           y_error[i]), places=10)
+        self.assertEqual(radii[-1], float('inf'))
+
 
 class SubthresholdingTest(unittest.TestCase):
     def test_ranges(self):
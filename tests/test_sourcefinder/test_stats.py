@@ -0,0 +1,149 @@
+import unittest
+
+import numpy
+
+from tkp.sourcefinder.stats import (clip_about_median, fdr_threshold,
+                                    sigma_clip, sigma_clip_tiles)
+
+BEAM = (1.5, 1.2, 0.3)
+
+
+class TestSigmaClipTiles(unittest.TestCase):
+    def setUp(self):
+        numpy.random.seed(1234)
+        data = numpy.random.normal(1.0, 2.0, (50, 32 * 32))
+        # Bright "sources" in some of the tiles.
+        data[::3, :20] += numpy.random.uniform(20, 100, (17, 20))
+        self.tiles = numpy.ma.MaskedArray(data, mask=numpy.zeros(data.shape))
+        self.tiles[5, 100:] = numpy.ma.masked
+        self.tiles[7] = numpy.ma.masked
+        self.tiles[9, :] = 0
+
+    def test_matches_sigma_clip(self):
+        std, median, mean, iterations, valid = sigma_clip_tiles(
+            self.tiles, BEAM)
+        for tile in xrange(len(self.tiles)):
+            if not self.tiles[tile].any():
+                self.assertFalse(valid[tile])
+                continue
+            clipped, my_std, my_median, my_its = sigma_clip(
+                self.tiles[tile], BEAM)
+            if len(clipped) == 0 or not clipped.any():
+                self.assertFalse(valid[tile])
+                continue
+            self.assertTrue(valid[tile])
+            self.assertEqual(iterations[tile], my_its)
+            self.assertEqual(median[tile], my_median)
+            self.assertAlmostEqual(std[tile], my_std, places=10)
+            self.assertAlmostEqual(mean[tile], numpy.mean(clipped), places=10)
+
+    def test_too_few_pixels(self):
+        # Fewer pixels than a single correlated area: nothing usable.
+        tiles = numpy.ma.MaskedArray(numpy.ones((2, 4)))
+        valid = sigma_clip_tiles(tiles, (5., 5., 0.))[-1]
+        self.assertFalse(valid.any())
+
+    def test_warm_start(self):
+        cold = sigma_clip_tiles(self.tiles, BEAM, return_state=True)
+        valid, state = cold[4:]
+
+        # Warm started tiles may settle on a different set of pixels than
+        # they would from scratch, so their statistics differ by up to a
+        # few per cent, but take fewer iterations to get there.
+        for tiles in (self.tiles, self.noisier_tiles()):
+            cold = sigma_clip_tiles(tiles, BEAM)
+            warm = sigma_clip_tiles(tiles, BEAM, seed=state)
+            self.assertTrue(warm[3].sum() < cold[3].sum())
+            numpy.testing.assert_array_equal(warm[4], valid)
+            numpy.testing.assert_allclose(warm[0][valid], cold[0][valid],
+                                          rtol=0.03)
+            numpy.testing.assert_allclose(warm[1][valid], cold[1][valid],
+                                          atol=0.05)
+            numpy.testing.assert_allclose(warm[2][valid], cold[2][valid],
+                                          atol=0.05)
+
+    def noisier_tiles(self):
+        # A different realisation of the same noise.
+        numpy.random.seed(4321)
+        tiles = self.tiles + numpy.random.normal(0., 0.2, self.tiles.shape)
+        tiles[9, :] = 0
+        return tiles
+
+    def test_unusable_seed(self):
+        # Tiles seeded with NaN, or with limits no pixel falls within, are
+        # clipped from scratch.
+        cold = sigma_clip_tiles(self.tiles, BEAM)
+        ntiles = len(self.tiles)
+        seed = (numpy.where(numpy.arange(ntiles) % 2, numpy.nan, 1e6),
+                numpy.ones(ntiles))
+        warm = sigma_clip_tiles(self.tiles, BEAM, seed=seed)
+        for cold_value, warm_value in zip(cold, warm):
+            numpy.testing.assert_array_equal(warm_value, cold_value)
+
+
+class TestClipAboutMedian(unittest.TestCase):
+    def test_clip(self):
+        data = numpy.ones((10, 10))
+        data[3, 4] = 5.
+        data[6, 7] = numpy.nan
+        data = numpy.ma.MaskedArray(data, mask=numpy.isnan(data))
+        limit = lambda N, variance: 3 * numpy.sqrt(variance)
+        clipped, centre, iterations = clip_about_median(data, limit)
+        numpy.testing.assert_array_equal(clipped, numpy.ones(98))
+        self.assertEqual(centre, 1.)
+        self.assertEqual(iterations, 1)
+
+    def test_many_iterations(self):
+        # Each iteration leaves out the largest value only, many more times
+        # than recursion would allow for.
+        data = numpy.arange(5000.)**2
+
+        def limit(N, variance):
+            median = 0.5 * (((N - 1) // 2)**2 + (N // 2)**2)
+            return max((N - 1)**2 - median - 0.5, 0.5)
+
+        clipped, centre, iterations = clip_about_median(data, limit)
+        self.assertEqual(iterations, 4998)
+        numpy.testing.assert_array_equal(clipped, [0., 1.])
+        self.assertEqual(centre, 0.5)
+
+        clipped, centre, iterations = clip_about_median(data, limit,
+                                                        max_iter=100)
+        self.assertEqual(iterations, 100)
+        numpy.testing.assert_array_equal(clipped, data[:4900])
+
+    def test_too_few(self):
+        self.assertEqual(clip_about_median(numpy.ones(10),
+                                           lambda N, variance: None), None)
+        clipped, std, centre, iterations = sigma_clip(numpy.ones(2),
+                                                      (5., 5., 0.))
+        self.assertEqual(len(clipped), 0)
+        self.assertEqual((std, centre, iterations), (0, 0, 0))
+
+
+class TestFdrThreshold(unittest.TestCase):
+    def sorted_threshold(self, prob, alpha, num_tests):
+        # The last undercrossing of the sorted probabilities.
+        prob = numpy.sort(prob)
+        compare = alpha * numpy.arange(1, len(prob) + 1) / float(num_tests)
+        below = numpy.flatnonzero(prob - compare < 0)
+        if len(below):
+            return prob[below[-1]]
+        return None
+
+    def test_matches_sort(self):
+        random = numpy.random.RandomState(2)
+        for size in (1, 10, 1000, 5000):
+            normalized = random.normal(0, 1, size)
+            normalized[:size // 100] += random.uniform(3, 10, size // 100)
+            for rounded in (normalized, numpy.round(normalized, 1)):
+                prob = numpy.exp(-0.5 * rounded**2) / numpy.sqrt(2 * numpy.pi)
+                for alpha in (1e-3, 0.01, 0.1, 0.9):
+                    for num_tests in (size, 2 * size):
+                        self.assertEqual(
+                            fdr_threshold(prob, alpha, num_tests),
+                            self.sorted_threshold(prob, alpha, num_tests))
+
+    def test_no_undercrossing(self):
+        self.assertEqual(fdr_threshold(numpy.ones(100), 0.01), None)
+        self.assertEqual(fdr_threshold(numpy.array([]), 0.01), None)
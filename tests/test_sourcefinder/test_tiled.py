@@ -0,0 +1,98 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from tkp.sourcefinder.image import ImageData
+from tkp.sourcefinder.tiled import TiledImageData, _kth_value
+from tkp.testutil.mock import make_wcs
+
+BEAM = (1.5, 1.5, 0.)
+
+
+def make_data(seed, shape=(200, 170), nsources=40):
+    """Gaussian noise with point sources scattered across it, and a strip of
+    NaNs"""
+    random = numpy.random.RandomState(seed)
+    x, y = numpy.indices(shape, dtype=float)
+    data = random.normal(0., 1., shape)
+    for i in range(nsources):
+        xpos = random.uniform(0, shape[0])
+        ypos = random.uniform(0, shape[1])
+        peak = random.uniform(3., 100.)
+        data += peak * numpy.exp(-numpy.log(2) * ((x - xpos)**2 +
+                                                  (y - ypos)**2) / 4.)
+    data[50:53, 70:90] = numpy.nan
+    return data
+
+
+def measurements(results):
+    return [(det.x.value, det.y.value, det.peak.value, det.peak.error,
+             det.flux.value, det.smaj.value, det.smin.value,
+             det.theta.value, det.ra.value, det.dec.value)
+            for det in results]
+
+
+class TestTiledImageData(unittest.TestCase):
+    def assertSameResults(self, data, tile_size, deblend_nthresh=0, **kwargs):
+        whole = ImageData(data, BEAM, make_wcs(), **kwargs).extract(
+            5., 3., deblend_nthresh=deblend_nthresh)
+        tiled = TiledImageData(data, BEAM, make_wcs(), tile_size=tile_size,
+                               **kwargs).extract(
+            5., 3., deblend_nthresh=deblend_nthresh)
+        self.assertTrue(len(whole) > 10)
+        self.assertEqual(measurements(tiled), measurements(whole))
+
+    def test_matches_image_data(self):
+        data = make_data(1)
+        for tile_size in (16, 45, 64, 1000):
+            self.assertSameResults(data, tile_size)
+
+    def test_margin_and_radius(self):
+        self.assertSameResults(make_data(2), 37, margin=10, radius=90,
+                               back_size_x=20, back_size_y=28)
+
+    def test_deblending(self):
+        self.assertSameResults(make_data(3), 50, deblend_nthresh=32)
+
+    def test_single_precision(self):
+        self.assertSameResults(make_data(4), 40, dtype=numpy.float32)
+
+    def test_moments_only(self):
+        self.assertSameResults(make_data(6), 50, moments_max_beams=4.,
+                               moments_max_sig=30.)
+
+    def test_memmap(self):
+        data = make_data(5)
+        temp_dir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(temp_dir, "image.npy")
+            numpy.save(filename, data.astype(">f4"))
+            mapped = numpy.load(filename, mmap_mode="r")
+            whole = ImageData(mapped.astype(numpy.float32), BEAM, make_wcs(),
+                              dtype=numpy.float32).extract(5., 3.)
+            tiled = TiledImageData(mapped, BEAM, make_wcs(), tile_size=64,
+                                   dtype=numpy.float32).extract(5., 3.)
+            self.assertEqual(measurements(tiled), measurements(whole))
+            del mapped
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_flat(self):
+        tiled = TiledImageData(numpy.ones((100, 100)), BEAM, make_wcs(),
+                               tile_size=32)
+        self.assertRaises(RuntimeError, tiled.extract, 5., 3.)
+
+
+class TestKthValue(unittest.TestCase):
+    def test_kth_value(self):
+        random = numpy.random.RandomState(1)
+        values = [random.normal(0, 1, 1000).astype(numpy.float32),
+                  numpy.ones(5000, dtype=numpy.float32),
+                  random.uniform(0.9999, 1.0001, 1000)]
+        ordered = numpy.sort(numpy.concatenate(values))
+        for k in (0, 1, 2000, 3500, 6000, len(ordered) - 1):
+            self.assertEqual(_kth_value(lambda: iter(values), k, 100),
+                             ordered[k])
@@ -0,0 +1,22 @@
+import unittest
+from ConfigParser import SafeConfigParser
+from tkp.steps.misc import check_fit_workers
+from tkp.testutil.data import default_job_config
+from tkp.config import parse_to_dict
+
+
+class TestCheckFitWorkers(unittest.TestCase):
+    def setUp(self):
+        config = SafeConfigParser()
+        config.read(default_job_config)
+        self.extraction_params = parse_to_dict(config)['source_extraction']
+
+    def test_default(self):
+        for distributor in ('serial', 'multiproc'):
+            check_fit_workers(self.extraction_params, distributor)
+
+    def test_fit_workers(self):
+        self.extraction_params['fit_workers'] = 4
+        check_fit_workers(self.extraction_params, 'serial')
+        with self.assertRaises(ValueError):
+            check_fit_workers(self.extraction_params, 'multiproc')
@@ -61,3 +61,22 @@ class TestSourceExtraction(unittest.TestCase):
         self.assertIn('anl', mock_method.returnvalue.callvalues[0][1])
         self.assertIn('force_beam', mock_method.returnvalue.callvalues[0][1])
         self.assertIn('deblend_nthresh', mock_method.returnvalue.callvalues[0][1])
+
+
+class TestBackgroundCache(unittest.TestCase):
+    def test_cache(self):
+        cache = tkp.steps.source_extraction.BackgroundCache(maxsize=2)
+        self.assertEqual(cache.get('a'), None)
+        cache.put('a', 'state a', 10, False)
+        cache.put('b', 'state b', 3, True)
+        self.assertEqual(cache.get('a'), 'state a')
+        # 'b' is now the least recently used.
+        cache.put('c', 'state c', 2, True)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('c'), 'state c')
+        self.assertEqual(cache.statistics(),
+                         {'hits': 2, 'misses': 2, 'warm_iterations': 5,
+                          'cold_iterations': 10})
+        cache.clear()
+        self.assertEqual(cache.get('a'), None)
+        self.assertEqual(cache.statistics()['hits'], 0)
@@ -0,0 +1,56 @@
+import pickle
+import unittest
+
+import numpy
+
+from tkp.utility.containers import ExtractionResults, SERIALIZED_DTYPE
+from tkp.utility.containers import serialized_array, serialize_detections
+
+
+class MockDetection(object):
+    def __init__(self, values):
+        self.values = values
+
+    def serialize(self, ew_sys_err, ns_sys_err):
+        values = list(self.values)
+        values[12:14] = [ew_sys_err, ns_sys_err]
+        return values
+
+
+def make_row(i):
+    row = [float(i * 100 + field) for field in range(18)]
+    row[15] = bool(i % 2)
+    return row
+
+
+class TestSerializedDetections(unittest.TestCase):
+    def setUp(self):
+        self.rows = [make_row(i) for i in range(5)]
+        self.detections = ExtractionResults(
+            MockDetection(row) for row in self.rows)
+
+    def test_serialize(self):
+        serialized = self.detections.serialize(20., 30.)
+        self.assertEqual(serialized.dtype, SERIALIZED_DTYPE)
+        self.assertEqual(len(serialized), len(self.rows))
+        for row, record in zip(self.rows, serialized):
+            row[12:14] = [20., 30.]
+            self.assertEqual(tuple(row), record.tolist())
+        self.assertEqual(list(serialized['fit_type']),
+                         [False, True, False, True, False])
+
+    def test_plain_list(self):
+        serialized = serialize_detections(list(self.detections), 20., 30.)
+        numpy.testing.assert_array_equal(
+            serialized, self.detections.serialize(20., 30.))
+        self.assertEqual(len(serialize_detections([], 20., 30.)), 0)
+
+    def test_serialized_array(self):
+        serialized = serialized_array(self.rows)
+        self.assertIs(serialized_array(serialized), serialized)
+        self.assertEqual(serialized['f_int_err'][2], 207.)
+
+    def test_pickle(self):
+        serialized = self.detections.serialize(20., 30.)
+        numpy.testing.assert_array_equal(
+            pickle.loads(pickle.dumps(serialized, -1)), serialized)
@@ -8,6 +8,7 @@ import unittest
 from casacore.measures import measures
 
 import datetime
+import numpy
 from tkp.utility import coordinates
 
 
@@ -286,6 +287,35 @@ class angsepTest(unittest.TestCase):
         ra2 = 33.655860050872931310550484340638
         dec2 = 87.061899872535235545001341961324
         coordinates.angsep(ra1, dec1, ra2, dec2)
+        self.assertFalse(numpy.isnan(
+            coordinates.angsep_many([ra1], [dec1], [ra2], [dec2])[0]))
+
+    def testManySeparations(self):
+        ra1, dec1 = [0., 10., 350., 123.4], [0., -30., 89., 12.]
+        ra2, dec2 = [0., 11., 10., 200.1], [0., -31., 88., -40.]
+        separations = coordinates.angsep_many(ra1, dec1, ra2, dec2)
+        for i in range(len(ra1)):
+            self.assertAlmostEqual(
+                separations[i],
+                coordinates.angsep(ra1[i], dec1[i], ra2[i], dec2[i]), 6)
+
+
+class ManyPositionsTest(unittest.TestCase):
+    ra = [0., 10., 350., 123.4, 200.]
+    dec = [0., -30., 89.95, 12., -89.]
+
+    def testAlphaInflate(self):
+        theta = [20. / 3600, 0.1, 1., 0.01, 1.5]
+        alphas = coordinates.alpha_inflate_many(theta, self.dec)
+        for i in range(len(theta)):
+            self.assertAlmostEqual(
+                alphas[i], coordinates.alpha_inflate(theta[i], self.dec[i]))
+
+    def testEqToCart(self):
+        cart = numpy.transpose(coordinates.eq_to_cart_many(self.ra, self.dec))
+        for i in range(len(self.ra)):
+            numpy.testing.assert_allclose(
+                cart[i], coordinates.eq_to_cart(self.ra[i], self.dec[i]))
 
 
 class altazTest(unittest.TestCase):
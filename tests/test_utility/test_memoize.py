@@ -0,0 +1,76 @@
+import pickle
+import unittest
+
+import numpy
+
+from tkp.utility.memoize import CachedMemoize, MemoCache
+
+
+class Maps(object):
+    def __init__(self, budget=None):
+        self.memo_cache = MemoCache(budget)
+        self.calls = []
+
+    @CachedMemoize(evictable=True)
+    def _big(self):
+        self.calls.append('big')
+        return numpy.zeros(100)
+    big = property(fget=_big, fdel=_big.delete)
+
+    @CachedMemoize(evictable=True)
+    def _masked(self):
+        self.calls.append('masked')
+        return numpy.ma.array(numpy.zeros(100), mask=numpy.zeros(100, bool))
+    masked = property(fget=_masked, fdel=_masked.delete)
+
+    @CachedMemoize()
+    def _small(self):
+        self.calls.append('small')
+        return {'a': numpy.zeros(10), 'b': (numpy.zeros(5), 1)}
+    small = property(fget=_small, fdel=_small.delete)
+
+
+class TestCachedMemoize(unittest.TestCase):
+    def test_unbounded(self):
+        maps = Maps()
+        for i in range(2):
+            maps.big, maps.masked, maps.small
+        self.assertEqual(maps.calls, ['big', 'masked', 'small'])
+        self.assertEqual(maps.memo_cache.statistics()['bytes'],
+                         800 + 900 + 120)
+        self.assertEqual(maps.memo_cache.hits, 3)
+        self.assertEqual(maps.memo_cache.misses, 3)
+        del maps.big
+        maps.big
+        self.assertEqual(maps.calls[-1], 'big')
+
+    def test_per_instance(self):
+        first, second = Maps(), Maps()
+        first.big
+        second.big
+        self.assertEqual(first.calls, ['big'])
+        self.assertEqual(second.calls, ['big'])
+
+    def test_budget(self):
+        maps = Maps(budget=1000)
+        maps.small
+        maps.big
+        maps.masked
+        # The least recently used evictable value made way for the latest.
+        self.assertEqual(maps.memo_cache.evictions, 1)
+        self.assertEqual(maps.memo_cache.evictable_bytes, 900)
+        maps.small
+        maps.masked
+        self.assertEqual(maps.calls, ['small', 'big', 'masked'])
+        maps.big
+        self.assertEqual(maps.calls[-1], 'big')
+        self.assertEqual(maps.memo_cache.evictions, 2)
+
+    def test_pickle(self):
+        maps = Maps(budget=1000)
+        maps.big
+        unpickled = pickle.loads(pickle.dumps(maps))
+        self.assertEqual(unpickled.memo_cache.budget, 1000)
+        self.assertEqual(unpickled.memo_cache.nbytes, 0)
+        unpickled.big
+        self.assertEqual(unpickled.calls, ['big', 'big'])
@@ -1,5 +1,8 @@
 import unittest
-from tkp.utility.uncertain import Uncertain
+
+import numpy
+
+from tkp.utility.uncertain import Uncertain, UncertainArray
 
 class UncertainTestCase(unittest.TestCase):
     def test_castable_to_floating_point(self):
@@ -10,3 +13,44 @@ class UncertainTestCase(unittest.TestCase):
         self.assertFalse(isinstance(x.value, float))
         self.assertFalse(isinstance(x.error, float))
         float(x)
+
+
+class UncertainArrayTestCase(unittest.TestCase):
+    def setUp(self):
+        random = numpy.random.RandomState(7)
+        self.a = UncertainArray(random.uniform(0.5, 5, 20),
+                                random.uniform(0, 0.5, 20))
+        self.b = UncertainArray(random.uniform(0.5, 5, 20),
+                                random.uniform(0, 0.5, 20))
+
+    def assertElementwise(self, result, expected):
+        self.assertEqual(len(result), len(expected))
+        for element, single in zip(result, expected):
+            self.assertEqual(element.value, single.value)
+            self.assertEqual(element.error, single.error)
+
+    def test_matches_uncertain(self):
+        a, b = self.a, self.b
+        operations = [
+            lambda x, y: x + y, lambda x, y: x - y, lambda x, y: x * y,
+            lambda x, y: x / y, lambda x, y: x**y, lambda x, y: x + 2.,
+            lambda x, y: 3. - x, lambda x, y: x * 1.5, lambda x, y: 2. / x,
+            lambda x, y: x**2, lambda x, y: x**0.5, lambda x, y: 2.**x,
+            lambda x, y: -abs(x), lambda x, y: x.log(), lambda x, y: x.exp(),
+        ]
+        for operation in operations:
+            self.assertElementwise(
+                operation(a, b),
+                [operation(x, y) for x, y in zip(a, b)])
+        # An Uncertain operand applies to each element.
+        self.assertElementwise(a * b[3], [x * b[3] for x in a])
+
+    def test_indexing(self):
+        self.assertIsInstance(self.a[2], Uncertain)
+        self.assertEqual(self.a[2].value, self.a.value[2])
+        self.assertIsInstance(self.a[2:5], UncertainArray)
+        self.assertElementwise(
+            UncertainArray.from_uncertains(self.a[[1, 4]]),
+            [self.a[1], self.a[4]])
+        numpy.testing.assert_array_equal(self.a.max(),
+                                         self.a.value + self.a.error)
@@ -1,5 +1,7 @@
+import cPickle
 import unittest
 
+import numpy
 from tkp.utility import coordinates
 from tkp.sourcefinder import extract
 from tkp.utility.uncertain import Uncertain
@@ -109,6 +111,21 @@ class wcsSin(unittest.TestCase):
             result = map(round, self.wcs.s2p(spatial))
             self.assertEqual(result, pixel)
 
+    def testManyPositions(self):
+        pixels = [pixel for pixel, spatial in self.known_values]
+        ra, dec = self.wcs.p2s_many(pixels)
+        x, y = self.wcs.s2p_many(numpy.column_stack((ra, dec)))
+        for i, pixel in enumerate(pixels):
+            self.assertEqual((ra[i], dec[i]), self.wcs.p2s(pixel))
+            self.assertEqual((x[i], y[i]), self.wcs.s2p((ra[i], dec[i])))
+
+    def testManyInvalidPositions(self):
+        # p2s() raises for positions beyond the edge of the projection.
+        self.assertRaises(RuntimeError, self.wcs.p2s, [1e6, 1e6])
+        ra, dec = self.wcs.p2s_many([[1442.0, 1442.0], [1e6, 1e6]])
+        self.assertFalse(numpy.isnan(ra[0]) or numpy.isnan(dec[0]))
+        self.assertTrue(numpy.isnan(ra[1]) and numpy.isnan(dec[1]))
+
     def testSanity(self):
         import random
         pixel = [random.randrange(500, 1500), random.randrange(500, 1500)]
@@ -116,5 +133,35 @@ class wcsSin(unittest.TestCase):
         self.assertEqual(result, pixel)
 
 
+
+class TestPickle(unittest.TestCase):
+    def test_pickle(self):
+        wcs = coordinates.WCS()
+        wcs.ctype = ('RA---SIN', 'DEC--SIN')
+        wcs.crval = (15.0, 90.0)
+        wcs.cdelt = (-0.01111111111111, 0.01111111111111)
+        wcs.crpix = (1025.0, 1025.0)
+        wcs.crota = (0.0, 0.0)
+        wcs.cunit = ("deg", "deg")
+        unpickled = cPickle.loads(cPickle.dumps(wcs, 2))
+        self.assertEqual(list(unpickled.crval), list(wcs.crval))
+        self.assertEqual(list(unpickled.ctype), list(wcs.ctype))
+        pixels = [[908, 715], [12.5, 2000.25]]
+        for before, after in zip(wcs.p2s_many(pixels),
+                                 unpickled.p2s_many(pixels)):
+            self.assertEqual(list(after), list(before))
+
+    def test_pickle_unset(self):
+        # crota has no default until it is set.
+        wcs = coordinates.WCS()
+        wcs.crval = (15.0, 45.0)
+        wcs.cdelt = (-0.01, 0.01)
+        self.assertRaises(AttributeError, getattr, wcs, "crota")
+        unpickled = cPickle.loads(cPickle.dumps(wcs, 2))
+        self.assertRaises(AttributeError, getattr, unpickled, "crota")
+        self.assertEqual(list(unpickled.cdelt), list(wcs.cdelt))
+        self.assertEqual(unpickled.p2s([10, 20]), wcs.p2s([10, 20]))
+
+
 if __name__ == '__main__':
     unittest.main()
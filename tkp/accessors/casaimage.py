@@ -19,15 +19,18 @@ class CasaImage(DataAccessor):
     no clear standard for these metadata, so cannot be
     instantiated directly - subclass it and extract these attributes
     as appropriate to a given telescope.
+
+    The image data keeps the precision in which it is stored, unless a
+    ``dtype`` is given.
     """
-    def __init__(self, url, plane=0, beam=None):
+    def __init__(self, url, plane=0, beam=None, dtype=None):
         super(CasaImage, self).__init__()
         self.url = url
 
         # we don't want the table as a property since it makes the accessor
         # not serializable
         table = casacore_table(self.url.encode(), ack=False)
-        self.data = self.parse_data(table, plane)
+        self.data = self.parse_data(table, plane, dtype)
         self.wcs = self.parse_coordinates(table)
         self.centre_ra, self.centre_decl = self.parse_phase_centre(table)
         self.freq_eff, self.freq_bw = self.parse_frequency(table)
@@ -40,7 +43,7 @@ class CasaImage(DataAccessor):
         self.beam = self.degrees2pixels(
             bmaj, bmin, bpa, self.pixelsize[0], self.pixelsize[1])
 
-    def parse_data(self, table, plane=0):
+    def parse_data(self, table, plane=0, dtype=None):
         """extract and massage data from CASA table"""
         data = table[0]['map'].squeeze()
         planes = len(data.shape)
@@ -50,6 +53,8 @@ class CasaImage(DataAccessor):
             warnings.warn(msg)
             data = data[plane, :, :]
         data = data.transpose()
+        if dtype is not None:
+            data = data.astype(dtype)
         return data
 
     def parse_coordinates(self, table):
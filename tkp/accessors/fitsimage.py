@@ -20,13 +20,20 @@ class FitsImage(DataAccessor):
     Provide standard attributes, as per :class:`DataAccessor`. In addition, we
     provide a ``telescope`` attribute if the FITS file has a ``TELESCOP``
     header.
+
+    The image data is read as double precision floating point, unless
+    another ``dtype`` (such as ``numpy.float32``) is given. If ``memmap`` is
+    set, the data is instead memory mapped from the file as stored, and
+    only read when it is accessed; see
+    :class:`tkp.sourcefinder.tiled.TiledImageData`.
     """
-    def __init__(self, url, plane=None, beam=None, hdu_index=0):
+    def __init__(self, url, plane=None, beam=None, hdu_index=0,
+                 dtype=numpy.float64, memmap=False):
         super(FitsImage, self).__init__()
         self.url = url
         self.header = self._get_header(hdu_index)
         self.wcs = self.parse_coordinates()
-        self.data = self.read_data(hdu_index, plane)
+        self.data = self.read_data(hdu_index, plane, dtype, memmap)
         self.taustart_ts, self.tau_time = self.parse_times()
         self.freq_eff, self.freq_bw = self.parse_frequency()
         self.pixelsize = self.parse_pixelsize()
@@ -48,7 +55,7 @@ class FitsImage(DataAccessor):
             hdu = hdulist[hdu_index]
         return hdu.header.copy()
 
-    def read_data(self, hdu_index, plane):
+    def read_data(self, hdu_index, plane, dtype=numpy.float64, memmap=False):
         """
         Read and store data from our FITS file.
 
@@ -57,10 +64,17 @@ class FitsImage(DataAccessor):
         consistent with (eg) ds9 display of the FitsFile. Transpose back
         before viewing the array with RO.DS9, saving to a FITS file,
         etc.
+
+        If memmap is set, the data is memory mapped and dtype is ignored:
+        the array returned is a view on the file.
         """
-        with pyfits.open(self.url) as hdulist:
+        with pyfits.open(self.url, memmap=memmap) as hdulist:
             hdu = hdulist[hdu_index]
-            data = numpy.float64(hdu.data.squeeze())
+            if memmap:
+                # The mapping outlives the closing of the file.
+                data = hdu.data.squeeze()
+            else:
+                data = numpy.array(hdu.data.squeeze(), dtype=dtype)
         if plane is not None and len(data.shape) > 2:
             data = data[plane].squeeze()
         n_dim = len(data.shape)
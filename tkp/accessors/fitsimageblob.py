@@ -10,14 +10,15 @@ class FitsImageBlob(FitsImage):
     A Fits image Blob. Same as ``tkp.accessors.fitsimage.FitsImage`` but
     constructed from an in memory fits file, not a fits file on disk.
     """
-    def __init__(self, hdulist, plane=None, beam=None, hdu_index=0):
+    def __init__(self, hdulist, plane=None, beam=None, hdu_index=0,
+                 dtype=numpy.float64):
         # set the URL in case we need it during header parsing for error loggign
         self.url = "AARTFAAC streaming image"
         super(FitsImage, self).__init__()
 
         self.header = self._get_header(hdulist, hdu_index)
         self.wcs = self.parse_coordinates()
-        self.data = self.read_data(hdulist, hdu_index, plane)
+        self.data = self.read_data(hdulist, hdu_index, plane, dtype)
         self.taustart_ts, self.tau_time = self.parse_times()
         self.freq_eff, self.freq_bw = self.parse_frequency()
         self.pixelsize = self.parse_pixelsize()
@@ -42,9 +43,9 @@ class FitsImageBlob(FitsImage):
     def _get_header(self, hdulist, hdu_index):
         return hdulist[hdu_index].header
 
-    def read_data(self, hdulist, hdu_index, plane):
+    def read_data(self, hdulist, hdu_index, plane, dtype=numpy.float64):
         hdu = hdulist[hdu_index]
-        data = numpy.float64(hdu.data.squeeze())
+        data = numpy.array(hdu.data.squeeze(), dtype=dtype)
         if plane is not None and len(data.shape) > 2:
             data = data[plane].squeeze()
         n_dim = len(data.shape)
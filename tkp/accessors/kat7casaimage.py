@@ -25,9 +25,11 @@ class Kat7CasaImage(CasaImage):
       - beam: (optional) beam parameters in degrees, in the form
         (bmaj, bmin, bpa). Will attempt to read from header if
         not supplied.
+      - dtype: (optional) numpy floating point type to convert the
+        image data to.
     """
-    def __init__(self, url, plane=0, beam=None):
-        super(Kat7CasaImage, self).__init__(url, plane, beam)
+    def __init__(self, url, plane=0, beam=None, dtype=None):
+        super(Kat7CasaImage, self).__init__(url, plane, beam, dtype)
         table = casacore_table(self.url.encode(), ack=False)
         self.taustart_ts = self.parse_taustartts(table)
         self.tau_time = 1  # Placeholder value
@@ -39,9 +39,11 @@ class LofarCasaImage(CasaImage, LofarAccessor):
       - beam: (optional) beam parameters in degrees, in the form
         (bmaj, bmin, bpa). Will attempt to read from header if
         not supplied.
+      - dtype: (optional) numpy floating point type to convert the
+        image data to.
     """
-    def __init__(self, url, plane=0, beam=None):
-        super(LofarCasaImage, self).__init__(url, plane, beam)
+    def __init__(self, url, plane=0, beam=None, dtype=None):
+        super(LofarCasaImage, self).__init__(url, plane, beam, dtype)
         table = casacore_table(self.url.encode(), ack=False)
         subtables = self.open_subtables(table)
         self.taustart_ts = self.parse_taustartts(subtables)
@@ -1,10 +1,13 @@
+import numpy
 from tkp.accessors import FitsImage
 from tkp.accessors.lofaraccessor import LofarAccessor
 
 
 class LofarFitsImage(FitsImage, LofarAccessor):
-    def __init__(self, url, plane=False, beam=False, hdu=0):
-        super(LofarFitsImage, self).__init__(url, plane, beam, hdu)
+    def __init__(self, url, plane=False, beam=False, hdu=0,
+                 dtype=numpy.float64, memmap=False):
+        super(LofarFitsImage, self).__init__(url, plane, beam, hdu, dtype,
+                                             memmap)
         header = self._get_header(hdu)
         self.antenna_set = header['ANTENNA']
         self.ncore = header['NCORE']
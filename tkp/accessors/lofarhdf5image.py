@@ -5,13 +5,13 @@ from tkp.accessors.dataaccessor import DataAccessor
 
 class LofarHdf5Image(DataAccessor):
     # Not currently instantiable; LOFAR HDF5 images are not in use
-    def __init__(self, source, plane=False, beam=False):
+    def __init__(self, source, plane=False, beam=False, dtype=None):
         super(LofarHdf5Image, self).__init__()  # Set defaults
 
         self.plane = plane
 
         self._beamsizeparse(source)
-        self._read_data(source)
+        self._read_data(source, dtype)
 
         coordinfo = source["/coordinfo"]
         attrgroups = source["/ATTRGROUPS"]
@@ -61,11 +61,13 @@ class LofarHdf5Image(DataAccessor):
         # Preserved for API compatibility.
         return self.header
 
-    def _read_data(self, source):
+    def _read_data(self, source, dtype=None):
         self.data = numpy.squeeze(source["map"])
 
         if len(self.data.shape) != 2:
             raise IndexError("Data has wrong shape")
+        if dtype is not None:
+            self.data = self.data.astype(dtype)
 
         # TODO: do we need to transpose?
         #self.data = data.transpose()
@@ -32,7 +32,9 @@ import logging
 from tkp.accessors import open as open_accessor
 from tkp.accessors import sourcefinder_image_from_accessor
 from tkp.accessors import writefits as tkp_writefits
+from tkp.accessors.detection import isfits
 from tkp.sourcefinder.utils import generate_result_maps
+from tkp.sourcefinder.tiled import TiledImageData
 from tkp.management import parse_monitoringlist_positions
 
 def regions(sourcelist):
@@ -143,6 +145,12 @@ def get_argparser():
     extraction.add_argument("--bpa", type=float, help="Set beam: Beam position angle (deg)")
     extraction.add_argument("--force-beam", action="store_true",
                         help="Force fit axis lengths to beam size")
+    extraction.add_argument("--fit-workers", default=0, type=int,
+                        help="Number of islands to fit concurrently; 0 to disable")
+    extraction.add_argument("--single-precision", action="store_true",
+                        help="Process images as float32 to save memory")
+    extraction.add_argument("--tile-size", default=0, type=int,
+                        help="Read images in tiles of this size (in pixels); 0 to disable")
     extraction.add_argument("--detection-image", type=str,
                         help="Find islands on different image")
     extraction.add_argument('--fixed-posns', help="List of position coordinates to "
@@ -222,6 +230,13 @@ def handle_args(args=None):
     else:
         options.mode = "threshold" # mode 1.1 above
 
+    if options.tile_size:
+        if options.mode != "threshold":
+            parser.error("--tile-size only supported for thresholding without a detection image")
+        elif (options.residuals or options.islands or options.rmsmap or
+              options.sigmap):
+            parser.error("--tile-size not supported with image outputs")
+
     return options, options.files
 
 def writefits(filename, data, header={}):
@@ -235,7 +250,8 @@ def writefits(filename, data, header={}):
 def get_detection_labels(filename, det, anl, beam, configuration, plane=0):
     print "Detecting islands in %s" % (filename,)
     print "Thresholding with det = %f sigma, analysis = %f sigma" % (det, anl)
-    ff = open_accessor(filename, beam=beam, plane=plane)
+    ff = open_accessor(filename, beam=beam, plane=plane,
+                       **get_accessor_configuration(configuration))
     imagedata = sourcefinder_image_from_accessor(ff, **configuration)
     labels, labelled_data = imagedata.label_islands(
         det * imagedata.rmsmap, anl * imagedata.rmsmap
@@ -248,11 +264,20 @@ def get_sourcefinder_configuration(options):
         "back_size_y": options.grid,
         "margin": options.margin,
         "radius": options.radius,
+        "fit_workers": options.fit_workers,
     }
     if options.residuals or options.islands:
         configuration['residuals'] = True
+    if options.single_precision:
+        configuration['dtype'] = numpy.float32
     return configuration
 
+def get_accessor_configuration(configuration):
+    # Images are read in the same precision as they will be processed.
+    if "dtype" in configuration:
+        return {"dtype": configuration["dtype"]}
+    return {}
+
 def get_beam(bmaj, bmin, bpa):
 
     if (
@@ -289,11 +314,26 @@ def run_sourcefinder(files, options):
     else:
         labels, labelled_data = [], None
 
+    if options.tile_size:
+        # Only FITS images can be memory mapped.
+        not_fits = [filename for filename in files if not isfits(filename)]
+        if not_fits:
+            bailout("--tile-size only supported for FITS images, not %s" %
+                    ", ".join(not_fits))
+
     for counter, filename in enumerate(files):
         print "Processing %s (file %d of %d)." % (filename, counter+1, len(files))
         imagename = os.path.splitext(os.path.basename(filename))[0]
-        ff = open_accessor(filename, beam=beam, plane=0)
-        imagedata = sourcefinder_image_from_accessor(ff, **configuration)
+        if options.tile_size:
+            # The image is memory mapped, and read a tile at a time.
+            ff = open_accessor(filename, beam=beam, plane=0, memmap=True)
+            imagedata = TiledImageData(ff.data, ff.beam, ff.wcs,
+                                       tile_size=options.tile_size,
+                                       **configuration)
+        else:
+            ff = open_accessor(filename, beam=beam, plane=0,
+                               **get_accessor_configuration(configuration))
+            imagedata = sourcefinder_image_from_accessor(ff, **configuration)
 
         if options.mode == "fixed":
             sr = imagedata.fit_fixed_positions(options.fixed_coords,
@@ -308,6 +348,13 @@ def run_sourcefinder(files, options):
                     deblend_nthresh=options.deblend_thresholds,
                     force_beam=options.force_beam
                 )
+            elif options.tile_size:
+                print "Thresholding with det = %f sigma, analysis = %f sigma" % (options.detection, options.analysis)
+                sr = imagedata.extract(
+                    det=options.detection, anl=options.analysis,
+                    deblend_nthresh=options.deblend_thresholds,
+                    force_beam=options.force_beam
+                )
             else:
                 if labelled_data is None:
                     print "Thresholding with det = %f sigma, analysis = %f sigma" % (options.detection, options.analysis)
@@ -7,15 +7,16 @@ that don't fit into a more specific collection.
 
 import itertools
 import logging
-import math
+
+import numpy
 
 import tkp.db
 from datetime import datetime
 from tkp.db.alchemy.image import insert_dataset as alchemy_insert_dataset
 from tkp.db.generic import columns_from_table
-from tkp.utility import substitute_inf
-from tkp.utility.coordinates import alpha_inflate
-from tkp.utility.coordinates import eq_to_cart
+from tkp.utility.containers import SERIALIZED_DTYPE, serialized_array
+from tkp.utility.coordinates import alpha_inflate_many
+from tkp.utility.coordinates import eq_to_cart_many
 
 logger = logging.getLogger(__name__)
 
@@ -111,7 +112,9 @@ def insert_extracted_sources(image_id, results, extract_type='blind',
     Besides the source properties from sourcefinder, we calculate additional
     attributes that are increase performance in other tasks.
 
-    The strict sequence from results (the sourcefinder detections) is given below.
+    The results (the sourcefinder detections) are either a structured array
+    of :data:`tkp.utility.containers.SERIALIZED_DTYPE`, or a sequence of rows
+    in the strict sequence given below.
     Note the units between sourcefinder and database.
     (0) ra [deg], (1) dec [deg],
     (2) ra_fit_err [deg], (3) decl_fit_err [deg],
@@ -172,55 +175,74 @@ def insert_extracted_sources(image_id, results, extract_type='blind',
                     " image %s" % (extract_type, image_id))
         return
 
-    xtrsrc = []
-    for i, src in enumerate(results):
-        r = list(src)
-        # Drop any fits with infinite flux errors
-        if math.isinf(r[5]) or math.isinf(r[7]):
-            logger.warn("Dropped source fit with infinite flux errors "
-                        "at position {} {} in image {}".format(
-                r[0], r[1], image_id))
-            continue
-        # Use 360 degree rather than infinite uncertainty for
-        # unconstrained positions.
-        r[14] = substitute_inf(r[14], 360.0)
-        r[15] = int(r[15])
+    if extract_type == 'blind':
+        extract_type_code = 0
+    elif extract_type == 'ff_nd':
+        extract_type_code = 1
+    elif extract_type == 'ff_ms':
+        extract_type_code = 2
+    else:
+        raise ValueError("Not a valid extractedsource insert type: '%s'"
+                         % extract_type)
+    if ff_runcat_ids is not None:
+        assert len(results)==len(ff_runcat_ids)
+    if ff_monitor_ids is not None:
+        assert len(results)==len(ff_monitor_ids)
+
+    sources = serialized_array(results)
+
+    # Drop any fits with infinite flux errors
+    infinite = (numpy.isinf(sources['f_peak_err']) |
+                numpy.isinf(sources['f_int_err']))
+    for src in sources[infinite]:
+        logger.warn("Dropped source fit with infinite flux errors "
+                    "at position {} {} in image {}".format(
+            src['ra'], src['decl'], image_id))
+    kept = numpy.flatnonzero(~infinite)
+    sources = sources[kept]
+
+    ra, decl = sources['ra'], sources['decl']
+    ew_sys_err, ns_sys_err = sources['ew_sys_err'], sources['ns_sys_err']
+    # Use 360 degree rather than infinite uncertainty for
+    # unconstrained positions.
+    error_radius = numpy.where(numpy.isinf(sources['error_radius']), 360.0,
+                               sources['error_radius'])
+    columns = [sources[name] for name in SERIALIZED_DTYPE.names[:14]]
+    columns.extend([
+        error_radius,
+        sources['fit_type'].astype(int),
+        sources['chisq'],
+        sources['reduced_chisq'],
         # ra_err: sqrt of quadratic sum of fitted and systematic errors.
-        r.append(math.sqrt(r[2]**2 + alpha_inflate(r[12]/3600., r[1])**2))
+        numpy.sqrt(sources['ra_fit_err']**2 +
+                   alpha_inflate_many(ew_sys_err/3600., decl)**2),
         # decl_err: sqrt of quadratic sum of fitted and systematic errors.
-        r.append(math.sqrt(r[3]**2 + (r[13]/3600.)**2))
+        numpy.sqrt(sources['decl_fit_err']**2 + (ns_sys_err/3600.)**2),
         # uncertainty_ew: sqrt of quadratic sum of systematic error and error_radius
         # divided by 3600 because uncertainty in degrees and others in arcsec.
-        r.append(math.sqrt(r[12]**2 + r[14]**2)/3600.)
+        numpy.sqrt(ew_sys_err**2 + error_radius**2)/3600.,
         # uncertainty_ns: sqrt of quadratic sum of systematic error and error_radius
         # divided by 3600 because uncertainty in degrees and others in arcsec.
-        r.append(math.sqrt(r[13]**2 + r[14]**2)/3600.)
-        r.append(image_id) # id of the image
-        r.append(int(math.floor(r[1]))) # zone
-        r.extend(eq_to_cart(r[0], r[1])) # Cartesian x,y,z
-        r.append(r[0] * math.cos(math.radians(r[1]))) # ra * cos(radians(decl))
-        if extract_type == 'blind':
-            r.append(0)
-        elif extract_type == 'ff_nd':
-            r.append(1)
-        elif extract_type == 'ff_ms':
-            r.append(2)
-        else:
-            raise ValueError("Not a valid extractedsource insert type: '%s'"
-                             % extract_type)
-        if ff_runcat_ids is not None:
-            assert len(results)==len(ff_runcat_ids)
-            r.append(ff_runcat_ids[i])
-        else:
-            r.append(None)
-
-        if ff_monitor_ids is not None:
-            assert len(results)==len(ff_monitor_ids)
-            r.append(ff_monitor_ids[i])
-        else:
-            r.append(None)
-
-        xtrsrc.append(r)
+        numpy.sqrt(ns_sys_err**2 + error_radius**2)/3600.,
+    ])
+    # The database driver wants plain Python values rather than NumPy
+    # scalars.
+    columns = [column.tolist() for column in columns]
+    columns.append(itertools.repeat(image_id)) # id of the image
+    columns.append(numpy.floor(decl).astype(int).tolist()) # zone
+    columns.extend(column.tolist()
+                   for column in eq_to_cart_many(ra, decl)) # Cartesian x,y,z
+    columns.append((ra * numpy.cos(numpy.radians(decl))).tolist()) # ra * cos(radians(decl))
+    columns.append(itertools.repeat(extract_type_code))
+    if ff_runcat_ids is not None:
+        columns.append([ff_runcat_ids[i] for i in kept])
+    else:
+        columns.append(itertools.repeat(None))
+    if ff_monitor_ids is not None:
+        columns.append([ff_monitor_ids[i] for i in kept])
+    else:
+        columns.append(itertools.repeat(None))
+    xtrsrc = list(itertools.izip(*columns))
 
     insertion_query = """\
 INSERT INTO extractedsource
@@ -334,3 +356,34 @@ def runcat_entries(dataset_id):
                               keywords=['id', 'xtrsrc', 'datapoints'],
                               alias={'id': 'runcat'},
                               where={'dataset': dataset_id})
+
+
+def last_measurements(runcat_ids):
+    """
+    Returns the last blind measurement (the ``xtrsrc``) of each of the given
+    runningcatalog sources, from which their forced fits may start.
+
+    Args:
+        runcat_ids (list): runningcatalog ids.
+
+    Returns:
+        (dict): maps each runcat id to a tuple of the peak flux, semimajor
+        and semiminor axes (arcsec) and position angle (degrees) of its
+        extractedsource. Any of these may be None.
+    """
+    if not runcat_ids:
+        return {}
+    query = """\
+SELECT r.id
+      ,x.f_peak
+      ,x.semimajor
+      ,x.semiminor
+      ,x.pa
+  FROM runningcatalog r
+      ,extractedsource x
+ WHERE r.id IN ({placeholder})
+   AND x.id = r.xtrsrc
+"""
+    query = query.format(placeholder=','.join(['%s'] * len(runcat_ids)))
+    cursor = tkp.db.execute(query, tuple(runcat_ids))
+    return dict((row[0], row[1:]) for row in cursor.fetchall())
@@ -40,17 +40,20 @@ def extract_sources(zipped):
 
 def forced_fits(zipped):
     logger.debug("running forced fits task")
-    accessor, db_image_id, fit_posns, fit_ids, extraction_params = zipped[0]
+    (accessor, db_image_id, fit_posns, fit_ids, extraction_params,
+     background_grids, fit_priors) = zipped[0]
     successful_fits, successful_ids = perform_forced_fits(fit_posns, fit_ids,
                                                           accessor,
-                                                          extraction_params)
+                                                          extraction_params,
+                                                          background_grids,
+                                                          fit_priors)
     return successful_fits, successful_ids, db_image_id
 
 
 def get_accessors(zipped):
     logger.debug("Creating accessors for images")
     images, args = zipped
-    return tkp.steps.persistence.get_accessors(images)
+    return tkp.steps.persistence.get_accessors(images, *args)
 
 
 def get_metadata_for_ordering(zipped):
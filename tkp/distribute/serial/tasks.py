@@ -28,9 +28,9 @@ def extract_sources(accessor, extraction_params):
                                                        extraction_params)
 
 
-def get_accessors(images):
+def get_accessors(images, dtype=None):
     logger.debug("Creating accessors for images")
-    return tkp.steps.persistence.get_accessors(images)
+    return tkp.steps.persistence.get_accessors(images, dtype)
 
 
 def get_metadata_for_ordering(images):
@@ -50,8 +50,11 @@ def get_metadata_for_ordering(images):
 
 def forced_fits(zipped):
     logger.debug("running forced fits task")
-    accessor, db_image_id, fit_posns, fit_ids, extraction_params = zipped
+    (accessor, db_image_id, fit_posns, fit_ids, extraction_params,
+     background_grids, fit_priors) = zipped
     successful_fits, successful_ids = perform_forced_fits(fit_posns, fit_ids,
                                                           accessor,
-                                                          extraction_params)
+                                                          extraction_params,
+                                                          background_grids,
+                                                          fit_priors)
     return successful_fits, successful_ids, db_image_id
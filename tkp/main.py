@@ -20,7 +20,8 @@ from tkp.distribute import Runner
 from tkp.steps.misc import (load_job_config, dump_configs_to_logdir,
                             check_job_configs_match,
                             setup_logging, dump_database_backup,
-                            group_per_timestep
+                            group_per_timestep, image_dtype,
+                            check_fit_workers
                             )
 from tkp.db.configstore import store_config, fetch_config
 from tkp.steps.persistence import create_dataset, store_images_in_db
@@ -62,10 +63,15 @@ def setup(pipe_config, supplied_mon_coords=None):
 
     job_config = load_job_config(pipe_config)
     dump_configs_to_logdir(log_dir, job_config, pipe_config)
+    check_fit_workers(job_config.source_extraction,
+                      get_distributor(pipe_config))
 
     sync_rejectreasons(tkp.db.Database().Session())
 
     job_config, dataset_id = initialise_dataset(job_config, supplied_mon_coords)
+    # The job config of an existing dataset is taken from the database.
+    check_fit_workers(job_config.source_extraction,
+                      get_distributor(pipe_config))
 
     return job_dir, job_config, dataset_id
 
@@ -83,8 +89,16 @@ def get_runner(pipe_config):
     """
     para = pipe_config.parallelise
     logging.info("using '{}' method for parallellisation".format(para.method))
-    distributor = os.environ.get('TKP_PARALLELISE', para.method)
-    return Runner(distributor=distributor, cores=para.cores)
+    return Runner(distributor=get_distributor(pipe_config), cores=para.cores)
+
+
+def get_distributor(pipe_config):
+    """
+    The name of the distribution method: the parallelise method of the
+    pipeline config, unless overridden by the TKP_PARALLELISE environment
+    variable.
+    """
+    return os.environ.get('TKP_PARALLELISE', pipe_config.parallelise.method)
 
 
 def load_images(job_name, job_dir):
@@ -278,9 +292,9 @@ def close_database(dataset_id):
     db.close()
 
 
-def get_accessors(runner, all_images):
+def get_accessors(runner, all_images, dtype=None):
     imgs = [[img] for img in all_images]
-    accessors = runner.map("get_accessors", imgs)
+    accessors = runner.map("get_accessors", imgs, [dtype])
     return [a[0] for a in accessors if a]
 
 
@@ -324,7 +338,8 @@ def timestamp_step(runner, images, job_config, dataset_id, copy_images):
         tuple: of tuples (rms_qc, band)
     """
     # gather all image info
-    accessors = get_accessors(runner, images)
+    accessors = get_accessors(runner, images,
+                              image_dtype(job_config.source_extraction))
     metadatas = extract_metadata(job_config, accessors, runner)
     db_images = store_image_metadata(metadatas, job_config, dataset_id)
     error = "%s != %s != %s" % (len(accessors), len(metadatas), len(db_images))
@@ -346,10 +361,17 @@ def timestamp_step(runner, images, job_config, dataset_id, copy_images):
 
     all_forced_fits = []
     # assocate the sources
-    for (db_image, accessor) in good_images:
+    for (db_image, accessor), results in zip(good_images, extraction_results):
         fit_poss, fit_ids = assocate_and_get_force_fits(db_image, job_config)
+        # The forced fits may start from the last measurement of each source.
+        fit_priors = None
+        if job_config.source_extraction.get('forced_fit_warm_start', False):
+            fit_priors = steps_ff.get_forced_fit_priors(fit_ids)
+        # The forced fits reuse the background grids of the blind extraction,
+        # if it kept them.
         all_forced_fits.append((accessor, db_image.id, fit_poss, fit_ids,
-                               job_config.source_extraction))
+                               job_config.source_extraction,
+                               results.background_grids, fit_priors))
 
     # do the forced fitting
     all_forced_fits_results = do_forced_fits(runner, all_forced_fits)
@@ -4,6 +4,7 @@ from scipy.stats import norm
 from sqlalchemy.sql.expression import desc
 from tkp.db.model import Image
 from tkp.db.quality import reject_reasons
+from tkp.sourcefinder.stats import clip_about_median
 
 def rms_invalid(rms, noise, low_bound=1, high_bound=50):
     """
@@ -40,14 +41,8 @@ def clip(data, sigma=3):
     Args:
         data: a numpy array
     """
-    raveled = data.ravel()
-    median = numpy.median(raveled)
-    std = numpy.std(raveled)
-    newdata = raveled[numpy.abs(raveled-median) <= sigma*std]
-    if len(newdata) and len(newdata) != len(raveled):
-        return clip(newdata, sigma)
-    else:
-        return newdata
+    return clip_about_median(
+        data, lambda N, variance: sigma * numpy.sqrt(variance))[0]
 
 
 def subregion(data, f=4):
@@ -4,6 +4,8 @@ Gaussian deconvolution.
 
 from math import sin, cos, atan, sqrt, pi
 
+import numpy
+
 def deconv(fmaj, fmin, fpa, cmaj, cmin, cpa):
     """
     Deconvolve a Gaussian "beam" from a Gaussian component.
@@ -70,3 +72,78 @@ def deconv(fmaj, fmin, fpa, cmaj, cmin, cpa):
         rpa = (rpa + 450.0) % 180.0
 
     return rmaj, rmin, rpa, ierr
+
+
+def deconv_many(fmaj, fmin, fpa, cmaj, cmin, cpa):
+    """
+    Deconvolve a Gaussian "beam" from many Gaussian components at once.
+
+    This is the array version of deconv(): it takes columns of fitted
+    shapes, and does elementwise what deconv() does for a single one,
+    giving the same values and the same number of components which failed
+    to deconvolve. The beam may be given for each component, or once for
+    all.
+
+    Args:
+        fmaj (numpy.ndarray): Fitted major axes
+        fmin (numpy.ndarray): Fitted minor axes
+        fpa (numpy.ndarray):  Fitted position angles of major axes
+        cmaj (float): Clean beam major axis
+        cmin (float): Clean beam minor axis
+        cpa (float):  Clean beam position angle of major axis
+
+    Returns:
+        tuple: arrays of the real major axes, real minor axes, real
+               position angles of major axes and numbers of components
+               which failed to deconvolve
+
+    Raises:
+        ValueError: if a position angle is infinite, as does deconv().
+    """
+    fmaj, fmin, fpa, cmaj, cmin, cpa = numpy.broadcast_arrays(
+        *(numpy.asarray(value, dtype=float)
+          for value in (fmaj, fmin, fpa, cmaj, cmin, cpa)))
+    HALF_RAD = 90.0 / pi
+    cmaj2 = cmaj * cmaj
+    cmin2 = cmin * cmin
+    fmaj2 = fmaj * fmaj
+    fmin2 = fmin * fmin
+    theta = (fpa - cpa) / HALF_RAD
+    if numpy.isinf(theta).any():
+        raise ValueError("math domain error")
+    det = ((fmaj2 + fmin2) - (cmaj2 + cmin2)) / 2.0
+    rhoc = (fmaj2 - fmin2) * numpy.cos(theta) - (cmaj2 - cmin2)
+
+    # Where a component is undefined (NaN), so are the results, as with
+    # deconv(); no need to warn about that.
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        defined = numpy.abs(rhoc) > 0.0
+        sigic2 = numpy.where(
+            defined, numpy.arctan((fmaj2 - fmin2) * numpy.sin(theta) / rhoc),
+            0.0)
+        rhoa = numpy.where(
+            defined,
+            (((cmaj2 - cmin2) - (fmaj2 - fmin2) * numpy.cos(theta)) /
+             (2.0 * numpy.cos(sigic2))),
+            0.0)
+
+        rpa = sigic2 * HALF_RAD + cpa
+        rmaj = det - rhoa
+        rmin = det + rhoa
+
+        ierr = (rmaj < 0).astype(int) + (rmin < 0)
+        rmaj = numpy.sqrt(numpy.where(rmaj < 0, 0., rmaj))
+        rmin = numpy.sqrt(numpy.where(rmin < 0, 0., rmin))
+        swap = rmaj < rmin
+        rmaj, rmin = (numpy.where(swap, rmin, rmaj),
+                      numpy.where(swap, rmaj, rmin))
+        rpa = numpy.where(swap, rpa + 90, rpa)
+
+        rpa = (rpa + 900) % 180
+        rpa = numpy.where(
+            rmaj == 0, 0.0,
+            numpy.where((rmin == 0) & (45.0 < numpy.abs(rpa - fpa)) &
+                        (numpy.abs(rpa - fpa) < 135.0),
+                        (rpa + 450.0) % 180.0, rpa))
+
+    return rmaj, rmin, rpa, ierr
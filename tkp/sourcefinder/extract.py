@@ -6,6 +6,7 @@ These are used in conjunction with image.ImageData.
 
 import logging
 import math
+import itertools
 # DictMixin may need to be replaced using collections.MutableMapping;
 # see http://docs.python.org/library/userdict.html#UserDict.DictMixin
 from UserDict import DictMixin
@@ -14,9 +15,9 @@ try:
     import ndimage
 except ImportError:
     from scipy import ndimage
-from tkp.sourcefinder.deconv import deconv
+from tkp.sourcefinder.deconv import deconv_many
 from ..utility import coordinates
-from ..utility.uncertain import Uncertain
+from ..utility.uncertain import Uncertain, UncertainArray
 from .gaussian import gaussian
 from . import fitting
 from . import utils
@@ -49,12 +50,7 @@ class Island(object):
 
         # deblend_nthresh is the number of subthresholds used when deblending.
         self.deblend_nthresh = deblend_nthresh
-        # If we deblend too far, we hit the recursion limit. And it's slow.
-        if self.deblend_nthresh > 300:
-            logger.warn("Limiting to 300 deblending subtresholds")
-            self.deblend_nthresh = 300
-        else:
-            logger.debug("Using %d subthresholds", deblend_nthresh)
+        logger.debug("Using %d subthresholds", deblend_nthresh)
 
         # Deblended components of this island must contain at least
         # deblend_mincont times the total flux of the original to be regarded
@@ -96,105 +92,175 @@ class Island(object):
         """Return a decomposed numpy array of all the subislands.
 
         Iterate up through subthresholds, looking for our island
-        splitting into two. If it does, start again, with two or more
-        separate islands.
-        """
+        splitting into two or more significant subislands. Each of those
+        is then deblended in turn, starting from the next subthreshold.
+
+        A subisland is significant if the flux of its branch above the
+        subthreshold exceeds deblend_mincont times the flux of the original
+        island, and it rises above the detection threshold. A branch of
+        the island is no more significant than the branch it grows from,
+        so we can follow every branch up through the subthresholds in a
+        single pass: each subthreshold at which the set of pixels above it
+        changes is labelled only once (this is the component tree of the
+        island), however many subislands are being followed.
+
+        Kwargs:
 
+            niter (int): index of the first subthreshold to consider.
+
+        Returns:
+
+            Either this island, if it does not split, or a list of its
+            subislands.
+        """
         logger.debug("Deblending source")
-        for level in self.subthrrange[niter:]:
-
-            # The idea is to retain the parent island when no significant
-            # subislands are found and jump to the next subthreshold
-            # using niter.
-            # Deblending is started at a level higher than the lowest
-            # pixel value in the island.
-            # Deblending at the level of the lowest pixel value will
-            # likely not yield anything, because the island was formed at
-            # threshold just below that.
-            # So that is why we use niter+1 (>=1) instead of niter (>=0).
-
-            if level > self.data.max():
-                # level is above the highest pixel value...
-                # Return the current island.
-                break
-            clipped_data = numpy.where(
-                self.data.filled(fill_value=0) >= level, 1, 0)
-            labels, number = ndimage.label((clipped_data),
+        levels = self.subthrrange[niter:]
+        values = self.data.filled(fill_value=0)
+        # A pixel lies above subthreshold levels[j] if depth > j.
+        depth = numpy.searchsorted(levels, values, side='right')
+        depth[numpy.ma.getmaskarray(self.data)] = 0
+        above_detection = (
+            (self.data - self.detection_map).filled(fill_value=-1) >= 0
+        )
+
+        # The subislands form a tree of [island, subislands] nodes. While
+        # a node is followed up through the subthresholds, it is paired with
+        # the label of its (most significant) branch at the last level.
+        # Initially, the whole island carries label 0.
+        root = [self, []]
+        followed = [(root, 0)]
+        previous_labels = numpy.zeros(self.data.shape, dtype=numpy.int)
+        # We only look at the window of the island holding the branches
+        # being followed; offset is the position of its corner.
+        offset = (0, 0)
+
+        # The set of pixels above the subthreshold only changes at levels
+        # which some pixel's depth equals; those are the only ones we need
+        # to examine.
+        index = 0
+        while followed and (depth > index).any():
+            level = levels[index]
+            labels, number = ndimage.label(depth > index,
                                            self.structuring_element)
-            # If we have more than one island, then we need to make subislands.
-            if number > 1:
-                subislands = []
-                label = 0
-                for chunk in ndimage.find_objects(labels):
-                    label += 1
-                    newdata = numpy.where(
-                        labels == label,
-                        self.data.filled(fill_value=-BIGNUM), -BIGNUM
-                    )
-                    # NB: In class Island(object), rms * analysis_threshold
-                    # is taken as the threshold for the bottom of the island.
-                    # Everything below that level is masked.
-                    # For subislands, this product should be equal to level
-                    # and flat, i.e., horizontal.
-                    # We can achieve this by setting rms=level*ones and
-                    # analysis_threshold=1.
-                    island = Island(
-                                 newdata[chunk],
-                                 (numpy.ones(self.data[chunk].shape) * level),
-                                 (
-                                     slice(self.chunk[0].start + chunk[0].start,
-                                        self.chunk[0].start + chunk[0].stop),
-                                     slice(self.chunk[1].start + chunk[1].start,
-                                        self.chunk[1].start + chunk[1].stop)
-                                 ),
-                                 1,
-                                 self.detection_map[chunk],
-                                 self.beam,
-                                 self.deblend_nthresh,
-                                 self.deblend_mincont,
-                                 self.structuring_element,
-                                 self.rms_orig[chunk[0].start:chunk[0].stop, chunk[1].start:chunk[1].stop],
-                                 self.flux_orig,
-                                 self.subthrrange
-                            )
-
-                    subislands.append(island)
-                # This line should filter out any subisland with insufficient
-                # flux, in about the same way as SExtractor.
-                # Sufficient means: the flux of the branch above the
-                # subthreshold (=level) must exceed some user given fraction
-                # of the composite object, i.e., the original island.
-                subislands = filter(
-                    lambda isl: (isl.data-numpy.ma.array(
-                    numpy.ones(isl.data.shape)*level,
-                    mask=isl.data.mask)).sum() > self.deblend_mincont *
-                                    self.flux_orig, subislands)
-                # Discard subislands below detection threshold
-                subislands = filter(
-                    lambda isl: (isl.data - isl.detection_map).max() >= 0,
-                    subislands)
-                numbersignifsub = len(subislands)
-                # Proceed with the previous island, but make sure the next
-                # subthreshold is higher than the present one.
-                # Or we would end up in an infinite loop...
-                if numbersignifsub > 1:
-                    if niter+1 < self.deblend_nthresh:
-                        # Apparently, the map command always results in
-                        # nested lists.
-                        return list(utils.flatten(map(
-                            lambda island: island.deblend(niter=niter+1),
-                            subislands)))
-                    else:
-                        return subislands
-                elif numbersignifsub == 1 and niter+1 < self.deblend_nthresh:
-                    return Island.deblend(self, niter=niter+1)
-                else:
-                    # In this case we have numbersignifsub == 0 or
-                    # (1 and reached the highest subthreshold level).
-                    # Pull out of deblending loop, return current island.
-                    break
+            flat_labels = labels.ravel()
+
+            # Each component at this level grows from a single component
+            # at the previous level, so carries its label in every pixel.
+            pixels = numpy.bincount(flat_labels, minlength=number + 1)[1:]
+            parents = numpy.rint(
+                numpy.bincount(flat_labels, weights=previous_labels.ravel(),
+                               minlength=number + 1)[1:] / pixels
+            ).astype(numpy.int)
+
+            # Flux of each branch above level must exceed some user given
+            # fraction of the composite object, i.e., the original island,
+            # in about the same way as SExtractor. It must also rise above
+            # the detection threshold.
+            flux = numpy.bincount(flat_labels, weights=values.ravel(),
+                                  minlength=number + 1)[1:] - pixels * level
+            detected = numpy.bincount(flat_labels,
+                                      weights=above_detection.ravel(),
+                                      minlength=number + 1)[1:] > 0
+            significant = (
+                (flux > self.deblend_mincont * self.flux_orig) & detected
+            )
+
+            still_followed = []
+            chunks = None
+            for node, label in followed:
+                branches = numpy.flatnonzero(parents == label) + 1
+                if len(branches) == 1:
+                    still_followed.append((node, branches[0]))
+                    continue
+                branches = branches[significant[branches - 1]]
+                if len(branches) == 1:
+                    # Proceed with the current island, ignoring the
+                    # insignificant branches.
+                    still_followed.append((node, branches[0]))
+                elif len(branches) > 1:
+                    if chunks is None:
+                        chunks = ndimage.find_objects(labels)
+                    for branch in branches:
+                        chunk = chunks[branch - 1]
+                        subisland = [self._subisland(
+                            labels[chunk] == branch,
+                            (slice(offset[0] + chunk[0].start,
+                                   offset[0] + chunk[0].stop),
+                             slice(offset[1] + chunk[1].start,
+                                   offset[1] + chunk[1].stop)),
+                            level
+                        ), []]
+                        node[1].append(subisland)
+                        still_followed.append((subisland, branch))
+            followed = still_followed
+            if not followed:
+                break
+
+            # Pixels outside the branches we follow are of no further
+            # interest: drop them, and shrink the window around the rest.
+            keep = numpy.zeros(number + 1, dtype=bool)
+            keep[[label for node, label in followed]] = True
+            keep = keep[labels]
+            depth[~keep] = 0
+            window = ndimage.find_objects(keep.astype(numpy.int8))[0]
+            offset = (offset[0] + window[0].start, offset[1] + window[1].start)
+            depth = depth[window]
+            values = values[window]
+            above_detection = above_detection[window]
+            previous_labels = labels[window]
+
+            remaining = depth[depth > index]
+            if not len(remaining):
+                # level is above the highest pixel value.
+                break
+            index = remaining.min()
+
         # We've not found any subislands: just return this island.
-        return self
+        if not root[1]:
+            return self
+
+        subislands, nodes = [], [root]
+        while nodes:
+            island, children = nodes.pop()
+            if children:
+                nodes.extend(reversed(children))
+            else:
+                subislands.append(island)
+        return subislands
+
+    def _subisland(self, selection, chunk, level):
+        """Make an island of the selected pixels of the given chunk of this
+        island, split off at subthreshold level.
+        """
+        newdata = numpy.where(
+            selection, self.data[chunk].filled(fill_value=-BIGNUM), -BIGNUM
+        )
+        # NB: In class Island(object), rms * analysis_threshold
+        # is taken as the threshold for the bottom of the island.
+        # Everything below that level is masked.
+        # For subislands, this product should be equal to level
+        # and flat, i.e., horizontal.
+        # We can achieve this by setting rms=level*ones and
+        # analysis_threshold=1.
+        return Island(
+            newdata,
+            numpy.ones(newdata.shape) * level,
+            (
+                slice(self.chunk[0].start + chunk[0].start,
+                      self.chunk[0].start + chunk[0].stop),
+                slice(self.chunk[1].start + chunk[1].start,
+                      self.chunk[1].start + chunk[1].stop)
+            ),
+            1,
+            self.detection_map[chunk],
+            self.beam,
+            self.deblend_nthresh,
+            self.deblend_mincont,
+            self.structuring_element,
+            self.rms_orig[chunk],
+            self.flux_orig,
+            self.subthrrange
+        )
 
     def threshold(self):
         """Threshold"""
@@ -208,16 +274,61 @@ class Island(object):
         """Deviation"""
         return (self.data/ self.rms_orig).max()
 
-    def fit(self, fixed=None):
-        """Fit the position"""
+    def is_compact(self, max_beams, max_sig=0):
+        """Whether the island covers no more than max_beams beam areas and,
+        unless max_sig is 0, is no more significant than max_sig; its
+        moments then describe it about as well as a Gauss fit would."""
+        beams = (self.data.count() /
+                 utils.calculate_beamsize(self.beam[0], self.beam[1]))
+        return beams <= max_beams and (not max_sig or self.sig() <= max_sig)
+
+    def fit(self, fixed=None, initial=None, moments_only=False):
+        """Fit the position
+
+        initial and moments_only are passed on to source_profile().
+        """
+        measurement = self.fit_profile(fixed=fixed, initial=initial,
+                                       moments_only=moments_only)
+        if measurement is None or not self.calculate_errors(measurement):
+            return None
+        return self.finish_fit(measurement)
+
+    def fit_profile(self, fixed=None, initial=None, moments_only=False):
+        """Fit the position, without errors
+
+        This is the first half of fit(): the errors of the measurement may
+        then be calculated along with those of other islands, before it is
+        handed to finish_fit(). Returns None if fitting failed.
+        """
         try:
-            measurement, gauss_residual = source_profile_and_errors(
-                self.data, self.threshold(), self.noise(), self.beam, fixed=fixed
+            return source_profile(
+                self.data, self.threshold(), self.noise(), self.beam,
+                fixed=fixed, initial=initial, moments_only=moments_only
             )
         except ValueError:
-            # Fitting failed
-            logger.error("Moments & Gaussian fitting failed at %s" % (str(self.position)))
+            self.fit_failed()
             return None
+
+    def calculate_errors(self, measurement):
+        """Calculate the errors and deconvolved shape of a measurement from
+        fit_profile(). Returns False if it cannot be deconvolved."""
+        measurement.calculate_errors(self.noise(), self.beam,
+                                     self.threshold())
+        try:
+            measurement.deconvolve_from_clean_beam(self.beam)
+        except ValueError:
+            self.fit_failed()
+            return False
+        return True
+
+    def fit_failed(self):
+        logger.error("Moments & Gaussian fitting failed at %s" % (str(self.position)))
+
+    def finish_fit(self, measurement):
+        """Complete a measurement from fit_profile(), the errors of which
+        have been calculated, as fit() would return it"""
+        gauss_residual = source_residuals(measurement, self.data,
+                                          self.noise(), self.beam)
         measurement["xbar"] += self.position[0]
         measurement["ybar"] += self.position[1]
         measurement.sig = self.sig()
@@ -308,303 +419,449 @@ class ParamSet(DictMixin):
         """Returns the errors on parameters from Gaussian fits according to
         the Condon (PASP 109, 166 (1997)) formulae.
 
-        These formulae are not perfect, but we'll use them for the
-        time being.  (See Refregier and Brown (astro-ph/9803279v1) for
-        a more rigorous approach.) It also returns the corrected peak.
-        The peak is corrected for the overestimate due to the local
-        noise gradient.
+        See condon_formulae_many(), of which this is the single source
+        case. It also returns the corrected peak.
         """
-        peak = self['peak'].value
-        flux = self['flux'].value
-        smaj = self['semimajor'].value
-        smin = self['semiminor'].value
-        theta = self['theta'].value
-
-        theta_B, theta_b = utils.calculate_correlation_lengths(
-            beam[0], beam[1])
-
-        rho_sq1 = ((smaj*smin/(theta_B*theta_b)) *
-                   (1.+(theta_B/(2.*smaj))**2)**self.alpha_maj1 *
-                   (1.+(theta_b/(2.*smin))**2)**self.alpha_min1 *
-                   (peak/noise)**2)
-        rho_sq2 = ((smaj*smin/(theta_B*theta_b)) *
-                   (1.+(theta_B/(2.*smaj))**2)**self.alpha_maj2 *
-                   (1.+(theta_b/(2.*smin))**2)**self.alpha_min2 *
-                   (peak/noise)**2)
-        rho_sq3 = ((smaj*smin/(theta_B*theta_b)) *
-                   (1.+(theta_B/(2.*smaj))**2)**self.alpha_maj3 *
-                   (1.+(theta_b/(2.*smin))**2)**self.alpha_min3 *
-                   (peak/noise)**2)
-
-        rho1 = numpy.sqrt(rho_sq1)
-        rho2 = numpy.sqrt(rho_sq2)
-        rho3 = numpy.sqrt(rho_sq3)
-
-        denom1 = numpy.sqrt(2.*numpy.log(2.)) * rho1
-        denom2 = numpy.sqrt(2.*numpy.log(2.)) * rho2
-
-        # Here you get the errors parallel to the fitted semi-major and
-        # semi-minor axes as taken from the NVSS paper (Condon et al. 1998,
-        # AJ, 115, 1693), formula 25.
-        # Those variances are twice the theoreticals, so the errors in
-        # position are sqrt(2) as large as one would get from formula 21
-        # of the Condon (1997) paper.
-        error_par_major = 2.*smaj/denom1
-        error_par_minor = 2.*smin/denom2
-
-        # When these errors are converted to RA and Dec,
-        # calibration uncertainties will have to be added,
-        # like in formulae 27 of the NVSS paper.
-        errorx = numpy.sqrt((error_par_major * numpy.sin(theta))**2 +
-                            (error_par_minor * numpy.cos(theta))**2)
-        errory = numpy.sqrt((error_par_major * numpy.cos(theta))**2 +
-                            (error_par_minor * numpy.sin(theta))**2)
-
-        # Note that we report errors in HWHM axes instead of FWHM axes
-        # so the errors are half the errors of formula 29 of the NVSS paper.
-        errorsmaj = numpy.sqrt(2) * smaj / rho1
-        errorsmin = numpy.sqrt(2) * smin / rho2
-
-        if smaj > smin:
-            errortheta = 2.0 * (smaj*smin/(smaj**2-smin**2))/rho2
-        else:
-            errortheta = numpy.pi
-        if errortheta > numpy.pi:
-            errortheta = numpy.pi
+        condon_formulae_many([self], [noise], beam)
+        return self
+
+    def _error_bars_from_moments(self, noise, beam, threshold):
+        """Provide reasonable error estimates from the moments
 
-        peak += -noise**2/peak + self.clean_bias
+        See error_bars_from_moments_many(), of which this is the single
+        source case.
+        """
+        error_bars_from_moments_many([self], [noise], beam, [threshold])
+        return self
 
-        errorpeaksq = ((self.frac_flux_cal_error * peak)**2 +
-                       self.clean_bias_error**2 +
-                       2. * peak**2 / rho_sq3)
+    def deconvolve_from_clean_beam(self, beam):
+        """Deconvolve with the clean beam
 
-        errorpeak = numpy.sqrt(errorpeaksq)
+        See deconvolve_from_clean_beam_many(), of which this is the single
+        source case.
+        """
+        deconvolve_from_clean_beam_many([self], beam)
+        return self
 
-        help1 = (errorsmaj/smaj)**2
-        help2 = (errorsmin/smin)**2
-        help3 = theta_B * theta_b / (4. * smaj * smin)
-        errorflux = numpy.abs(flux)*numpy.sqrt(errorpeaksq/peak**2+help3*(help1+help2))
 
-        self['peak'] = Uncertain(peak, errorpeak)
-        self['flux'].error = errorflux
-        self['xbar'].error = errorx
-        self['ybar'].error = errory
-        self['semimajor'].error = errorsmaj
-        self['semiminor'].error = errorsmin
-        self['theta'].error = errortheta
+def _columns(params, *names):
+    """The values of names over each of params, as UncertainArray"""
+    return [UncertainArray.from_uncertains(param[name] for param in params)
+            for name in names]
 
-        return self
 
-    def _error_bars_from_moments(self, noise, beam, threshold):
-        """Provide reasonable error estimates from the moments"""
-
-        # The formulae below should give some reasonable estimate of the
-        # errors from moments, should always be higher than the errors from
-        # Gauss fitting.
-        peak = self['peak'].value
-        flux = self['flux'].value
-        smaj = self['semimajor'].value
-        smin = self['semiminor'].value
-        theta = self['theta'].value
-
-        # This analysis is only possible if the peak flux is >= 0. This
-        # follows from the definition of eq. 2.81 in Spreeuw's thesis. In that
-        # situation, we set all errors to be infinite
-        if peak < 0:
-            self['peak'].error = float('inf')
-            self['flux'].error = float('inf')
-            self['semimajor'].error = float('inf')
-            self['semiminor'].error = float('inf')
-            self['theta'].error = float('inf')
-            return self
+def _attributes(params, *names):
+    """The attributes names of each of params, as arrays"""
+    return [numpy.array([getattr(param, name) for param in params],
+                        dtype=float)
+            for name in names]
+
+
+def _store(params, name, value=None, error=None):
+    """Set the value and/or error of name in each of params from arrays"""
+    for index, param in enumerate(params):
+        if value is not None:
+            param[name].value = value[index]
+        if error is not None:
+            param[name].error = error[index]
+
+
+def calculate_errors_many(params, noise, beam, threshold):
+    """Calculate the errors of many ParamSets at once
 
-        clean_bias_error = self.clean_bias_error
-        frac_flux_cal_error = self.frac_flux_cal_error
-        theta_B, theta_b = utils.calculate_correlation_lengths(
-            beam[0], beam[1])
+    The batch version of ParamSet.calculate_errors(): the errors of those
+    params based on a Gaussian fit come from condon_formulae_many(), those
+    of params based on moments from error_bars_from_moments_many().
 
+    Args:
+
+        params (list): ParamSet instances.
+
+        noise (list): noise level of each of params.
+
+        beam (tuple): beam parameters (semimaj, semimin, theta).
+
+        threshold (list): threshold used for selecting the pixels of each of
+            params; None is taken as zero.
+    """
+    gaussian = [index for index, param in enumerate(params) if param.gaussian]
+    moments = [index for index, param in enumerate(params)
+               if param.moments and not param.gaussian]
+    condon_formulae_many([params[index] for index in gaussian],
+                         [noise[index] for index in gaussian], beam)
+    error_bars_from_moments_many(
+        [params[index] for index in moments],
+        [noise[index] for index in moments], beam,
+        [threshold[index] or 0 for index in moments])
+
+
+def condon_formulae_many(params, noise, beam):
+    """Set the errors on parameters from Gaussian fits of many ParamSets
+    according to the Condon (PASP 109, 166 (1997)) formulae.
+
+    These formulae are not perfect, but we'll use them for the
+    time being.  (See Refregier and Brown (astro-ph/9803279v1) for
+    a more rigorous approach.) It also sets the corrected peak.
+    The peak is corrected for the overestimate due to the local
+    noise gradient.
+
+    The errors of all params are calculated at once, elementwise, and are
+    the same as ParamSet._condon_formulae() gives for each.
+
+    Args:
+
+        params (list): ParamSet instances, based on Gaussian fits.
+
+        noise (list): noise level of each of params.
+
+        beam (tuple): beam parameters (semimaj, semimin, theta).
+    """
+    params = list(params)
+    if not params:
+        return
+    peak, flux, smaj, smin, theta = (
+        column.value for column in _columns(
+            params, 'peak', 'flux', 'semimajor', 'semiminor', 'theta'))
+    noise = numpy.asarray(noise, dtype=float)
+    (clean_bias, clean_bias_error, frac_flux_cal_error, alpha_maj1,
+     alpha_min1, alpha_maj2, alpha_min2, alpha_maj3, alpha_min3) = _attributes(
+        params, 'clean_bias', 'clean_bias_error', 'frac_flux_cal_error',
+        'alpha_maj1', 'alpha_min1', 'alpha_maj2', 'alpha_min2',
+        'alpha_maj3', 'alpha_min3')
+
+    theta_B, theta_b = utils.calculate_correlation_lengths(
+        beam[0], beam[1])
+
+    # numpy.power() throughout, rather than the ** operator, which takes
+    # shortcuts for some exponents on arrays and so would not give exactly
+    # the values of the scalar formulae.
+    power = numpy.power
+    rho_sq1 = ((smaj*smin/(theta_B*theta_b)) *
+               power(1.+power(theta_B/(2.*smaj), 2), alpha_maj1) *
+               power(1.+power(theta_b/(2.*smin), 2), alpha_min1) *
+               power(peak/noise, 2))
+    rho_sq2 = ((smaj*smin/(theta_B*theta_b)) *
+               power(1.+power(theta_B/(2.*smaj), 2), alpha_maj2) *
+               power(1.+power(theta_b/(2.*smin), 2), alpha_min2) *
+               power(peak/noise, 2))
+    rho_sq3 = ((smaj*smin/(theta_B*theta_b)) *
+               power(1.+power(theta_B/(2.*smaj), 2), alpha_maj3) *
+               power(1.+power(theta_b/(2.*smin), 2), alpha_min3) *
+               power(peak/noise, 2))
+
+    rho1 = numpy.sqrt(rho_sq1)
+    rho2 = numpy.sqrt(rho_sq2)
+    rho3 = numpy.sqrt(rho_sq3)
+
+    denom1 = numpy.sqrt(2.*numpy.log(2.)) * rho1
+    denom2 = numpy.sqrt(2.*numpy.log(2.)) * rho2
+
+    # Here you get the errors parallel to the fitted semi-major and
+    # semi-minor axes as taken from the NVSS paper (Condon et al. 1998,
+    # AJ, 115, 1693), formula 25.
+    # Those variances are twice the theoreticals, so the errors in
+    # position are sqrt(2) as large as one would get from formula 21
+    # of the Condon (1997) paper.
+    error_par_major = 2.*smaj/denom1
+    error_par_minor = 2.*smin/denom2
+
+    # When these errors are converted to RA and Dec,
+    # calibration uncertainties will have to be added,
+    # like in formulae 27 of the NVSS paper.
+    errorx = numpy.sqrt(power(error_par_major * numpy.sin(theta), 2) +
+                        power(error_par_minor * numpy.cos(theta), 2))
+    errory = numpy.sqrt(power(error_par_major * numpy.cos(theta), 2) +
+                        power(error_par_minor * numpy.sin(theta), 2))
+
+    # Note that we report errors in HWHM axes instead of FWHM axes
+    # so the errors are half the errors of formula 29 of the NVSS paper.
+    errorsmaj = numpy.sqrt(2) * smaj / rho1
+    errorsmin = numpy.sqrt(2) * smin / rho2
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        errortheta = numpy.where(
+            smaj > smin,
+            2.0 * (smaj*smin/(power(smaj, 2)-power(smin, 2)))/rho2,
+            numpy.pi)
+    errortheta = numpy.where(errortheta > numpy.pi, numpy.pi, errortheta)
+
+    peak = peak + (-power(noise, 2)/peak + clean_bias)
+
+    errorpeaksq = (power(frac_flux_cal_error * peak, 2) +
+                   power(clean_bias_error, 2) +
+                   2. * power(peak, 2) / rho_sq3)
+
+    errorpeak = numpy.sqrt(errorpeaksq)
+
+    help1 = power(errorsmaj/smaj, 2)
+    help2 = power(errorsmin/smin, 2)
+    help3 = theta_B * theta_b / (4. * smaj * smin)
+    errorflux = numpy.abs(flux)*numpy.sqrt(
+        errorpeaksq/power(peak, 2)+help3*(help1+help2))
+
+    for param, value, error in zip(params, peak, errorpeak):
+        param['peak'] = Uncertain(value, error)
+    _store(params, 'flux', error=errorflux)
+    _store(params, 'xbar', error=errorx)
+    _store(params, 'ybar', error=errory)
+    _store(params, 'semimajor', error=errorsmaj)
+    _store(params, 'semiminor', error=errorsmin)
+    _store(params, 'theta', error=errortheta)
+
+
+def error_bars_from_moments_many(params, noise, beam, threshold):
+    """Set reasonable error estimates from the moments of many ParamSets
+
+    The errors of all params are calculated at once, elementwise, and are
+    the same as ParamSet._error_bars_from_moments() gives for each.
+
+    Args:
+
+        params (list): ParamSet instances, based on moments.
+
+        noise (list): noise level of each of params.
+
+        beam (tuple): beam parameters (semimaj, semimin, theta).
+
+        threshold (list): threshold used for selecting the pixels of each of
+            params.
+    """
+    params = list(params)
+    if not params:
+        return
+    # The formulae below should give some reasonable estimate of the
+    # errors from moments, should always be higher than the errors from
+    # Gauss fitting.
+    peak, flux, smaj, smin, theta = (
+        column.value for column in _columns(
+            params, 'peak', 'flux', 'semimajor', 'semiminor', 'theta'))
+    noise = numpy.asarray(noise, dtype=float)
+    threshold = numpy.asarray(threshold, dtype=float)
+    clean_bias_error, frac_flux_cal_error = _attributes(
+        params, 'clean_bias_error', 'frac_flux_cal_error')
+    theta_B, theta_b = utils.calculate_correlation_lengths(
+        beam[0], beam[1])
+    power = numpy.power
+
+    # This analysis is only possible if the peak flux is >= 0. This
+    # follows from the definition of eq. 2.81 in Spreeuw's thesis. In that
+    # situation, we set all errors to be infinite, except for the position.
+    with numpy.errstate(divide='ignore', invalid='ignore'):
         # This is eq. 2.81 from Spreeuw's thesis.
         rho_sq = ((16. * smaj * smin /
-                  (numpy.log(2.) * theta_B * theta_b*noise**2))
-                  * ((peak - threshold) /
-                     (numpy.log(peak) - numpy.log(threshold)))**2)
-
-        rho = numpy.sqrt(rho_sq)
-        denom = numpy.sqrt(2.*numpy.log(2.))*rho
-
-        # Again, like above for the Condon formulae, we set the
-        # positional variances to twice the theoretical values.
-        error_par_major = 2. * smaj / denom
-        error_par_minor = 2. * smin / denom
-
-        # When these errors are converted to RA and Dec,
-        # calibration uncertainties will have to be added,
-        # like in formulae 27 of the NVSS paper.
-        errorx = numpy.sqrt((error_par_major * numpy.sin(theta))**2
-                            + (error_par_minor * numpy.cos(theta))**2)
-        errory = numpy.sqrt((error_par_major * numpy.cos(theta))**2
-                            + (error_par_minor * numpy.sin(theta))**2)
-
-        # Note that we report errors in HWHM axes instead of FWHM axes
-        # so the errors are half the errors of formula 29 of the NVSS paper.
-        errorsmaj = numpy.sqrt(2) * smaj / rho
-        errorsmin = numpy.sqrt(2) * smin / rho
-
-        if smaj > smin:
-            errortheta = 2.0 * (smaj * smin / (smaj**2 -smin**2)) / rho
-        else:
-            errortheta = numpy.pi
-        if errortheta > numpy.pi:
-            errortheta = numpy.pi
-
-        # The peak from "moments" is just the value of the maximum pixel
-        # times a correction, fudge_max_pix, for the fact that the
-        # centre of the Gaussian is not at the centre of the pixel.
-        # This correction is performed in fitting.py. The maximum pixel
-        # method introduces a peak dependent error corresponding to the last
-        # term in the expression below for errorpeaksq.
-        # To this, we add, in quadrature, the errors corresponding
-        # to the first and last term of the rhs of equation 37 of the
-        # NVSS paper. The middle term in that equation 37 is heuristically
-        # replaced by noise**2 since the threshold should not affect
-        # the error from the (corrected) maximum pixel method,
-        # while it is part of the expression for rho_sq above.
-        errorpeaksq = ((frac_flux_cal_error*peak)**2 +
-                       clean_bias_error**2+noise**2 +
-                       utils.maximum_pixel_method_variance(
-            beam[0], beam[1], beam[2])*peak**2)
-        errorpeak = numpy.sqrt(errorpeaksq)
-
-        help1 = (errorsmaj/smaj)**2
-        help2 = (errorsmin/smin)**2
-        help3 = theta_B*theta_b/(4.*smaj*smin)
-        errorflux = flux*numpy.sqrt(errorpeaksq/peak**2+help3*(help1+help2))
-
-        self['peak'].error = errorpeak
-        self['flux'].error = errorflux
-        self['xbar'].error = errorx
-        self['ybar'].error = errory
-        self['semimajor'].error = errorsmaj
-        self['semiminor'].error = errorsmin
-        self['theta'].error = errortheta
+                  (numpy.log(2.) * theta_B * theta_b*power(noise, 2)))
+                  * power((peak - threshold) /
+                          (numpy.log(peak) - numpy.log(threshold)), 2))
+
+    rho = numpy.sqrt(rho_sq)
+    denom = numpy.sqrt(2.*numpy.log(2.))*rho
+
+    # Again, like above for the Condon formulae, we set the
+    # positional variances to twice the theoretical values.
+    error_par_major = 2. * smaj / denom
+    error_par_minor = 2. * smin / denom
+
+    # When these errors are converted to RA and Dec,
+    # calibration uncertainties will have to be added,
+    # like in formulae 27 of the NVSS paper.
+    errorx = numpy.sqrt(power(error_par_major * numpy.sin(theta), 2)
+                        + power(error_par_minor * numpy.cos(theta), 2))
+    errory = numpy.sqrt(power(error_par_major * numpy.cos(theta), 2)
+                        + power(error_par_minor * numpy.sin(theta), 2))
+
+    # Note that we report errors in HWHM axes instead of FWHM axes
+    # so the errors are half the errors of formula 29 of the NVSS paper.
+    errorsmaj = numpy.sqrt(2) * smaj / rho
+    errorsmin = numpy.sqrt(2) * smin / rho
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        errortheta = numpy.where(
+            smaj > smin,
+            2.0 * (smaj * smin / (power(smaj, 2) - power(smin, 2))) / rho,
+            numpy.pi)
+    errortheta = numpy.where(errortheta > numpy.pi, numpy.pi, errortheta)
+
+    # The peak from "moments" is just the value of the maximum pixel
+    # times a correction, fudge_max_pix, for the fact that the
+    # centre of the Gaussian is not at the centre of the pixel.
+    # This correction is performed in fitting.py. The maximum pixel
+    # method introduces a peak dependent error corresponding to the last
+    # term in the expression below for errorpeaksq.
+    # To this, we add, in quadrature, the errors corresponding
+    # to the first and last term of the rhs of equation 37 of the
+    # NVSS paper. The middle term in that equation 37 is heuristically
+    # replaced by noise**2 since the threshold should not affect
+    # the error from the (corrected) maximum pixel method,
+    # while it is part of the expression for rho_sq above.
+    errorpeaksq = (power(frac_flux_cal_error*peak, 2) +
+                   power(clean_bias_error, 2)+power(noise, 2) +
+                   utils.maximum_pixel_method_variance(
+        beam[0], beam[1], beam[2])*power(peak, 2))
+    errorpeak = numpy.sqrt(errorpeaksq)
+
+    help1 = power(errorsmaj/smaj, 2)
+    help2 = power(errorsmin/smin, 2)
+    help3 = theta_B*theta_b/(4.*smaj*smin)
+    errorflux = flux*numpy.sqrt(errorpeaksq/power(peak, 2)+help3*(help1+help2))
+
+    negative = peak < 0
+    for error in (errorpeak, errorflux, errorsmaj, errorsmin, errortheta):
+        error[negative] = float('inf')
+    positive = [param for param, neg in zip(params, negative) if not neg]
+    _store(params, 'peak', error=errorpeak)
+    _store(params, 'flux', error=errorflux)
+    _store(positive, 'xbar', error=errorx[~negative])
+    _store(positive, 'ybar', error=errory[~negative])
+    _store(params, 'semimajor', error=errorsmaj)
+    _store(params, 'semiminor', error=errorsmin)
+    _store(params, 'theta', error=errortheta)
+
+
+def deconvolve_from_clean_beam_many(params, beam):
+    """Deconvolve many ParamSets with the clean beam
+
+    The deconvolved shapes and their errors are calculated for all params
+    at once, and are the same as ParamSet.deconvolve_from_clean_beam()
+    gives for each.
 
-        return self
+    Args:
 
-    def deconvolve_from_clean_beam(self, beam):
-        """Deconvolve with the clean beam"""
-
-        # If the fitted axes are smaller than the clean beam
-        # (=restoring beam) axes, the axes and position angle
-        # can be deconvolved from it.
-        fmaj = 2.*self['semimajor'].value
-        fmajerror = 2.*self['semimajor'].error
-        fmin = 2.*self['semiminor'].value
-        fminerror = 2.*self['semiminor'].error
-        fpa = numpy.degrees(self['theta'].value)
-        fpaerror = numpy.degrees(self['theta'].error)
-        cmaj = 2.*beam[0]
-        cmin = 2.*beam[1]
-        cpa = numpy.degrees(beam[2])
-
-        rmaj, rmin, rpa, ierr = deconv(fmaj, fmin, fpa, cmaj, cmin, cpa)
+        params (list): ParamSet instances, with errors calculated.
+
+        beam (tuple): beam parameters (semimaj, semimin, theta).
+
+    Raises:
+
+        ValueError: if any of params cannot be deconvolved (as when an
+            error is infinite). None of params is changed then.
+    """
+    params = list(params)
+    if not params:
+        return
+    smaj, smin, theta = _columns(params, 'semimajor', 'semiminor', 'theta')
+
+    # If the fitted axes are smaller than the clean beam
+    # (=restoring beam) axes, the axes and position angle
+    # can be deconvolved from it.
+    fmaj = 2.*smaj.value
+    fmajerror = 2.*smaj.error
+    fmin = 2.*smin.value
+    fminerror = 2.*smin.error
+    fpa = numpy.degrees(theta.value)
+    fpaerror = numpy.degrees(theta.error)
+    cmaj = 2.*beam[0]
+    cmin = 2.*beam[1]
+    cpa = numpy.degrees(beam[2])
+
+    rmaj, rmin, rpa, ierr = deconv_many(fmaj, fmin, fpa, cmaj, cmin, cpa)
+
+    def in_range(angle):
+        # For convenience we reset angles to the interval [-90, 90].
+        return numpy.where(angle > 90, -numpy.mod(-angle, 180.), angle)
+
+    def angle_error(angle, ierr):
+        angle_error = numpy.abs(in_range(angle) - rpa_def)
+        # An angle error can never be more than 90 degrees.
+        angle_error = numpy.where(angle_error > 90.,
+                                  numpy.mod(-angle_error, 180.), angle_error)
+        return numpy.where(ierr < 2, angle_error, numpy.nan)
+
+    def mean(first, second):
+        # As numpy.mean([first, second]).
+        return (first + second) / 2.
+
+    # Error bars can be figured out where the deconvolved major axis, and
+    # so the position angle, is defined.
+    defined = numpy.flatnonzero(rmaj > 0)
+    fmaj_def, fmajerror_def = fmaj[defined], fmajerror[defined]
+    fmin_def, fminerror_def = fmin[defined], fminerror[defined]
+    fpa_def, fpaerror_def = fpa[defined], fpaerror[defined]
+    rmaj_def, rmin_def = rmaj[defined], rmin[defined]
+    rpa_def = in_range(rpa[defined])
+
+    # In the general case, where the restoring beam is elliptic,
+    # calculating the error bars of the deconvolved position angle
+    # is more complicated than in the NVSS case, where a circular
+    # restoring beam was used.
+    # In the NVSS case the error bars of the deconvolved angle are
+    # equal to the fitted angle.
+    rmaj1, rmin1, rpa1, ierr1 = deconv_many(
+        fmaj_def, fmin_def, fpa_def+fpaerror_def, cmaj, cmin, cpa)
+    rpaerror1 = angle_error(rpa1, ierr1)
+    rmaj2, rmin2, rpa2, ierr2 = deconv_many(
+        fmaj_def, fmin_def, fpa_def-fpaerror_def, cmaj, cmin, cpa)
+    rpaerror2 = angle_error(rpa2, ierr2)
+    either_nan = numpy.isnan(rpaerror1) | numpy.isnan(rpaerror2)
+    rpaerror = numpy.where(
+        either_nan,
+        # As numpy.nansum([rpaerror1, rpaerror2]).
+        numpy.where(numpy.isnan(rpaerror1), 0., rpaerror1) +
+        numpy.where(numpy.isnan(rpaerror2), 0., rpaerror2),
+        mean(rpaerror1, rpaerror2))
+
+    rmaj3 = deconv_many(
+        fmaj_def + fmajerror_def, fmin_def, fpa_def, cmaj, cmin, cpa)[0]
+    # If rmaj>0, then rmaj3 should also be > 0,
+    # if I am not mistaken, see the formulas at
+    # the end of ch.2 of Spreeuw's Ph.D. thesis.
+    # Where the major axis less its error is no longer the major axis, the
+    # two are swapped, and the second axis returned is taken.
+    rmaj4 = numpy.empty(len(defined))
+    major = fmaj_def-fmajerror_def > fmin_def
+    rmaj4[major] = deconv_many(
+        fmaj_def[major]-fmajerror_def[major], fmin_def[major],
+        fpa_def[major], cmaj, cmin, cpa)[0]
+    rmaj4[~major] = deconv_many(
+        fmin_def[~major], fmaj_def[~major] - fmajerror_def[~major],
+        fpa_def[~major], cmaj, cmin, cpa)[1]
+    rmajerror = numpy.where(
+        rmaj4 > 0,
+        mean(numpy.abs(rmaj3-rmaj_def), numpy.abs(rmaj_def - rmaj4)),
+        numpy.abs(rmaj3 - rmaj_def))
+
+    # The deconvolved minor axis is defined in only some of those.
+    minor = numpy.flatnonzero(rmin_def > 0)
+    fmaj_min, fmin_min = fmaj_def[minor], fmin_def[minor]
+    fminerror_min, fpa_min = fminerror_def[minor], fpa_def[minor]
+    rmin_min = rmin_def[minor]
+    rmin5 = numpy.empty(len(minor))
+    smaller = fmin_min + fminerror_min < fmaj_min
+    rmin5[smaller] = deconv_many(
+        fmaj_min[smaller], fmin_min[smaller]+fminerror_min[smaller],
+        fpa_min[smaller], cmaj, cmin, cpa)[1]
+    rmin5[~smaller] = deconv_many(
+        fmin_min[~smaller]+fminerror_min[~smaller], fmaj_min[~smaller],
+        fpa_min[~smaller], cmaj, cmin, cpa)[0]
+    # If rmin > 0, then rmin5 should also be > 0,
+    # if I am not mistaken, see the formulas at
+    # the end of ch.2 of Spreeuw's Ph.D. thesis.
+    rmin6 = deconv_many(
+        fmaj_min, fmin_min-fminerror_min, fpa_min, cmaj, cmin, cpa)[1]
+    rminerror = numpy.where(
+        rmin6 > 0,
+        mean(numpy.abs(rmin6-rmin_min), numpy.abs(rmin5 - rmin_min)),
+        numpy.abs(rmin5 - rmin_min))
+
+    # Undefined values and errors are NaN.
+    theta_deconv = numpy.full((2, len(params)), numpy.nan)
+    semimaj_deconv = numpy.full((2, len(params)), numpy.nan)
+    semimin_deconv = numpy.full((2, len(params)), numpy.nan)
+    theta_deconv[:, defined] = rpa_def, rpaerror
+    semimaj_deconv[:, defined] = rmaj_def / 2., rmajerror
+    semimin_deconv[:, defined[minor]] = rmin_min / 2., rminerror
+
+    for param, my_ierr in zip(params, ierr):
         # This parameter gives the number of components that could not be
         # deconvolved, IERR from deconf.f.
-        self.deconv_imposs = ierr
-        # Now, figure out the error bars.
-        if rmaj > 0:
-            # In this case the deconvolved position angle is defined.
-            # For convenience we reset rpa to the interval [-90, 90].
-            if rpa > 90:
-                rpa = -numpy.mod(-rpa, 180.)
-            self['theta_deconv'].value = rpa
-
-            # In the general case, where the restoring beam is elliptic,
-            # calculating the error bars of the deconvolved position angle
-            # is more complicated than in the NVSS case, where a circular
-            # restoring beam was used.
-            # In the NVSS case the error bars of the deconvolved angle are
-            # equal to the fitted angle.
-            rmaj1, rmin1, rpa1, ierr1 = deconv(
-                fmaj, fmin, fpa+fpaerror, cmaj, cmin, cpa)
-            if ierr1 < 2:
-                if rpa1 > 90:
-                    rpa1 = -numpy.mod(-rpa1, 180.)
-                rpaerror1 = numpy.abs(rpa1-rpa)
-                # An angle error can never be more than 90 degrees.
-                if rpaerror1 > 90.:
-                    rpaerror1 = numpy.mod(-rpaerror1, 180.)
-            else:
-                rpaerror1 = numpy.nan
-            rmaj2, rmin2, rpa2, ierr2 = deconv(
-                fmaj, fmin, fpa-fpaerror, cmaj, cmin, cpa)
-            if ierr2 < 2:
-                if rpa2 > 90:
-                    rpa2 = -numpy.mod(-rpa2, 180.)
-                rpaerror2 = numpy.abs(rpa2 - rpa)
-                # An angle error can never be more than 90 degrees.
-                if rpaerror2 > 90.:
-                    rpaerror2 = numpy.mod(-rpaerror2, 180.)
-            else:
-                rpaerror2 = numpy.nan
-            if numpy.isnan(rpaerror1) or numpy.isnan(rpaerror2):
-                self['theta_deconv'].error = numpy.nansum(
-                    [rpaerror1, rpaerror2])
-            else:
-                self['theta_deconv'].error = numpy.mean(
-                    [rpaerror1, rpaerror2])
-            self['semimaj_deconv'].value = rmaj / 2.
-            rmaj3, rmin3, rpa3, ierr3 = deconv(
-                fmaj + fmajerror, fmin, fpa, cmaj, cmin, cpa)
-            # If rmaj>0, then rmaj3 should also be > 0,
-            # if I am not mistaken, see the formulas at
-            # the end of ch.2 of Spreeuw's Ph.D. thesis.
-            if fmaj-fmajerror > fmin:
-                rmaj4, rmin4, rpa4, ierr4 = deconv(
-                    fmaj-fmajerror, fmin, fpa, cmaj, cmin, cpa)
-                if rmaj4 > 0:
-                    self['semimaj_deconv'].error = numpy.mean(
-                        [numpy.abs(rmaj3-rmaj), numpy.abs(rmaj - rmaj4)])
-                else:
-                    self['semimaj_deconv'].error = numpy.abs(rmaj3 - rmaj)
-            else:
-                rmin4, rmaj4, rpa4, ierr4 = deconv(
-                    fmin, fmaj - fmajerror, fpa, cmaj, cmin, cpa)
-                if rmaj4>0:
-                    self['semimaj_deconv'].error = numpy.mean(
-                        [numpy.abs(rmaj3-rmaj), numpy.abs(rmaj - rmaj4)])
-                else:
-                    self['semimaj_deconv'].error = numpy.abs(rmaj3 - rmaj)
-            if rmin > 0:
-                self['semimin_deconv'].value = rmin / 2.
-                if fmin + fminerror < fmaj:
-                    rmaj5, rmin5, rpa5, ierr5 = deconv(
-                        fmaj, fmin+fminerror, fpa, cmaj, cmin, cpa)
-                else:
-                    rmin5, rmaj5, rpa5, ierr5 = deconv(
-                        fmin+fminerror, fmaj, fpa, cmaj, cmin, cpa)
-                # If rmin > 0, then rmin5 should also be > 0,
-                # if I am not mistaken, see the formulas at
-                # the end of ch.2 of Spreeuw's Ph.D. thesis.
-                rmaj6, rmin6, rpa6, ierr6 = deconv(
-                    fmaj, fmin-fminerror, fpa, cmaj, cmin, cpa)
-                if rmin6 > 0:
-                    self['semimin_deconv'].error = numpy.mean(
-                        [numpy.abs(rmin6-rmin), numpy.abs(rmin5 - rmin)])
-                else:
-                    self['semimin_deconv'].error = numpy.abs(rmin5 - rmin)
-            else:
-                self['semimin_deconv'] = Uncertain(
-                    numpy.nan, numpy.nan)
-        else:
-            self['semimaj_deconv'] = Uncertain(numpy.nan, numpy.nan)
-            self['semimin_deconv'] = Uncertain(numpy.nan, numpy.nan)
-            self['theta_deconv'] = Uncertain(numpy.nan, numpy.nan)
-
-        return self
+        param.deconv_imposs = int(my_ierr)
+    _store(params, 'theta_deconv', *theta_deconv)
+    _store(params, 'semimaj_deconv', *semimaj_deconv)
+    _store(params, 'semimin_deconv', *semimin_deconv)
 
 
 def source_profile_and_errors(data, threshold, noise,
-                              beam, fixed=None):
+                              beam, fixed=None, initial=None,
+                              moments_only=False, prior=None):
     """Return a number of measurable properties with errorbars
 
     Given an island of pixels it will return a number of measurable
@@ -636,13 +893,45 @@ def source_profile_and_errors(data, threshold, noise,
         fixed (dict): Parameters (and their values) to hold fixed while fitting.
             Passed on to fitting.fitgaussian().
 
+        initial (dict): the moments of data, if already calculated by
+            fitting.moments_many(); False if they could not be.
+
+        moments_only (bool): measure the source by its moments alone,
+            skipping the Gauss fit, if the moments can be calculated.
+            Parameters in fixed then simply take the given values. Meant
+            for compact, unresolved sources, where the fit adds little.
+
+        prior (dict): values for (some of) the fitted parameters, such as
+            those of a previous measurement of the same source, from which
+            to start the Gauss fit rather than from the moments. The
+            moments remain the fallback if the fit fails.
+
     Returns:
         tuple: a populated ParamSet, and a residuals map.
             Note the residuals map is a regular ndarray, where masked (unfitted)
             regions have been filled with 0-values.
 
     """
+    param = source_profile(data, threshold, noise, beam, fixed=fixed,
+                           initial=initial, moments_only=moments_only,
+                           prior=prior)
+    param.calculate_errors(noise, beam, threshold)
+    param.deconvolve_from_clean_beam(beam)
+    return param, source_residuals(param, data, noise, beam)
 
+
+def source_profile(data, threshold, noise, beam, fixed=None, initial=None,
+                   moments_only=False, prior=None):
+    """Return a number of measurable properties, without errorbars
+
+    This is the fitting part of source_profile_and_errors(), which takes
+    the same arguments. The errorbars and deconvolved shape may then be
+    calculated for many sources at once, with calculate_errors_many() and
+    deconvolve_from_clean_beam_many(), before source_residuals().
+
+    Returns:
+        ParamSet: the fitted parameters.
+    """
     if fixed is None:
         fixed = {}
     param = ParamSet()
@@ -652,10 +941,16 @@ def source_profile_and_errors(data, threshold, noise,
     else:
         moments_threshold = threshold
 
-    try:
-        param.update(fitting.moments(data, beam, moments_threshold))
+    if initial is None:
+        try:
+            initial = fitting.moments(data, beam, moments_threshold)
+        except ValueError:
+            initial = False
+
+    if initial:
+        param.update(initial)
         param.moments = True
-    except ValueError:
+    else:
         # If this happens, we have two choices:
         # 1) Bomb out and tell the user to fit something sensible instead;
         # 2) Make up our own estimate (all 1s or something) to give the
@@ -679,27 +974,56 @@ def source_profile_and_errors(data, threshold, noise,
     ymin = min(ranges[1])
     ymax = max(ranges[1])
 
-    if (numpy.fabs(xmax-xmin) > 2) and (numpy.fabs(ymax-ymin) > 2):
+    if moments_only and param.moments:
+        # The moments will do; anything fixed simply takes its given value.
+        param.update(fixed)
+        logger.debug('Skipped Gauss fitting of compact source.')
+    elif (numpy.fabs(xmax-xmin) > 2) and (numpy.fabs(ymax-ymin) > 2):
         # Now we can do Gauss fitting if the island or subisland has a
         # thickness of more than 2 in both dimensions.
-        try:
-            gaussian_soln = fitting.fitgaussian(data, param, fixed=fixed)
+        starts = [param]
+        if prior:
+            # Should the fit from the prior fail, or run off to a solution
+            # which is not finite, try again from the moments.
+            start = dict(param.items())
+            start.update(prior)
+            starts.insert(0, start)
+        for start in starts:
+            try:
+                gaussian_soln = fitting.fitgaussian(data, start, fixed=fixed)
+            except ValueError:
+                logger.warn('Gauss fitting failed.')
+                continue
+            if (start is not param and
+                    not numpy.isfinite(gaussian_soln.values()).all()):
+                logger.debug('Gauss fitting from prior diverged.')
+                continue
             param.update(gaussian_soln)
             param.gaussian = True
             logger.debug('Gauss fitting was successful.')
-        except ValueError:
-            logger.warn('Gauss fitting failed.')
+            break
 
-    if fixed and not param.gaussian:
+    if fixed and not param.gaussian and not (moments_only and param.moments):
         # moments can't handle fixed params
         raise ValueError("fit failed with given fixed parameters")
 
     beamsize = utils.calculate_beamsize(beam[0], beam[1])
     param["flux"] = (numpy.pi * param["peak"] * param["semimajor"] *
                      param["semiminor"] / beamsize)
-    param.calculate_errors(noise, beam, threshold)
-    param.deconvolve_from_clean_beam(beam)
+    return param
+
+
+def source_residuals(param, data, noise, beam):
+    """Return the residuals of the Gaussian of param from data
+
+    The goodness of fit is stored in param. See
+    source_profile_and_errors() for the arguments; param should hold its
+    errors already, since the peak is corrected as they are calculated.
 
+    Returns:
+        numpy.ndarray: the residuals map, with masked (unfitted) regions
+        filled with 0-values.
+    """
     # Calculate residuals
     # NB this works even if Gaussian fitting fails, we generate the model from
     # the moments-fit parameters.
@@ -714,20 +1038,31 @@ def source_profile_and_errors(data, threshold, noise,
     param.chisq, param.reduced_chisq = fitting.goodness_of_fit(
         gauss_resid_masked, noise, beam)
 
-    gauss_resid_filled = gauss_resid_masked.filled(fill_value=0.)
-    return param, gauss_resid_filled
+    return gauss_resid_masked.filled(fill_value=0.)
 
 
 class Detection(object):
-    """The result of a measurement at a given position in a given image."""
+    """The result of a measurement at a given position in a given image.
+
+    A Detection refers back to the image it was made in, but is pickled
+    detached from it: with the measured values and the coordinate system
+    of the image only, however large the image. See detach() and attach().
+    """
 
-    def __init__(self, paramset, imagedata, chunk=None, eps_ra=0, eps_dec=0):
+    def __init__(self, paramset, imagedata, chunk=None, eps_ra=0, eps_dec=0,
+                 physical_coordinates=True):
+        """
+        If physical_coordinates is False, the celestial coordinates of the
+        detection are not calculated: that is left to a later call of
+        :func:`calculate_physical_coordinates`.
+        """
 
         self.eps_ra = eps_ra
         self.eps_dec = eps_dec
 
         self.imagedata = imagedata
-        ##self.wcs = imagedata.wcs
+        # The coordinate system, once detached from imagedata.
+        self._wcs = None
         self.chunk = chunk
 
         self.peak = paramset['peak']
@@ -750,6 +1085,8 @@ class Detection(object):
 
         self.sig = paramset.sig
 
+        if not physical_coordinates:
+            return
         try:
             self._physical_coordinates()
         except RuntimeError:
@@ -758,43 +1095,55 @@ class Detection(object):
             raise
 
     def __getstate__(self):
-        return {
-            'imagedata': self.imagedata,
-            'chunk': (self.chunk[0].start, self.chunk[0].stop,
-                      self.chunk[1].start, self.chunk[1].stop),
-            'peak': self.peak,
-            'flux': self.flux,
-            'x': self.x,
-            'y': self.y,
-            'smaj': self.smaj,
-            'smin': self.smin,
-            'theta': self.theta,
-            'sig': self.sig,
-            'error_radius': self.error_radius,
-            'gaussian': self.gaussian,
-        }
+        # Everything measured, in pixel and celestial coordinates, is kept
+        # as it is, so nothing need be calculated again when unpickling.
+        state = self.__dict__.copy()
+        state['imagedata'] = None
+        state['_wcs'] = self.wcs
+        return state
 
     def __setstate__(self, attrdict):
-        self.imagedata = attrdict['imagedata']
-        self.chunk = (slice(attrdict['chunk'][0], attrdict['chunk'][1]),
-                      slice(attrdict['chunk'][2], attrdict['chunk'][3]))
-        self.peak = attrdict['peak']
-        self.flux = attrdict['flux']
-        self.x = attrdict['x']
-        self.y = attrdict['y']
-        self.smaj = attrdict['smaj']
-        self.smin = attrdict['smin']
-        self.theta = attrdict['theta']
-        self.sig = attrdict['sig']
-        self.error_radius = attrdict['error_radius']
-        self.gaussian = attrdict['gaussian']
+        if '_wcs' not in attrdict:
+            # The older format, pickled along with the image, lacks the
+            # deconvolved shape and other parts of the measurement, so it
+            # cannot be rebuilt.
+            raise ValueError(
+                "Detection pickled in an older format, along with its image; "
+                "it must be measured again")
+        self.__dict__.update(attrdict)
+
+    @property
+    def wcs(self):
+        """The coordinate system of the image the detection was made in."""
+        if self.imagedata is not None:
+            return self.imagedata.wcs
+        return self._wcs
+
+    def detach(self):
+        """Drop the reference to the image the detection was made in,
+        keeping only its coordinate system, as pickling does.
+
+        Returns:
+            Detection: this detection.
+        """
+        self._wcs = self.wcs
+        self.imagedata = None
+        return self
 
-        try:
-            self._physical_coordinates()
-        except RuntimeError, e:
-            logger.warn("Physical coordinates failed at %f, %f" % (
-                self.x, self.y))
-            raise
+    def attach(self, imagedata):
+        """Refer back to the image the detection was made in, after
+        detach() or unpickling.
+
+        Args:
+            imagedata (:class:`tkp.sourcefinder.image.ImageData`): the
+                image, with the same coordinate system.
+
+        Returns:
+            Detection: this detection.
+        """
+        self.imagedata = imagedata
+        self._wcs = None
+        return self
 
     def __getattr__(self, attrname):
         # Backwards compatibility for "errquantity" attributes
@@ -813,172 +1162,13 @@ class Detection(object):
 
     def _physical_coordinates(self):
         """Convert the pixel parameters for this object into something
-        physical."""
-
-        # First, the RA & dec.
-        self.ra, self.dec = [Uncertain(x) for x in self.imagedata.wcs.p2s(
-            [self.x.value, self.y.value])]
-        if numpy.isnan(self.dec.value) or abs(self.dec) > 90.0:
-            raise ValueError("object falls outside the sky")
-
-        # First, determine local north.
-        help1 = numpy.cos(numpy.radians(self.ra.value))
-        help2 = numpy.sin(numpy.radians(self.ra.value))
-        help3 = numpy.cos(numpy.radians(self.dec.value))
-        help4 = numpy.sin(numpy.radians(self.dec.value))
-        center_position = numpy.array([help3*help1, help3*help2, help4])
+        physical.
 
-        # The length of this vector is chosen such that it touches
-        # the tangent plane at center position.
-        # The cross product of the local north vector and the local east
-        # vector will always be aligned with the center_position vector.
-        if center_position[2] != 0:
-            local_north_position = numpy.array([0., 0., 1./center_position[2]])
-        else:
-            # If we are right on the equator (ie dec=0) the division above
-            # will blow up: as a workaround, we use something Really Big
-            # instead.
-            local_north_position = numpy.array([0., 0., 99e99])
-        # Next, determine the orientation of the y-axis wrt local north
-        # by incrementing y by a small amount and converting that
-        # to celestial coordinates. That small increment is conveniently
-        # chosen to be an increment of 1 pixel.
-
-        endy_ra, endy_dec = self.imagedata.wcs.p2s(
-            [self.x.value, self.y.value+1.])
-        help5 = numpy.cos(numpy.radians(endy_ra))
-        help6 = numpy.sin(numpy.radians(endy_ra))
-        help7 = numpy.cos(numpy.radians(endy_dec))
-        help8 = numpy.sin(numpy.radians(endy_dec))
-        endy_position = numpy.array([help7*help5, help7*help6, help8])
-
-        # Extend the length of endy_position to make it touch the plane
-        # tangent at center_position.
-        endy_position /= numpy.dot(center_position, endy_position)
-
-        diff1 = endy_position-center_position
-        diff2 = local_north_position-center_position
-
-        cross_prod = numpy.cross(diff2, diff1)
-
-        length_cross_sq = numpy.dot(cross_prod, cross_prod)
-
-        normalization = numpy.dot(diff1, diff1) * numpy.dot(diff2, diff2)
-
-        # The length of the cross product equals the product of the lengths of
-        # the vectors times the sine of their angle.
-        # This is the angle between the y-axis and local north,
-        # measured eastwards.
-        # yoffset_angle = numpy.degrees(
-        #    numpy.arcsin(numpy.sqrt(length_cross_sq/normalization)))
-        # The formula above is commented out because the angle computed
-        # in this way will always be 0<=yoffset_angle<=90.
-        # We'll use the dotproduct instead.
-        yoffs_rad = (numpy.arccos(numpy.dot(diff1, diff2) /
-                                  numpy.sqrt(normalization)))
-
-        # The multiplication with -sign_cor makes sure that the angle
-        # is measured eastwards (increasing RA), not westwards.
-        sign_cor = (numpy.dot(cross_prod, center_position) /
-                    numpy.sqrt(length_cross_sq))
-        yoffs_rad *= -sign_cor
-        yoffset_angle = numpy.degrees(yoffs_rad)
-
-        # Now that we have the BPA, we can also compute the position errors
-        # properly, by projecting the errors in pixel coordinates (x and y)
-        # on local north and local east.
-        errorx_proj = numpy.sqrt(
-            (self.x.error*numpy.cos(yoffs_rad))**2 +
-            (self.y.error*numpy.sin(yoffs_rad))**2)
-        errory_proj = numpy.sqrt(
-            (self.x.error*numpy.sin(yoffs_rad))**2 +
-            (self.y.error*numpy.cos(yoffs_rad))**2)
-
-        # Now we have to sort out which combination of errorx_proj and
-        # errory_proj gives the largest errors in RA and Dec.
-        try:
-            end_ra1, end_dec1 = self.imagedata.wcs.p2s(
-                                       [self.x.value+errorx_proj, self.y.value])
-            end_ra2, end_dec2 = self.imagedata.wcs.p2s(
-                [self.x.value, self.y.value+errory_proj])
-            # Here we include the position calibration errors
-            self.ra.error = self.eps_ra + max(
-                numpy.fabs(self.ra.value - end_ra1),
-                numpy.fabs(self.ra.value - end_ra2))
-            self.dec.error = self.eps_dec + max(
-                numpy.fabs(self.dec.value - end_dec1),
-                numpy.fabs(self.dec.value - end_dec2))
-        except RuntimeError:
-            #We get a runtime error from wcs.p2s if the errors place the
-            #limits outside of the image.
-            #In which case we set the RA / DEC uncertainties to infinity
-            self.ra.error = float('inf')
-            self.dec.error = float('inf')
-
-        # Estimate an absolute angular error on our central position.
-        self.error_radius = utils.get_error_radius(
-            self.imagedata.wcs, self.x.value, self.x.error, self.y.value, self.y.error
-        )
-
-        # Now we can compute the BPA, east from local north.
-        # That these angles can simply be added is not completely trivial.
-        # First, the Gaussian in gaussian.py must be such that theta is
-        # measured from the positive y-axis in the direction of negative x.
-        # Secondly, x and y are defined such that the direction
-        # positive y-->negative x-->negative y-->positive x is the same
-        # direction (counterclockwise) as (local) north-->east-->south-->west.
-        # If these two conditions are matched, the formula below is valid.
-        # Of course, the formula is also valid if theta is measured
-        # from the positive y-axis towards positive x
-        # and both of these directions are equal (clockwise).
-        self.theta_celes = Uncertain(
-            (numpy.degrees(self.theta.value) + yoffset_angle) % 180,
-            numpy.degrees(self.theta.error))
-        self.theta_dc_celes = Uncertain(
-            (self.theta_dc.value + yoffset_angle) % 180,
-            numpy.degrees(self.theta_dc.error))
-
-        # Next, the axes.
-        # Note that the signs of numpy.sin and numpy.cos in the
-        # four expressions below are arbitrary.
-        self.end_smaj_x = (self.x.value - numpy.sin(self.theta.value) *
-                      self.smaj.value)
-        self.start_smaj_x = (self.x.value + numpy.sin(self.theta.value) *
-                      self.smaj.value)
-        self.end_smaj_y = (self.y.value + numpy.cos(self.theta.value) *
-                      self.smaj.value)
-        self.start_smaj_y = (self.y.value - numpy.cos(self.theta.value) *
-                      self.smaj.value)
-        self.end_smin_x = (self.x.value + numpy.cos(self.theta.value) *
-                      self.smin.value)
-        self.start_smin_x = (self.x.value - numpy.cos(self.theta.value) *
-                      self.smin.value)
-        self.end_smin_y = (self.y.value + numpy.sin(self.theta.value) *
-                      self.smin.value)
-        self.start_smin_y = (self.y.value - numpy.sin(self.theta.value) *
-                      self.smin.value)
-
-
-        def pixel_to_spatial(x, y):
-            try:
-                return self.imagedata.wcs.p2s([x, y])
-            except RuntimeError:
-                logger.debug("pixel_to_spatial failed at %f, %f" % (x, y))
-                return numpy.nan, numpy.nan
-        end_smaj_ra, end_smaj_dec = pixel_to_spatial(self.end_smaj_x, self.end_smaj_y)
-        end_smin_ra, end_smin_dec = pixel_to_spatial(self.end_smin_x, self.end_smin_y)
-
-        smaj_asec = coordinates.angsep(self.ra.value, self.dec.value,
-                                       end_smaj_ra, end_smaj_dec)
-        scaling_smaj = smaj_asec / self.smaj.value
-        errsmaj_asec = scaling_smaj * self.smaj.error
-        self.smaj_asec = Uncertain(smaj_asec, errsmaj_asec)
-
-        smin_asec = coordinates.angsep(self.ra.value, self.dec.value,
-                                       end_smin_ra, end_smin_dec)
-        scaling_smin = smin_asec / self.smin.value
-        errsmin_asec = scaling_smin * self.smin.error
-        self.smin_asec = Uncertain(smin_asec, errsmin_asec)
+        See :func:`calculate_physical_coordinates` to do this for many
+        detections at once.
+        """
+        if not _physical_coordinates_many([self], self.wcs)[0]:
+            raise RuntimeError("Spatial position is not a number")
 
     def distance_from(self, x, y):
         """Distance from center"""
@@ -1012,3 +1202,196 @@ class Detection(object):
             self.chisq,
             self.reduced_chisq
         ]
+
+
+def calculate_physical_coordinates(detections):
+    """
+    Convert the pixel parameters of many detections, all made in the same
+    image, into something physical, as each Detection does for itself when
+    it is created.
+
+    Every coordinate conversion is done for all the detections at once.
+
+    Args:
+
+        detections (list): :class:`Detection` instances created with
+            physical_coordinates=False.
+
+    Returns:
+
+        numpy.ndarray: boolean, False for the detections which fall outside
+        the coordinate system of the image.
+    """
+    if not detections:
+        return numpy.zeros(0, dtype=bool)
+    valid = _physical_coordinates_many(detections, detections[0].wcs)
+    for detection in itertools.compress(detections, ~valid):
+        logger.warn("Physical coordinates failed at %f, %f" % (
+            detection.x, detection.y))
+    return valid
+
+
+def _physical_coordinates_many(detections, wcs):
+    """
+    Calculate the physical coordinates of detections, made in an image with
+    coordinate system wcs.
+
+    Returns a boolean array, False for the detections whose position could
+    not be converted; their attributes are left alone.
+    """
+    def pixel_to_spatial(x, y):
+        return wcs.p2s_many(numpy.column_stack((x, y)))
+
+    def unit_vectors(ra, dec):
+        ra, dec = numpy.radians(ra), numpy.radians(dec)
+        return numpy.array([numpy.cos(dec) * numpy.cos(ra),
+                            numpy.cos(dec) * numpy.sin(ra),
+                            numpy.sin(dec)])
+
+    def dot(a, b):
+        return (a * b).sum(axis=0)
+
+    x, x_error, y, y_error, theta, smaj, smaj_error, smin, smin_error = [
+        numpy.array([float(value) for value in values])
+        for values in zip(*[
+            (det.x.value, det.x.error, det.y.value, det.y.error,
+             det.theta.value, det.smaj.value, det.smaj.error,
+             det.smin.value, det.smin.error)
+            for det in detections
+        ])
+    ]
+
+    # First, the RA & dec.
+    ra, dec = pixel_to_spatial(x, y)
+    # Next, determine the orientation of the y-axis wrt local north
+    # by incrementing y by a small amount and converting that
+    # to celestial coordinates. That small increment is conveniently
+    # chosen to be an increment of 1 pixel.
+    endy_ra, endy_dec = pixel_to_spatial(x, y + 1.)
+    valid = ~(numpy.isnan(ra) | numpy.isnan(dec) |
+              numpy.isnan(endy_ra) | numpy.isnan(endy_dec))
+    if (numpy.fabs(dec[valid]) > 90.0).any():
+        raise ValueError("object falls outside the sky")
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        # First, determine local north.
+        center_position = unit_vectors(ra, dec)
+
+        # The length of this vector is chosen such that it touches
+        # the tangent plane at center position.
+        # The cross product of the local north vector and the local east
+        # vector will always be aligned with the center_position vector.
+        # If we are right on the equator (ie dec=0) the division
+        # will blow up: as a workaround, we use something Really Big
+        # instead.
+        local_north_position = numpy.zeros(center_position.shape)
+        local_north_position[2] = numpy.where(
+            center_position[2] != 0, 1. / center_position[2], 99e99)
+
+        # Extend the length of endy_position to make it touch the plane
+        # tangent at center_position.
+        endy_position = unit_vectors(endy_ra, endy_dec)
+        endy_position /= dot(center_position, endy_position)
+
+        diff1 = endy_position - center_position
+        diff2 = local_north_position - center_position
+        cross_prod = numpy.cross(diff2, diff1, axis=0)
+        length_cross_sq = dot(cross_prod, cross_prod)
+        normalization = dot(diff1, diff1) * dot(diff2, diff2)
+
+        # The length of the cross product equals the product of the
+        # lengths of the vectors times the sine of their angle, but the
+        # angle computed in that way will always be between 0 and 90
+        # degrees. We'll use the dot product instead. This is the angle
+        # between the y-axis and local north, measured eastwards.
+        yoffs_rad = numpy.arccos(dot(diff1, diff2) /
+                                 numpy.sqrt(normalization))
+        # The multiplication with -sign_cor makes sure that the angle
+        # is measured eastwards (increasing RA), not westwards.
+        sign_cor = (dot(cross_prod, center_position) /
+                    numpy.sqrt(length_cross_sq))
+        yoffs_rad *= -sign_cor
+        yoffset_angle = numpy.degrees(yoffs_rad)
+
+    # Now that we have the BPA, we can also compute the position errors
+    # properly, by projecting the errors in pixel coordinates (x and y)
+    # on local north and local east.
+    errorx_proj = numpy.sqrt((x_error * numpy.cos(yoffs_rad))**2 +
+                             (y_error * numpy.sin(yoffs_rad))**2)
+    errory_proj = numpy.sqrt((x_error * numpy.sin(yoffs_rad))**2 +
+                             (y_error * numpy.cos(yoffs_rad))**2)
+
+    # Now we have to sort out which combination of errorx_proj and
+    # errory_proj gives the largest errors in RA and Dec. If the errors
+    # place the limits outside of the image, the RA / DEC uncertainties are
+    # infinite.
+    end_ra1, end_dec1 = pixel_to_spatial(x + errorx_proj, y)
+    end_ra2, end_dec2 = pixel_to_spatial(x, y + errory_proj)
+    outside = (numpy.isnan(end_ra1) | numpy.isnan(end_dec1) |
+               numpy.isnan(end_ra2) | numpy.isnan(end_dec2))
+    ra_error = numpy.where(outside, float('inf'), numpy.maximum(
+        numpy.fabs(ra - end_ra1), numpy.fabs(ra - end_ra2)))
+    dec_error = numpy.where(outside, float('inf'), numpy.maximum(
+        numpy.fabs(dec - end_dec1), numpy.fabs(dec - end_dec2)))
+
+    # Estimate an absolute angular error on our central position.
+    error_radius = utils.get_error_radii(wcs, x, x_error, y, y_error)
+
+    # Next, the axes.
+    # Note that the signs of numpy.sin and numpy.cos in the
+    # four expressions below are arbitrary.
+    end_smaj_x = x - numpy.sin(theta) * smaj
+    start_smaj_x = x + numpy.sin(theta) * smaj
+    end_smaj_y = y + numpy.cos(theta) * smaj
+    start_smaj_y = y - numpy.cos(theta) * smaj
+    end_smin_x = x + numpy.cos(theta) * smin
+    start_smin_x = x - numpy.cos(theta) * smin
+    end_smin_y = y + numpy.sin(theta) * smin
+    start_smin_y = y - numpy.sin(theta) * smin
+
+    end_smaj_ra, end_smaj_dec = pixel_to_spatial(end_smaj_x, end_smaj_y)
+    end_smin_ra, end_smin_dec = pixel_to_spatial(end_smin_x, end_smin_y)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        smaj_asec = coordinates.angsep_many(ra, dec, end_smaj_ra,
+                                            end_smaj_dec)
+        smin_asec = coordinates.angsep_many(ra, dec, end_smin_ra,
+                                            end_smin_dec)
+        scaling_smaj = smaj_asec / smaj
+        scaling_smin = smin_asec / smin
+
+    for i in numpy.flatnonzero(valid):
+        det = detections[i]
+        det.ra = Uncertain(ra[i], det.eps_ra + ra_error[i])
+        det.dec = Uncertain(dec[i], det.eps_dec + dec_error[i])
+        det.error_radius = error_radius[i]
+
+        # Now we can compute the BPA, east from local north.
+        # That these angles can simply be added is not completely trivial.
+        # First, the Gaussian in gaussian.py must be such that theta is
+        # measured from the positive y-axis in the direction of negative x.
+        # Secondly, x and y are defined such that the direction
+        # positive y-->negative x-->negative y-->positive x is the same
+        # direction (counterclockwise) as (local) north-->east-->south-->west.
+        # If these two conditions are matched, the formula below is valid.
+        # Of course, the formula is also valid if theta is measured
+        # from the positive y-axis towards positive x
+        # and both of these directions are equal (clockwise).
+        det.theta_celes = Uncertain(
+            (numpy.degrees(det.theta.value) + yoffset_angle[i]) % 180,
+            numpy.degrees(det.theta.error))
+        det.theta_dc_celes = Uncertain(
+            (det.theta_dc.value + yoffset_angle[i]) % 180,
+            numpy.degrees(det.theta_dc.error))
+
+        det.end_smaj_x = end_smaj_x[i]
+        det.start_smaj_x = start_smaj_x[i]
+        det.end_smaj_y = end_smaj_y[i]
+        det.start_smaj_y = start_smaj_y[i]
+        det.end_smin_x = end_smin_x[i]
+        det.start_smin_x = start_smin_x[i]
+        det.end_smin_y = end_smin_y[i]
+        det.start_smin_y = start_smin_y[i]
+
+        det.smaj_asec = Uncertain(smaj_asec[i], scaling_smaj[i] * smaj_error[i])
+        det.smin_asec = Uncertain(smin_asec[i], scaling_smin[i] * smin_error[i])
+    return valid
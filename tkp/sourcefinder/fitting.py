@@ -5,7 +5,7 @@ Source fitting routines.
 import math
 import numpy
 import scipy.optimize
-from .gaussian import gaussian
+from .gaussian import gaussian, jac_gaussian
 from .stats import indep_pixels
 import utils
 
@@ -110,6 +110,130 @@ def moments(data, beam, threshold=0):
         }
 
 
+def moments_many(islands, beam, thresholds):
+    """Calculate source positional values using moments for many islands
+    at once.
+
+    This gives the same results as calling moments() for each island,
+    apart from rounding, but rather than doing the masked array arithmetic
+    island by island, the unmasked pixels of all the islands are gathered
+    into flat arrays and their sums accumulated per island in one pass.
+
+    Args:
+
+        islands (list): the 2D pixel data of each island, as
+            numpy.ma.MaskedArray (masked pixels are ignored) or
+            numpy.ndarray.
+
+        beam (3-tuple): beam (psf) information, with semi-major and
+            semi-minor axes
+
+        thresholds (list): the threshold of each island, as for moments().
+
+    Returns:
+        list: for each island, the dict returned by moments(), or None
+        where moments() would raise ValueError.
+    """
+    num = len(islands)
+    if not num:
+        return []
+
+    values, xs, ys, sizes = [], [], [], []
+    for data in islands:
+        unmasked = ~numpy.ma.getmaskarray(data)
+        x, y = numpy.nonzero(unmasked)
+        values.append(numpy.ma.getdata(data)[unmasked])
+        xs.append(x)
+        ys.append(y)
+        sizes.append(len(x))
+    values = numpy.concatenate(values).astype(numpy.float64)
+    x = numpy.concatenate(xs).astype(numpy.float64)
+    y = numpy.concatenate(ys).astype(numpy.float64)
+    sizes = numpy.array(sizes)
+    labels = numpy.repeat(numpy.arange(num), sizes)
+    starts = numpy.concatenate(([0], numpy.cumsum(sizes)[:-1]))
+    filled = sizes > 0
+
+    def island_sum(weights):
+        return numpy.bincount(labels, weights=weights, minlength=num)
+
+    total = island_sum(values)
+    maximum = numpy.zeros(num)
+    minimum = numpy.zeros(num)
+    # reduceat() needs a non-empty run of values for each island.
+    maximum[filled] = numpy.maximum.reduceat(values, starts[filled])
+    minimum[filled] = numpy.minimum.reduceat(values, starts[filled])
+    nonzero = numpy.bincount(labels[values != 0], minlength=num)
+
+    # Are we fitting a -ve or +ve Gaussian?
+    # The peak is always underestimated when you take the highest pixel.
+    peak = numpy.where(total >= 0,
+                       maximum * utils.fudge_max_pix(beam[0], beam[1],
+                                                     beam[2]),
+                       minimum)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        ratio = numpy.array(thresholds, dtype=numpy.float64) / peak
+        xbar = island_sum(x * values) / total
+        ybar = island_sum(y * values) / total
+        xxbar = island_sum(x * x * values) / total - xbar**2
+        yybar = island_sum(y * y * values) / total - ybar**2
+        xybar = island_sum(x * y * values) / total - xbar * ybar
+
+        working1 = (xxbar + yybar) / 2.0
+        working2 = numpy.sqrt(((xxbar - yybar)/2)**2 + xybar**2)
+        beamsize = utils.calculate_beamsize(beam[0], beam[1])
+
+        semimajor_tmp = (working1 + working2) * 2.0 * math.log(2.0)
+        semiminor_tmp = (working1 - working2) * 2.0 * math.log(2.0)
+        # The corrections below for the semi-major and semi-minor axes are
+        # to compensate for the underestimate of these quantities due to
+        # the cutoff at the threshold; see moments().
+        corrected = ratio != 0
+        correction = (1.0 + numpy.log(ratio[corrected]) * ratio[corrected] /
+                      (1.0 - ratio[corrected]))
+        semimajor_tmp[corrected] /= correction
+        semiminor_tmp[corrected] /= correction
+        # moments() fails on the square root of a negative number, and on
+        # the logarithm of a negative ratio.
+        failed = ((semimajor_tmp < 0) | (semiminor_tmp < 0) |
+                  (ratio < 0) & corrected)
+        semimajor = numpy.sqrt(semimajor_tmp)
+        semiminor = numpy.sqrt(semiminor_tmp)
+        # A semi-minor axis exactly zero gives all kinds of problems.
+        semiminor = numpy.where(semiminor == 0,
+                                beamsize / (numpy.pi * semimajor), semiminor)
+
+        # An island (or more likely subisland) of a single pixel.
+        single = nonzero == 1
+        failed[single] = False
+        semimajor[single] = numpy.sqrt(beamsize/numpy.pi)
+        semiminor[single] = numpy.sqrt(beamsize/numpy.pi)
+
+        failed |= (numpy.isnan(xbar) | numpy.isnan(ybar) |
+                   numpy.isnan(semimajor) | numpy.isnan(semiminor) |
+                   ~filled)
+
+        # Theta is not affected by the cut-off at the threshold.
+        theta = numpy.arctan(2. * xybar / (xxbar - yybar))/2.
+        flip = theta * xybar > 0.
+        theta[flip] += numpy.where(theta[flip] < 0., math.pi / 2.0,
+                                   -math.pi / 2.0)
+        theta[numpy.fabs(semimajor - semiminor) < 0.01] = 0.
+
+    return [
+        None if failed[i] else {
+            "peak": peak[i],
+            "flux": total[i],
+            "xbar": float(xbar[i]),
+            "ybar": float(ybar[i]),
+            "semimajor": semimajor[i],
+            "semiminor": semiminor[i],
+            "theta": float(theta[i])
+        }
+        for i in range(num)
+    ]
+
+
 def fitgaussian(pixels, params, fixed=None, maxfev=0):
     """Calculate source positional values by fitting a 2D Gaussian
 
@@ -150,44 +274,53 @@ def fitgaussian(pixels, params, fixed=None, maxfev=0):
             else:
                 initial.append(params[param])
 
+    # The Gaussian is only ever evaluated at the unmasked pixels, so we
+    # collect their coordinates and values once rather than on every call to
+    # the error function.
+    # The .compressed() below is essential so the Gaussian fit will not
+    # take account of the masked values (=below threshold) at the edges
+    # and corners of pixels (=(masked) array, so rectangular in shape).
+    unmasked = ~numpy.ma.getmaskarray(pixels)
+    x, y = numpy.indices(pixels.shape, dtype=float)
+    x, y = x[unmasked], y[unmasked]
+    values = numpy.ma.MaskedArray(pixels).compressed()
+
+    # The arguments to gaussian(): fixed values are filled in once, free ones
+    # are updated in place on every iteration.
+    free = [i for i, param in enumerate(FIT_PARAMS) if param not in fixed]
+    gaussian_args = numpy.array(
+        [fixed.get(param, 0.) for param in FIT_PARAMS], dtype=float
+    )
+
     def residuals(paramlist):
         """Error function to be used in chi-squared fitting
 
         :argument paramlist: fitting parameters
         :type paramlist: numpy.ndarray
-        :argument fixed: parameters to be held frozen
-        :type fixed: dict
 
-        :returns: 2d-array of difference between estimated Gaussian function
-            and the actual pixels
+        :returns: 1d-array of difference between estimated Gaussian function
+            and the actual (unmasked) pixels
         """
-        paramlist = list(paramlist)
-        gaussian_args = []
-        for param in FIT_PARAMS:
-            if param in fixed:
-                gaussian_args.append(fixed[param])
-            else:
-                gaussian_args.append(paramlist.pop(0))
-
+        gaussian_args[free] = paramlist
         # gaussian() returns a function which takes arguments x, y and returns
         # a Gaussian with parameters gaussian_args evaluated at that point.
-        g = gaussian(*gaussian_args)
-
-        # The .compressed() below is essential so the Gaussian fit will not
-        # take account of the masked values (=below threshold) at the edges
-        # and corners of pixels (=(masked) array, so rectangular in shape).
-        pixel_resids = numpy.ma.MaskedArray(
-            data = numpy.fromfunction(g, pixels.shape) - pixels,
-            mask = pixels.mask)
-        return pixel_resids.compressed()
-
-    # maxfev=0, the default, corresponds to 200*(N+1) (NB, not 100*(N+1) as
-    # the scipy docs state!) function evaluations, where N is the number of
-    # parameters in the solution.
+        return gaussian(*gaussian_args)(x, y) - values
+
+    def jacobian(paramlist):
+        """Analytic derivatives of residuals() with respect to each of the
+        fitting parameters, one row per parameter.
+        """
+        gaussian_args[free] = paramlist
+        return jac_gaussian(*gaussian_args)(x, y)[free]
+
+    # maxfev=0, the default, corresponds to 100*(N+1) function evaluations
+    # when the Jacobian is supplied, where N is the number of parameters in
+    # the solution.
     # Convergence tolerances xtol and ftol established by experiment on images
     # from Paul Hancock's simulations.
     soln, success = scipy.optimize.leastsq(
-        residuals, initial, maxfev=maxfev, xtol=1e-4, ftol=1e-4
+        residuals, initial, Dfun=jacobian, col_deriv=True, maxfev=maxfev,
+        xtol=1e-4, ftol=1e-4
     )
 
     if success > 4:
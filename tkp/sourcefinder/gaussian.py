@@ -2,7 +2,7 @@
 Definition of a two dimensional elliptical Gaussian.
 """
 
-from numpy import exp, log, cos, sin
+from numpy import array, exp, log, cos, sin
 
 def gaussian(height, center_x, center_y, semimajor, semiminor, theta):
     """Return a 2D Gaussian function with the given parameters.
@@ -34,3 +34,37 @@ def gaussian(height, center_x, center_y, semimajor, semiminor, theta):
                           ((cos(theta) * (y - center_y) -
                             sin(theta) * (x - center_x)) /
                            semimajor)**2.))
+
+
+def jac_gaussian(height, center_x, center_y, semimajor, semiminor, theta):
+    """Return the Jacobian of a 2D Gaussian with the given parameters.
+
+    Args:
+
+        The parameters of the Gaussian, as for :func:`gaussian`.
+
+    Returns:
+        lambda: function of pixel coords ``(x,y)``, returning an array of
+            the partial derivatives of the Gaussian with respect to
+            height, center_x, center_y, semimajor, semiminor and theta, in
+            that order, evaluated at those coordinates.
+    """
+
+    def jacobian(x, y):
+        along_minor = cos(theta) * (x - center_x) + sin(theta) * (y - center_y)
+        along_major = cos(theta) * (y - center_y) - sin(theta) * (x - center_x)
+        unit_height = exp(-log(2.0) * ((along_minor / semiminor)**2.0 +
+                                       (along_major / semimajor)**2.0))
+        value = height * unit_height
+        return array([
+            unit_height,
+            2.0 * log(2.0) * value * (cos(theta) * along_minor / semiminor**2 -
+                                      sin(theta) * along_major / semimajor**2),
+            2.0 * log(2.0) * value * (sin(theta) * along_minor / semiminor**2 +
+                                      cos(theta) * along_major / semimajor**2),
+            2.0 * log(2.0) * value * along_major**2 / semimajor**3,
+            2.0 * log(2.0) * value * along_minor**2 / semiminor**3,
+            2.0 * log(2.0) * value * along_minor * along_major *
+                (1.0 / semimajor**2 - 1.0 / semiminor**2)
+        ])
+    return jacobian
@@ -3,14 +3,20 @@ Some generic utility routines for number handling and
 calculating (specific) variances
 """
 
+import atexit
 import logging
 import itertools
+import multiprocessing
+import os
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
 import numpy
 from tkp.utility import containers
-from tkp.utility.memoize import Memoize
+from tkp.utility.memoize import CachedMemoize, MemoCache
 from tkp.sourcefinder import utils
 from tkp.sourcefinder import stats
 from tkp.sourcefinder import extract
+from tkp.sourcefinder import fitting
 try:
     import ndimage
 except ImportError:
@@ -19,6 +25,15 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+#: The final state of the sigma clipping of the background grid tiles of an
+#: image: the region the grid covers, and the centre and clipping limit of
+#: each tile. See the clip_seed argument of ImageData.
+ClipState = namedtuple('ClipState', ['useful_chunk', 'centre', 'limit'])
+
+#: The background and RMS grids of an image, and the region they cover. See
+#: the background_grids argument of ImageData.
+BackgroundGrids = namedtuple('BackgroundGrids', ['useful_chunk', 'bg', 'rms'])
+
 #
 # Hard-coded configuration parameters; not user settable.
 #
@@ -31,6 +46,532 @@ MF_THRESHOLD = 0        # If MEDIAN_FILTER is non-zero, only use the filtered
                         # and filtered grids is larger than MF_THRESHOLD.
 DEBLEND_MINCONT = 0.005 # Min. fraction of island flux in deblended subisland
 STRUCTURING_ELEMENT = [[0,1,0], [1,1,1], [0,1,0]] # Island connectiivty
+PRIOR_STEP = 1. / 60    # Step in degrees used to find the pixel scale and
+                        # orientation at the positions of forced fit priors.
+CLIP_BLOCK_PIXELS = 2**20 # Pixels sigma clipped at once when computing the
+                        # background grids; bounds the clipping temporaries.
+
+
+def _fit_island(args):
+    """Fit the profile of a single island.
+
+    Defined at module level so that it can be handed to a process pool.
+    """
+    island, fixed, initial, moments_only = args
+    return island.fit_profile(fixed=fixed, initial=initial,
+                              moments_only=moments_only)
+
+
+def _fit_island_list(island_list, fixed, fit_workers, fit_threads,
+                     moments_max_beams=0, moments_max_sig=0):
+    """Fit each of the islands in island_list, concurrently if fit_workers
+    is larger than one.
+
+    The moments from which each fit starts are calculated for all the
+    islands at once beforehand, and the errors and deconvolved shapes of
+    all the fits at once afterwards. Islands which are compact enough, as
+    judged by Island.is_compact(moments_max_beams, moments_max_sig), are
+    measured by their moments alone; none are if moments_max_beams is 0.
+
+    See :meth:`ImageData._fit_islands`.
+    """
+    if not island_list:
+        return []
+    beam = island_list[0].beam
+    initials = [
+        initial if initial is not None else False
+        for initial in fitting.moments_many(
+            [island.data for island in island_list], beam,
+            [island.threshold() for island in island_list])
+    ]
+    if moments_max_beams:
+        moments_only = [
+            island.is_compact(moments_max_beams, moments_max_sig)
+            for island in island_list
+        ]
+        logger.debug("Measuring %d of %d islands by their moments alone",
+                     sum(moments_only), len(island_list))
+    else:
+        moments_only = [False] * len(island_list)
+
+    if (fit_workers > 1 and not fit_threads and
+            multiprocessing.current_process().daemon):
+        _warn_daemonic()
+        fit_workers = 0
+
+    if fit_workers < 2 or len(island_list) < 2:
+        measurements = [
+            island.fit_profile(fixed=fixed, initial=initial,
+                               moments_only=compact)
+            for island, initial, compact
+            in zip(island_list, initials, moments_only)
+        ]
+    else:
+        measurements = _fit_island_pool(
+            island_list, fixed, initials, moments_only, fit_workers,
+            fit_threads)
+
+    fitted = [(island, measurement) for island, measurement
+              in zip(island_list, measurements) if measurement is not None]
+    extract.calculate_errors_many(
+        [measurement for island, measurement in fitted],
+        [island.noise() for island, measurement in fitted], beam,
+        [island.threshold() for island, measurement in fitted])
+    try:
+        extract.deconvolve_from_clean_beam_many(
+            [measurement for island, measurement in fitted], beam)
+    except ValueError:
+        # Some cannot be deconvolved, and so fail as they would with
+        # Island.fit(); deconvolve them one by one to find out which.
+        for index, (island, measurement) in enumerate(
+                zip(island_list, measurements)):
+            if measurement is None:
+                continue
+            try:
+                measurement.deconvolve_from_clean_beam(beam)
+            except ValueError:
+                island.fit_failed()
+                measurements[index] = None
+    return [island.finish_fit(measurement) if measurement is not None
+            else None
+            for island, measurement in zip(island_list, measurements)]
+
+
+def _fit_island_pool(island_list, fixed, initials, moments_only, fit_workers,
+                     fit_threads):
+    """Fit the profiles of the islands in island_list using a pool of
+    fit_workers; see _fit_island_list()."""
+    logger.debug("Fitting %d islands using %d workers",
+                 len(island_list), fit_workers)
+    return _fit_pool(fit_workers, fit_threads).map(
+        _fit_island, [(island, fixed, initial, compact)
+                      for island, initial, compact
+                      in zip(island_list, initials, moments_only)]
+    )
+
+
+# Pools for fitting islands concurrently, made when first needed and kept
+# for the images which follow; see _fit_pool().
+_fit_pools = {}
+_warned_daemonic = []
+
+
+def _fit_pool(fit_workers, fit_threads):
+    """A pool of fit_workers processes, or threads if fit_threads is set,
+    shared by all the images fitted in this process."""
+    # A pool belongs to the process which made it, not to any forked from
+    # it since.
+    key = (os.getpid(), fit_workers, bool(fit_threads))
+    if key not in _fit_pools:
+        if fit_threads:
+            _fit_pools[key] = ThreadPool(fit_workers)
+        else:
+            _fit_pools[key] = multiprocessing.Pool(fit_workers)
+    return _fit_pools[key]
+
+
+@atexit.register
+def close_fit_pools():
+    """Close the pools made by this process for fitting islands; they are
+    made again if needed."""
+    for key in [key for key in _fit_pools if key[0] == os.getpid()]:
+        pool = _fit_pools.pop(key)
+        pool.close()
+        pool.join()
+
+
+def _warn_daemonic():
+    """Warn, once per process, that islands are fitted one after another."""
+    if not _warned_daemonic:
+        logger.warning(
+            "fit_workers ignored in a daemonic process, which may not start "
+            "processes of its own: fitting islands one after another")
+        _warned_daemonic.append(True)
+
+
+def _clip_tiles(useful_data, back_size_x, back_size_y, beam, seed=None,
+                return_state=False):
+    """Sigma clip the back_size_x by back_size_y tiles of useful_data.
+
+    Returns the output of :func:`tkp.sourcefinder.stats.sigma_clip_tiles`,
+    with each array shaped as the grid of tiles. Tiles are aligned to the
+    origin of useful_data; incomplete tiles along its upper edges are
+    padded with masked pixels.
+
+    seed and return_state are passed on to sigma_clip_tiles(), with the
+    arrays of the clipping state shaped as the grid.
+    """
+    my_xdim, my_ydim = useful_data.shape
+
+    # Cut the useful data into back_size_x by back_size_y tiles and lay
+    # them out as the rows of a (tiles, pixels) array, so that they can be
+    # sigma clipped together. The sorted copies and cumulative sums of
+    # the tiles are several times the size of the tiles themselves, so
+    # that is done for a block of grid rows at a time rather than for the
+    # whole image at once.
+    grid_xdim = -(-my_xdim // back_size_x)
+    grid_ydim = -(-my_ydim // back_size_y)
+    block_xdim = max(
+        CLIP_BLOCK_PIXELS // (back_size_x * back_size_y * grid_ydim), 1)
+    clipped = None
+    for first in xrange(0, grid_xdim, block_xdim):
+        last = min(first + block_xdim, grid_xdim)
+        block = useful_data[first * back_size_x:last * back_size_x]
+        padded = numpy.ma.masked_all(
+            ((last - first) * back_size_x, grid_ydim * back_size_y),
+            dtype=useful_data.dtype)
+        padded[:block.shape[0], :my_ydim] = block
+        tiles = padded.reshape(
+            last - first, back_size_x, grid_ydim, back_size_y
+        ).swapaxes(1, 2).reshape(
+            (last - first) * grid_ydim, back_size_x * back_size_y
+        )
+        block_seed = None
+        if seed is not None:
+            block_seed = tuple(numpy.ravel(value[first:last])
+                               for value in seed)
+        block_clipped = stats.sigma_clip_tiles(tiles, beam, seed=block_seed,
+                                               return_state=return_state)
+        if return_state:
+            block_clipped = block_clipped[:-1] + block_clipped[-1]
+        if clipped is None:
+            clipped = tuple(numpy.empty((grid_xdim, grid_ydim), value.dtype)
+                            for value in block_clipped)
+        for value, block_value in zip(clipped, block_clipped):
+            value[first:last] = block_value.reshape(last - first, grid_ydim)
+    if return_state:
+        return clipped[:5] + (clipped[5:],)
+    return clipped
+
+
+def _background_grids(sigma, median, mean, num_clip_its, valid):
+    """Background and RMS grids from the clipped statistics of each tile.
+
+    Args are the arrays returned by :func:`_clip_tiles`.
+
+    Returns:
+
+        dict: the 'bg' and 'rms' grids (numpy.ma.MaskedArray).
+    """
+    # We set up a dedicated logging subchannel, as the sigmaclip loop
+    # logging is very chatty:
+    sigmaclip_logger = logging.getLogger(__name__+'.sigmaclip')
+
+    # In the case of a crowded field, the distribution will be
+    # skewed and we take the median as the background level.
+    # Otherwise, we take 2.5 * median - 1.5 * mean. This is the
+    # same as SExtractor: see discussion at
+    # <http://terapix.iap.fr/forum/showthread.php?tid=267>.
+    # (mean - median) / sigma is a quick n' dirty skewness
+    # estimator devised by Karl Pearson.
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        skewed = numpy.fabs(mean - median) / sigma >= 0.3
+    sigmaclip_logger.debug(
+        '%d of %d tiles skewed, %d clipping iterations at most',
+        (skewed & valid).sum(), valid.sum(), num_clip_its.max())
+    bg = numpy.where(skewed, median, 2.5 * median - 1.5 * mean)
+
+    # Tiles without usable data are masked and set to zero. Like a
+    # missing tile, a value of exactly zero is also regarded as unusable.
+    rms = numpy.where(valid, sigma, 0.)
+    bg = numpy.where(valid, bg, 0.)
+    rmsgrid = numpy.ma.array(rms, mask=(rms == 0))
+    bggrid = numpy.ma.array(bg, mask=(bg == 0))
+
+    return {'rms': rmsgrid, 'bg': bggrid}
+
+
+def _grid_map(grid, mask, useful_chunk, window, back_size_x, back_size_y,
+              dtype, roundup=False, grid_offset=(0, 0)):
+    """Interpolate a background or RMS grid over a window of the image.
+
+    Args:
+
+        grid (numpy.ma.MaskedArray): grid calculated over useful_chunk.
+
+        mask (numpy.ndarray): mask of the image data within window.
+
+        useful_chunk (tuple): slices of the image the grid covers.
+
+        window (tuple): slices of the image to produce the map for.
+
+        back_size_x, back_size_y (int): grid tile size.
+
+        dtype (numpy.dtype): type of the map.
+
+    Kwargs:
+
+        roundup (bool): trim values lower than the grid minimum.
+
+        grid_offset (tuple): if grid holds only some of the tiles over
+            useful_chunk, the index of its first tile in the full grid. It
+            must include every tile adjacent to the tiles window covers.
+
+    Returns:
+
+        (numpy.ma.MaskedArray): the map within window. Each pixel takes the
+        same value whatever the window it is calculated in.
+    """
+    my_xdim = useful_chunk[0].stop - useful_chunk[0].start
+    my_ydim = useful_chunk[1].stop - useful_chunk[1].start
+
+    if MEDIAN_FILTER:
+        f_grid = ndimage.median_filter(grid, MEDIAN_FILTER)
+        if MF_THRESHOLD:
+            grid = numpy.where(
+                numpy.fabs(f_grid - grid) > MF_THRESHOLD, f_grid, grid
+            )
+        else:
+            grid = f_grid
+
+    # Bicubic spline interpolation
+    xratio = float(my_xdim)/back_size_x
+    yratio = float(my_ydim)/back_size_y
+    # First arg: starting point. Second arg: ending point. Third arg:
+    # 1j * number of points. (Why is this complex? Sometimes, NumPy has an
+    # utterly baffling API...)
+    slicex = slice(-0.5, -0.5+xratio, 1j*my_xdim)
+    slicey = slice(-0.5, -0.5+yratio, 1j*my_ydim)
+
+    # If the input grid was entirely masked, then the output map must
+    # also be masked: there's no useful data here. We don't search for
+    # sources on a masked background/RMS, so this data will be cleanly
+    # skipped by the rest of the sourcefinder
+    all_masked = numpy.ma.getmask(grid).all()
+    # In some cases, the spline interpolation may produce values lower
+    # than the minimum value in the map. If required, these can be trimmed
+    # off. No point doing this if the map is already fully masked, though.
+    floor = numpy.min(grid) if roundup and not all_masked else None
+
+    # Pixels beyond the grid hold zero, or the trimmed minimum.
+    my_map = numpy.ma.MaskedArray(
+        numpy.full(mask.shape, 0 if floor is None else floor, dtype=dtype),
+        mask=mask)
+
+    # Remove the MaskedArrayFutureWarning warning and keep old numpy < 1.11
+    # behavior
+    my_map.unshare_mask()
+
+    # The part of the window covered by the grid.
+    overlap = [slice(max(w.start, u.start), min(w.stop, u.stop))
+               for w, u in zip(window, useful_chunk)]
+    if all(o.start < o.stop for o in overlap):
+        xcoords = numpy.mgrid[slicex][
+            overlap[0].start - useful_chunk[0].start:
+            overlap[0].stop - useful_chunk[0].start] - grid_offset[0]
+        ycoords = numpy.mgrid[slicey][
+            overlap[1].start - useful_chunk[1].start:
+            overlap[1].stop - useful_chunk[1].start] - grid_offset[1]
+        target = (slice(overlap[0].start - window[0].start,
+                        overlap[0].stop - window[0].start),
+                  slice(overlap[1].start - window[1].start,
+                        overlap[1].stop - window[1].start))
+        if INTERPOLATE_ORDER == 1:
+            _interpolate_linear(numpy.ma.getdata(grid), xcoords, ycoords,
+                                my_map.data[target])
+        else:
+            coords = numpy.empty((2, len(xcoords), len(ycoords)))
+            coords[0] = xcoords[:, numpy.newaxis]
+            coords[1] = ycoords[numpy.newaxis, :]
+            my_map.data[target] = ndimage.map_coordinates(
+                grid, coords, mode='nearest', order=INTERPOLATE_ORDER)
+        # The map is unmasked wherever the grid covers it.
+        if my_map.mask is not numpy.ma.nomask:
+            my_map.mask[target] = False
+        if floor is not None:
+            numpy.fmax(my_map.data[target], floor,
+                       out=my_map.data[target])
+
+    if all_masked:
+        my_map.mask = True
+    return my_map
+
+
+def _linear_weights(coords, size):
+    """Indices and weights of the grid points either side of each of
+    coords, for linear interpolation along an axis of the given size.
+
+    As ndimage.map_coordinates() with order=1 and mode='nearest', coords
+    beyond the grid take the value at its edge.
+    """
+    coords = numpy.clip(coords, 0, size - 1)
+    lower = numpy.floor(coords)
+    upper_weight = coords - lower
+    lower = lower.astype(numpy.intp)
+    upper = numpy.minimum(lower + 1, size - 1)
+    return lower, upper, 1. - upper_weight, upper_weight
+
+
+def _interpolate_linear(grid, xcoords, ycoords, out, block_size=2**16):
+    """Bilinear interpolation of grid at the points (xcoords, ycoords).
+
+    The result is written to out, of shape (len(xcoords), len(ycoords)). It
+    is the same, bit for bit, as that of ndimage.map_coordinates() with
+    order=1 and mode='nearest' on the full mesh of coordinates. The points
+    lie on a regular mesh, however, so rather than building that mesh the
+    interpolation weights are calculated once along each axis, and the map
+    is filled in blocks of about block_size pixels at a time.
+    """
+    x_lower, x_upper, x_lower_weight, x_upper_weight = _linear_weights(
+        xcoords, grid.shape[0])
+    y_lower, y_upper, y_lower_weight, y_upper_weight = _linear_weights(
+        ycoords, grid.shape[1])
+    rows = max(1, block_size // max(1, len(ycoords)))
+    total = numpy.empty((min(rows, len(xcoords)), len(ycoords)))
+    term = numpy.empty_like(total)
+    for start in xrange(0, len(xcoords), rows):
+        stop = min(start + rows, len(xcoords))
+        my_total, my_term = total[:stop - start], term[:stop - start]
+        my_total[...] = 0.
+        # The corners are summed in the order map_coordinates() does, each
+        # weighted along x and then along y.
+        for x_index, x_weight in ((x_lower, x_lower_weight),
+                                  (x_upper, x_upper_weight)):
+            grid_rows = grid[x_index[start:stop]]
+            x_weight = x_weight[start:stop, numpy.newaxis]
+            for y_index, y_weight in ((y_lower, y_lower_weight),
+                                      (y_upper, y_upper_weight)):
+                numpy.take(grid_rows, y_index, axis=1, out=my_term)
+                numpy.multiply(my_term, x_weight, out=my_term)
+                numpy.multiply(my_term, y_weight, out=my_term)
+                my_total += my_term
+        out[start:stop] = my_total
+
+
+def _window_about(indices, shape):
+    """The smallest window of an array of the given shape holding each of
+    indices, and indices relative to that window.
+
+    Args:
+
+        indices (tuple): each a pair of slices or a pair of integers, as
+            used to index the array.
+
+        shape (tuple): shape of the array.
+
+    Returns:
+
+        tuple: (window, relative), where window is a pair of slices and
+        relative holds each of indices such that indexing the window with
+        it selects the same elements as indexing the array. Slices are
+        resolved as numpy does, so a slice selecting nothing from the array
+        selects nothing from the window either.
+    """
+    resolved = []
+    lower = list(shape)
+    upper = [0, 0]
+    for index in indices:
+        if isinstance(index[0], slice):
+            index = tuple(slice(*axis.indices(dim)[:2])
+                          for axis, dim in zip(index, shape))
+            if all(axis.start < axis.stop for axis in index):
+                for dim, axis in enumerate(index):
+                    lower[dim] = min(lower[dim], axis.start)
+                    upper[dim] = max(upper[dim], axis.stop)
+        else:
+            for dim, value in enumerate(index):
+                lower[dim] = min(lower[dim], value)
+                upper[dim] = max(upper[dim], value + 1)
+        resolved.append(index)
+    window = tuple(slice(low, max(low, up)) for low, up in zip(lower, upper))
+
+    relative = []
+    for index in resolved:
+        if isinstance(index[0], slice):
+            if all(axis.start < axis.stop for axis in index):
+                index = tuple(slice(axis.start - w.start, axis.stop - w.start)
+                              for axis, w in zip(index, window))
+            else:
+                index = (slice(0, 0), slice(0, 0))
+        else:
+            index = tuple(value - w.start for value, w in zip(index, window))
+        relative.append(index)
+    return window, tuple(relative)
+
+
+def _island_pixels(data_bgsubbed, analysisthresholdmap, rmsmap,
+                   rms_threshold):
+    """Pixels eligible for labelling as part of an island: those above the
+    analysis threshold, where the RMS is at least rms_threshold.
+
+    Each argument may be a masked array; masked pixels are never eligible.
+    The comparisons are made on the underlying data, and the masks applied
+    to the result, rather than building masked intermediate results.
+
+    Returns:
+
+        numpy.ndarray: boolean.
+    """
+    with numpy.errstate(invalid='ignore'):
+        selected = (numpy.ma.getdata(data_bgsubbed) >
+                    numpy.ma.getdata(analysisthresholdmap))
+        selected &= numpy.ma.getdata(rmsmap) >= rms_threshold
+    for value in (data_bgsubbed, analysisthresholdmap, rmsmap):
+        mask = numpy.ma.getmask(value)
+        if mask is not numpy.ma.nomask:
+            selected[mask] = False
+    return selected
+
+
+def _island_peaks(labelled_data, num_labels, data_bgsubbed,
+                  detectionthresholdmap):
+    """The maximum of data_bgsubbed - detectionthresholdmap over each of the
+    islands labelled 1 to num_labels, counting masked pixels as -1: an
+    island is significant where this is not negative.
+
+    Only the labelled pixels are looked at.
+
+    Returns:
+
+        numpy.ndarray: of length num_labels.
+    """
+    labels = labelled_data.ravel()
+    pixels = numpy.flatnonzero(labels)
+    above_det_thr = (
+        numpy.ma.getdata(data_bgsubbed).ravel()[pixels] -
+        numpy.ma.getdata(detectionthresholdmap).ravel()[pixels]
+    )
+    mask = numpy.ma.mask_or(numpy.ma.getmask(data_bgsubbed),
+                            numpy.ma.getmask(detectionthresholdmap))
+    if mask is not numpy.ma.nomask:
+        above_det_thr[mask.ravel()[pixels]] = -1
+    return numpy.atleast_1d(ndimage.maximum(
+        above_det_thr, labels[pixels], numpy.arange(1, num_labels + 1)))
+
+
+def _is_usable(det, masked):
+    """Check that both ends of each axis of det are usable; that is, that
+    they fall within an unmasked part of the image.
+
+    masked(x, y) returns the mask of the image at pixel (x, y), indexed as
+    a numpy array, and raises IndexError outside the image.
+    """
+    # The axis will not likely fall exactly on a pixel number, so
+    # check all the surroundings.
+    def check_point(x, y):
+        x = (int(x), int(numpy.ceil(x)))
+        y = (int(y), int(numpy.ceil(y)))
+        for position in itertools.product(x, y):
+            try:
+                if masked(position[0], position[1]):
+                    # Point falls in mask
+                    return False
+            except IndexError:
+                # Point falls completely outside image
+                return False
+        # Point is ok
+        return True
+    for point in (
+        (det.start_smaj_x, det.start_smaj_y),
+        (det.start_smin_x, det.start_smin_y),
+        (det.end_smaj_x, det.end_smaj_y),
+        (det.end_smin_x, det.end_smin_y)
+    ):
+        if not check_point(*point):
+            logger.debug("Unphysical source at pixel %f, %f" % (det.x.value, det.y.value))
+            return False
+    return True
+
 
 class ImageData(object):
     """Encapsulates an image in terms of a numpy array + meta/headerdata.
@@ -40,7 +581,10 @@ class ImageData(object):
     """
 
     def __init__(self, data, beam, wcs, margin=0, radius=0, back_size_x=32,
-                 back_size_y=32, residuals=True
+                 back_size_y=32, residuals=True, fit_workers=0,
+                 fit_threads=False, dtype=None, clip_seed=None,
+                 background_grids=None, cache_budget=None,
+                 moments_max_beams=0, moments_max_sig=0
     ):
         """Sets up an ImageData object.
 
@@ -51,13 +595,70 @@ class ImageData(object):
           - beam (3-tuple): beam shape specification as
             (semimajor, semiminor, theta)
 
+        *Kwargs:*
+          - residuals (bool): keep what is left over of each island after
+            deblending and fitting it, from which
+            residuals_from_deblending and residuals_from_gauss_fitting are
+            assembled when first asked for.
+          - fit_workers (int): number of islands to fit concurrently during
+            source extraction, by a pool of processes which is kept for the
+            images which follow. 0 or 1 fits them one after another, as
+            does a daemonic process (such as a worker of the multiprocessing
+            distribution method), which may not start processes of its own.
+          - fit_threads (bool): use a pool of threads, rather than of
+            processes, when fitting concurrently. The fits hold the GIL
+            for most of their time, so threads gain little.
+          - dtype (numpy.dtype): floating point type of the image data and of
+            the background, RMS, threshold and residual maps derived from
+            it. numpy.float32 halves the memory used per image. If not
+            given, floating point data is kept in its own type, other data
+            is converted to numpy.float64, and the maps are numpy.float64.
+            Islands are always fitted in double precision.
+          - clip_seed (:class:`ClipState`): the clip_state of a previous
+            image of the same field and geometry. The sigma clipping of each
+            background grid tile then starts from the pixels within that
+            image's final clipping limits, which takes fewer iterations than
+            clipping from scratch but can give a background and RMS which
+            differ from it by a few per cent; see
+            :func:`tkp.sourcefinder.stats.sigma_clip_tiles`. Ignored if the
+            grids do not cover the same region.
+          - background_grids (:class:`BackgroundGrids`): the
+            background_grids of another ImageData of the same data, margin,
+            radius and grid size, such as one used earlier for a blind
+            extraction. Its grids are then used rather than calculated
+            afresh. Ignored if they do not cover the same region.
+          - cache_budget (int): memory, in bytes, to hold at most in the
+            memoized maps of the size of the image (data, background, RMS
+            and background subtracted data). The least recently used are
+            discarded, and calculated again when next needed, to keep
+            within it. No limit if None. See memo_cache for the hits,
+            misses and memory held.
+          - moments_max_beams (float): islands covering no more than this
+            many beam areas are measured by their moments alone, rather
+            than by a Gauss fit, which makes little difference for
+            compact, unresolved sources but takes most of the time spent
+            measuring them. Such sources have ParamSet.gaussian False. 0
+            fits every island.
+          - moments_max_sig (float): if not 0, only islands no more
+            significant than this (see Island.sig()) are measured by
+            their moments alone.
+
         """
 
         # Do data, wcs and beam need deepcopy?
         # Probably not (memory overhead, in particular for data),
         # but then the user shouldn't change them outside ImageData in the
         # mean time
+        if dtype is None:
+            # Floating point data is used as it is given, rather than
+            # copied; the maps derived from it are double precision.
+            if not numpy.issubdtype(data.dtype, numpy.floating):
+                data = data.astype(numpy.float64)
+            dtype = numpy.float64
+        elif data.dtype != dtype:
+            data = data.astype(dtype)
         self.rawdata = data   # a 2D numpy array
+        self.dtype = numpy.dtype(dtype)   # of the maps derived from it
         self.wcs = wcs   # a utility.coordinates.wcs instance
         self.beam = beam   # tuple of (semimaj, semimin, theta)
         self.clip = {}
@@ -70,6 +671,18 @@ class ImageData(object):
         self.margin = margin
         self.radius = radius
         self.residuals = residuals
+        # Set by source extraction, if residuals is set.
+        self._residual_cutouts = None
+        self.fit_workers = fit_workers
+        self.fit_threads = fit_threads
+        self.moments_max_beams = moments_max_beams
+        self.moments_max_sig = moments_max_sig
+        self.clip_seed = clip_seed
+        self._given_grids = background_grids
+        self.memo_cache = MemoCache(cache_budget)
+        # Set when the background grids are calculated.
+        self.clip_state = None
+        self.clip_iterations = None
 
 
     ###########################################################################
@@ -79,20 +692,29 @@ class ImageData(object):
     # Properties are attributes managed by methods; rather than calling the   #
     # method directly, the attribute automatically invokes it. We can use     #
     # this to do cunning transparent caching ("memoizing") etc; see the       #
-    # Memoize class.                                                          #
+    # CachedMemoize class. Each image holds its memoized data in its own      #
+    # memo_cache, within the cache_budget given; the maps of the size of the  #
+    # image are discarded, least recently used first, to keep within it.      #
     #                                                                         #
     # clearcache() clears all the memoized data, which can get quite large.   #
     # It may be wise to call this, for example, in an exception handler       #
     # dealing with MemoryErrors.                                              #
     #                                                                         #
     ###########################################################################
-    @Memoize
+    @CachedMemoize()
     def _grids(self):
         """Gridded RMS and background data for interpolating"""
         return self.__grids()
     grids = property(fget=_grids, fdel=_grids.delete)
 
-    @Memoize
+    @property
+    def background_grids(self):
+        """The background and RMS grids, with the region they cover, as
+        may be handed to another ImageData of this image"""
+        return BackgroundGrids(self.useful_chunk, self.grids['bg'],
+                               self.grids['rms'])
+
+    @CachedMemoize(evictable=True)
     def _backmap(self):
         """Background map"""
         if not hasattr(self, "_user_backmap"):
@@ -107,7 +729,7 @@ class ImageData(object):
 
     backmap = property(fget=_backmap, fdel=_backmap.delete, fset=_set_backmap)
 
-    @Memoize
+    @CachedMemoize(evictable=True)
     def _get_rm(self):
         """RMS map"""
         if not hasattr(self, "_user_noisemap"):
@@ -118,10 +740,21 @@ class ImageData(object):
     def _set_rm(self, noisemap):
         self._user_noisemap = noisemap
         del(self.rmsmap)
+        del(self.rms_median)
 
     rmsmap = property(fget=_get_rm, fdel=_get_rm.delete, fset=_set_rm)
 
-    @Memoize
+    @CachedMemoize()
+    def _get_rms_median(self):
+        """Median of the unmasked RMS map"""
+        rms = numpy.ma.compressed(self.rmsmap)
+        # Only the middle value(s) need to be in place; their median is then
+        # taken just as numpy.ma.median() would for the whole map.
+        middle = sorted(set(((rms.size - 1) // 2, rms.size // 2)))
+        return numpy.ma.median(numpy.partition(rms, middle)[middle])
+    rms_median = property(fget=_get_rms_median, fdel=_get_rms_median.delete)
+
+    @CachedMemoize(evictable=True)
     def _get_data(self):
         """Masked image data"""
         # We will ignore all the data which is masked for the rest of the
@@ -131,25 +764,55 @@ class ImageData(object):
         # * A margin from the edge of the image;
         # * Any data outside a given radius from the centre of the image;
         # * Data which is "obviously" bad (equal to 0 or NaN).
-        mask = numpy.zeros((self.xdim, self.ydim))
-        if self.margin:
-            margin_mask = numpy.ones((self.xdim, self.ydim))
-            margin_mask[self.margin:-self.margin, self.margin:-self.margin] = 0
-            mask = numpy.logical_or(mask, margin_mask)
-        if self.radius:
-            radius_mask = utils.circular_mask(self.xdim, self.ydim, self.radius)
-            mask = numpy.logical_or(mask, radius_mask)
-        mask = numpy.logical_or(mask, numpy.isnan(self.rawdata))
+        #
+        # The first two are shared by all images of the same geometry.
+        geometry_mask = utils.geometry_mask(self.xdim, self.ydim,
+                                            self.margin, self.radius)[0]
+        mask = numpy.logical_or(geometry_mask, numpy.isnan(self.rawdata))
         return numpy.ma.array(self.rawdata, mask=mask)
     data = property(fget=_get_data, fdel=_get_data.delete)
 
-    @Memoize
+    @CachedMemoize()
+    def _get_useful_chunk(self):
+        """Bounding box of the unmasked data, as a pair of slices"""
+        # The bounding box of the margin and radius is shared by all images
+        # of the same geometry; only bad data within it can narrow it down.
+        chunk = None
+        outer = utils.geometry_mask(self.xdim, self.ydim,
+                                    self.margin, self.radius)[1]
+        if outer is not None:
+            inner = utils.bounding_box(~self.data.mask[outer])
+            if inner is not None:
+                chunk = tuple(slice(o.start + i.start, o.start + i.stop)
+                              for o, i in zip(outer, inner))
+        assert(chunk is not None)
+        return chunk
+    useful_chunk = property(fget=_get_useful_chunk,
+        fdel=_get_useful_chunk.delete)
+
+    @CachedMemoize(evictable=True)
     def _get_data_bgsubbed(self):
         """Background subtracted masked image data"""
         return self.data - self.backmap
     data_bgsubbed = property(fget=_get_data_bgsubbed,
         fdel=_get_data_bgsubbed.delete)
 
+    @CachedMemoize(evictable=True)
+    def _get_residuals_from_deblending(self):
+        """The islands of the last extraction, less those fitted"""
+        return self._residual_map('deblending')
+    residuals_from_deblending = property(
+        fget=_get_residuals_from_deblending,
+        fdel=_get_residuals_from_deblending.delete)
+
+    @CachedMemoize(evictable=True)
+    def _get_residuals_from_gauss_fitting(self):
+        """Residuals of the Gaussians fitted by the last extraction"""
+        return self._residual_map('gauss_fitting')
+    residuals_from_gauss_fitting = property(
+        fget=_get_residuals_from_gauss_fitting,
+        fdel=_get_residuals_from_gauss_fitting.delete)
+
     @property
     def xdim(self):
         """X pixel dimension of (unmasked) data"""
@@ -180,15 +843,8 @@ class ImageData(object):
         """
         self.labels.clear()
         self.clip.clear()
-        del(self.backmap)
-        del(self.rmsmap)
-        del(self.data)
-        del(self.data_bgsubbed)
-        del(self.grids)
-        if hasattr(self, 'residuals_from_gauss_fitting'):
-            del(self.residuals_from_gauss_fitting)
-        if hasattr(self, 'residuals_from_deblending'):
-            del(self.residuals_from_deblending)
+        self.memo_cache.clear()
+        self._residual_cutouts = None
 
 
     ###########################################################################
@@ -210,63 +866,60 @@ class ImageData(object):
         This is called automatically when ImageData.backmap,
         ImageData.rmsmap or ImageData.fdrmap is first accessed.
         """
-
-        # We set up a dedicated logging subchannel, as the sigmaclip loop
-        # logging is very chatty:
-        sigmaclip_logger = logging.getLogger(__name__+'.sigmaclip')
+        given = self._usable_given_grids()
+        if given is not None:
+            return given
 
         # there's no point in working with the whole of the data array
         # if it's masked.
-        useful_chunk = ndimage.find_objects(numpy.where(self.data.mask, 0, 1))
-        assert(len(useful_chunk) == 1)
-        useful_data = self.data[useful_chunk[0]]
-        my_xdim, my_ydim = useful_data.shape
-
-        rmsgrid, bggrid = [], []
-        for startx in xrange(0, my_xdim, self.back_size_x):
-            rmsrow, bgrow = [], []
-            for starty in xrange(0, my_ydim, self.back_size_y):
-                chunk = useful_data[
-                    startx:startx + self.back_size_x,
-                    starty:starty + self.back_size_y
-                ].ravel()
-                if not chunk.any():
-                    rmsrow.append(False)
-                    bgrow.append(False)
-                    continue
-                chunk, sigma, median, num_clip_its = stats.sigma_clip(
-                    chunk, self.beam)
-                if len(chunk) == 0 or not chunk.any():
-                    rmsrow.append(False)
-                    bgrow.append(False)
-                else:
-                    mean = numpy.mean(chunk)
-                    rmsrow.append(sigma)
-                    # In the case of a crowded field, the distribution will be
-                    # skewed and we take the median as the background level.
-                    # Otherwise, we take 2.5 * median - 1.5 * mean. This is the
-                    # same as SExtractor: see discussion at
-                    # <http://terapix.iap.fr/forum/showthread.php?tid=267>.
-                    # (mean - median) / sigma is a quick n' dirty skewness
-                    # estimator devised by Karl Pearson.
-                    if numpy.fabs(mean - median) / sigma >= 0.3:
-                        sigmaclip_logger.debug(
-                            'bg skewed, %f clipping iterations', num_clip_its)
-                        bgrow.append(median)
-                    else:
-                        sigmaclip_logger.debug(
-                            'bg not skewed, %f clipping iterations', num_clip_its)
-                        bgrow.append(2.5 * median - 1.5 * mean)
-
-            rmsgrid.append(rmsrow)
-            bggrid.append(bgrow)
-
-        rmsgrid = numpy.ma.array(
-            rmsgrid, mask=numpy.where(numpy.array(rmsgrid) == False, 1, 0))
-        bggrid = numpy.ma.array(
-            bggrid, mask=numpy.where(numpy.array(bggrid) == False, 1, 0))
-
-        return {'rms': rmsgrid, 'bg': bggrid}
+        useful_data = self.data[self.useful_chunk]
+        seed = self.clip_seed
+        if seed is not None:
+            if seed.useful_chunk == self.useful_chunk:
+                seed = seed[1:]
+            else:
+                logger.debug("Background grid differs from clip_seed; "
+                             "clipping from scratch")
+                seed = None
+        clipped = _clip_tiles(useful_data, self.back_size_x,
+                              self.back_size_y, self.beam, seed=seed,
+                              return_state=True)
+        sigma, median, mean, num_clip_its, valid, state = clipped
+        self.clip_state = ClipState(self.useful_chunk, *state)
+        self.clip_iterations = int(num_clip_its.sum())
+        return _background_grids(sigma, median, mean, num_clip_its, valid)
+
+    def _usable_given_grids(self):
+        """The grids given as background_grids, if they cover the region
+        this image's grids would; otherwise None."""
+        given = self._given_grids
+        if given is None:
+            return None
+        shape = tuple(-(-(axis.stop - axis.start) // size) for axis, size in
+                      zip(self.useful_chunk,
+                          (self.back_size_x, self.back_size_y)))
+        if (given.useful_chunk != self.useful_chunk or
+                given.bg.shape != shape or given.rms.shape != shape):
+            logger.debug("Background grids given cover a different region; "
+                         "calculating them afresh")
+            return None
+        return {'bg': given.bg, 'rms': given.rms}
+
+    def _residual_map(self, name):
+        """Assemble a residual map of the image from its cutouts.
+
+        Raises AttributeError if no residuals were kept, as if there were no
+        such map.
+        """
+        if self._residual_cutouts is None:
+            raise AttributeError("no residuals from source extraction")
+        residual_map = numpy.zeros(self.data.shape, dtype=self.dtype)
+        for chunk, cutout, sign in self._residual_cutouts[name]:
+            if sign > 0:
+                residual_map[chunk] += cutout
+            else:
+                residual_map[chunk] -= cutout
+        return residual_map
 
     def _interpolate(self, grid, roundup=False):
         """
@@ -292,55 +945,80 @@ class ImageData(object):
         """
         # there's no point in working with the whole of the data array if it's
         # masked.
-        useful_chunk = ndimage.find_objects(numpy.where(self.data.mask, 0, 1))
-        assert(len(useful_chunk) == 1)
-        my_xdim, my_ydim = self.data[useful_chunk[0]].shape
-
-        if MEDIAN_FILTER:
-            f_grid = ndimage.median_filter(grid, MEDIAN_FILTER)
-            if MF_THRESHOLD:
-                grid = numpy.where(
-                    numpy.fabs(f_grid - grid) > MF_THRESHOLD, f_grid, grid
-                )
-            else:
-                grid = f_grid
-
-        # Bicubic spline interpolation
-        xratio = float(my_xdim)/self.back_size_x
-        yratio = float(my_ydim)/self.back_size_y
-        # First arg: starting point. Second arg: ending point. Third arg:
-        # 1j * number of points. (Why is this complex? Sometimes, NumPy has an
-        # utterly baffling API...)
-        slicex = slice(-0.5, -0.5+xratio, 1j*my_xdim)
-        slicey = slice(-0.5, -0.5+yratio, 1j*my_ydim)
-        my_map = numpy.ma.MaskedArray(numpy.zeros(self.data.shape),
-                                      mask = self.data.mask)
-
-        # Remove the MaskedArrayFutureWarning warning and keep old numpy < 1.11
-        # behavior
-        my_map.unshare_mask()
-
-        my_map[useful_chunk[0]] = ndimage.map_coordinates(
-            grid, numpy.mgrid[slicex, slicey],
-            mode='nearest', order=INTERPOLATE_ORDER)
-
-        # If the input grid was entirely masked, then the output map must
-        # also be masked: there's no useful data here. We don't search for
-        # sources on a masked background/RMS, so this data will be cleanly
-        # skipped by the rest of the sourcefinder
-        if numpy.ma.getmask(grid).all():
-            my_map.mask = True
-        elif roundup:
-            # In some cases, the spline interpolation may produce values
-            # lower than the minimum value in the map. If required, these
-            # can be trimmed off. No point doing this if the map is already
-            # fully masked, though.
-            my_map = numpy.ma.MaskedArray(
-                    data = numpy.where(
-                        my_map >= numpy.min(grid), my_map, numpy.min(grid)),
-                    mask = my_map.mask
-            )
-        return my_map
+        return _grid_map(
+            grid, self.data.mask, self.useful_chunk,
+            (slice(0, self.xdim), slice(0, self.ydim)),
+            self.back_size_x, self.back_size_y, self.dtype, roundup
+        )
+
+    def _data_within(self, window):
+        """Masked image data within window, masked as ImageData.data"""
+        geometry_mask = utils.geometry_mask(self.xdim, self.ydim,
+                                            self.margin, self.radius)[0]
+        rawdata = self.rawdata[window]
+        return numpy.ma.array(rawdata, mask=numpy.logical_or(
+            geometry_mask[window], numpy.isnan(rawdata)))
+
+    def _local_maps(self, window):
+        """Masked data, background subtracted data and RMS map within window.
+
+        Rather than calculating the background and RMS grids over the whole
+        image, only the grid tiles about window are sigma clipped. The tiles
+        are aligned as for the whole image, so the maps within window are
+        the same as ImageData.data, ImageData.data_bgsubbed and
+        ImageData.rmsmap there, with two exceptions next to unusable tiles
+        (such as beyond the extraction radius). The RMS interpolated towards
+        them is raised to the lowest RMS of the tiles clipped here, rather
+        than of the whole image; and if every tile about window is unusable,
+        the maps are masked throughout. If the grids of the whole image were
+        given as background_grids, they are used instead.
+
+        Args:
+
+            window (tuple): pair of slices, within the image.
+
+        Returns:
+
+            tuple: three numpy.ma.MaskedArray of the shape of window.
+        """
+        data = self._data_within(window)
+        useful_chunk = self.useful_chunk
+        grids = self._usable_given_grids()
+        if grids is not None:
+            # The grids over the whole image are known already.
+            grid_offset = (0, 0)
+        else:
+            grids, grid_offset = self._local_grids(window)
+        grid_map = lambda grid, roundup: _grid_map(
+            grid, data.mask, useful_chunk, window, self.back_size_x,
+            self.back_size_y, self.dtype, roundup, grid_offset)
+        backmap = grid_map(grids['bg'], False)
+        rmsmap = grid_map(grids['rms'], True)
+        return data, data - backmap, rmsmap
+
+    def _local_grids(self, window):
+        """Background and RMS grids of just the tiles about window, and the
+        index of their first tile in the grids of the whole image."""
+        useful_chunk = self.useful_chunk
+        block = []
+        grid_offset = []
+        for axis, useful, size in zip(window, useful_chunk,
+                                      (self.back_size_x, self.back_size_y)):
+            num_tiles = -(-(useful.stop - useful.start) // size)
+            # Interpolating over a tile also draws on its neighbours: those
+            # below it, and as much as two above it towards the upper edge
+            # of the grid, where the tiles are stretched slightly.
+            first = max((axis.start - useful.start) // size - 1, 0)
+            last = min((axis.stop - 1 - useful.start) // size + 3, num_tiles)
+            first = min(first, num_tiles - 1)
+            last = max(last, first + 1)
+            block.append(slice(useful.start + first * size,
+                               min(useful.start + last * size, useful.stop)))
+            grid_offset.append(first)
+        grids = _background_grids(*_clip_tiles(
+            self._data_within(tuple(block)), self.back_size_x,
+            self.back_size_y, self.beam))
+        return grids, tuple(grid_offset)
 
     ###########################################################################
     #                                                                         #
@@ -478,19 +1156,18 @@ class ImageData(object):
         normalized_data = self.data_bgsubbed/self.rmsmap
 
         n1 = numpy.sqrt(2 * numpy.pi)
-        prob = numpy.sort(numpy.ravel(numpy.exp(-0.5 * normalized_data**2)/n1))
-        lengthprob = float(len(prob))
-        compare = (alpha / C_n) * numpy.arange(lengthprob+1)[1:] / lengthprob
+        # Every pixel of the image counts as a test, but only unmasked pixels
+        # can cross the threshold.
+        prob = numpy.exp(-0.5 * numpy.ma.compressed(normalized_data)**2)/n1
         # Find the last undercrossing, see, e.g., fig. 9 in Miller et al., AJ
-        # 122, 3492 (2001).  Searchsorted is not used because the array is not
-        # sorted.
-        try:
-            index = (numpy.where(prob-compare < 0.)[0]).max()
-        except ValueError:
+        # 122, 3492 (2001).
+        threshold_prob = stats.fdr_threshold(prob, alpha / C_n,
+                                             normalized_data.size)
+        if threshold_prob is None:
             # Everything below threshold
             return containers.ExtractionResults()
 
-        fdr_threshold = numpy.sqrt(-2.0 * numpy.log(n1 * prob[index]))
+        fdr_threshold = numpy.sqrt(-2.0 * numpy.log(n1 * threshold_prob))
         # Default we require that all source pixels are above the threshold,
         # not only the peak pixel.  This gives a better guarantee that indeed
         # the fraction of false positives is less than fdr_alpha in config.py.
@@ -520,7 +1197,8 @@ class ImageData(object):
         return (slice(x - ibr, x + ibr + 1),
                 slice(y - ibr, y + ibr + 1))
 
-    def fit_to_point(self, x, y, boxsize, threshold, fixed):
+    def fit_to_point(self, x, y, boxsize, threshold, fixed,
+                     local_background=False, prior=None):
         """Fit an elliptical Gaussian to a specified point on the image.
 
         The fit is carried on a square section of the image, of length
@@ -529,8 +1207,29 @@ class ImageData(object):
         is set to ``position``, then the pixel coordinates are fixed
         in the fit.
 
+        If *local_background* is set, the background and RMS are estimated
+        only from the background grid tiles about the fitted section (see
+        :meth:`_local_maps`), rather than mapped over the whole image, and
+        the island above *threshold* is only traced within the section.
+
+        If *prior* is given, a dict of values for (some of) ``peak``,
+        ``semimajor``, ``semiminor`` (pixels) and ``theta`` (radians), such
+        as a previous fit at the same position, the fit starts from those
+        rather than from the moments of the section.
+
         Returns an instance of :class:`tkp.sourcefinder.extract.Detection`.
         """
+        measurement = self._measure_at_point(x, y, boxsize, threshold, fixed,
+                                             local_background, prior)
+        if measurement is None:
+            return None
+        return extract.Detection(measurement, self)
+
+    def _measure_at_point(self, x, y, boxsize, threshold, fixed,
+                          local_background=False, prior=None):
+        """The measurement made by fit_to_point(), before it is turned into
+        a Detection; None if no fit could be made.
+        """
 
         logger.debug("Force-fitting pixel location ({},{})".format(x, y))
         # First, check that x and y are actually valid semi-positive integers.
@@ -545,11 +1244,23 @@ class ImageData(object):
             )
             return None
 
+        central_pixels_slice = ImageData.box_slice_about_pixel(x, y, 1)
+        chunk = ImageData.box_slice_about_pixel(x, y, boxsize/2.0)
+        pixel = (int(x), int(y))
+        if local_background:
+            # Work in a window holding just the pixels the fit looks at, with
+            # the slices taken from it matching those of the whole image.
+            window, (central_pixels_slice, chunk, pixel) = _window_about(
+                (central_pixels_slice, chunk, pixel), self.rawdata.shape)
+            data, data_bgsubbed, rmsmap = self._local_maps(window)
+        else:
+            data, data_bgsubbed, rmsmap = (self.data, self.data_bgsubbed,
+                                           self.rmsmap)
+
         # Next, check if any of the central pixels (in a 3x3 box about the
         # fitted pixel position) have been Masked
         # (e.g. if NaNs, or close to image edge) - reject if so.
-        central_pixels_slice = ImageData.box_slice_about_pixel(x, y, 1)
-        if self.data.mask[central_pixels_slice].any():
+        if data.mask[central_pixels_slice].any():
             logger.warning(
                 "Dropping forced fit at ({},{}), "
                    "Masked pixel in central fitting region".format(x,y))
@@ -558,38 +1269,43 @@ class ImageData(object):
         if ((
                 # Recent NumPy
                 hasattr(numpy.ma.core, "MaskedConstant") and
-                isinstance(self.rmsmap, numpy.ma.core.MaskedConstant)
+                isinstance(rmsmap, numpy.ma.core.MaskedConstant)
             ) or (
                 # Old NumPy
-                numpy.ma.is_masked(self.rmsmap[int(x), int(y)])
+                numpy.ma.is_masked(rmsmap[pixel])
         )):
             logger.error("Background is masked: cannot fit")
             return None
 
-        chunk = ImageData.box_slice_about_pixel(x, y, boxsize/2.0)
         if threshold is not None:
-            # We'll mask out anything below threshold*self.rmsmap from the fit.
-            labels, num = self.labels.setdefault( #Dictionary mapping threshold -> islands map
-                threshold,
-                ndimage.label(
-                    self.clip.setdefault( #Dictionary mapping threshold -> mask
-                        threshold,
-                        numpy.where(
-                            self.data_bgsubbed > threshold * self.rmsmap, 1, 0
+            # We'll mask out anything below threshold*rmsmap from the fit.
+            if local_background:
+                labels, num = ndimage.label(
+                    numpy.where(data_bgsubbed > threshold * rmsmap, 1, 0))
+            else:
+                labels, num = self.labels.setdefault( #Dictionary mapping threshold -> islands map
+                    threshold,
+                    ndimage.label(
+                        self.clip.setdefault( #Dictionary mapping threshold -> mask
+                            threshold,
+                            numpy.where(
+                                self.data_bgsubbed > threshold * self.rmsmap,
+                                1, 0
+                                )
                             )
                         )
                     )
-                )
 
-            mylabel = labels[int(x), int(y)]
+            mylabel = labels[pixel]
             if mylabel == 0:  # 'Background'
                 raise ValueError("Fit region is below specified threshold, fit aborted.")
             mask = numpy.where(labels[chunk] == mylabel, 0, 1)
-            fitme = numpy.ma.array(self.data_bgsubbed[chunk], mask=mask)
+            fitme = numpy.ma.array(data_bgsubbed[chunk], mask=mask,
+                                   dtype=numpy.float64)
             if len(fitme.compressed()) < 1:
                 raise IndexError("Fit region too close to edge or too small")
         else:
-            fitme = self.data_bgsubbed[chunk]
+            fitme = data_bgsubbed[chunk].astype(numpy.float64)
             if fitme.size < 1:
                 raise IndexError("Fit region too close to edge or too small")
 
@@ -610,8 +1326,9 @@ class ImageData(object):
         else:
             raise TypeError("Unkown fixed parameter")
 
+        noise_at_pixel = float(rmsmap[pixel])
         if threshold is not None:
-            threshold_at_pixel = threshold * self.rmsmap[int(x), int(y)]
+            threshold_at_pixel = threshold * noise_at_pixel
         else:
             threshold_at_pixel = None
 
@@ -619,9 +1336,10 @@ class ImageData(object):
             measurement, residuals = extract.source_profile_and_errors(
                 fitme,
                 threshold_at_pixel,
-                self.rmsmap[int(x), int(y)],
+                noise_at_pixel,
                 self.beam,
-                fixed=fixed
+                fixed=fixed,
+                prior=prior
             )
         except ValueError:
             # Fit failed to converge
@@ -637,13 +1355,13 @@ class ImageData(object):
 
         measurement['xbar'] += x-boxsize/2.0
         measurement['ybar'] += y-boxsize/2.0
-        measurement.sig = (fitme / self.rmsmap[chunk]).max()
+        measurement.sig = (fitme / rmsmap[chunk]).max()
 
-        return extract.Detection(measurement, self)
+        return measurement
 
     def fit_fixed_positions(self, positions, boxsize, threshold=None,
                             fixed='position+shape',
-                            ids=None):
+                            ids=None, local_background=False, priors=None):
         """
         Convenience function to fit a list of sources at the given positions
 
@@ -660,6 +1378,18 @@ class ImageData(object):
                 successfully fit positions will be returned in a tuple
                 along with the matching id. As these are simply passed back to
                 calling code they can be a string, tuple or whatever.
+            local_background (bool): estimate the background and RMS about
+                each position only, as for :py:func:`fit_to_point`. The
+                cost then scales with the number of positions rather than
+                the size of the image, which pays off for a few positions
+                in a large image.
+            priors (tuple): a list matching ``positions`` of dicts of
+                values from which to start each fit rather than from the
+                moments, such as the last measurement of the source; None
+                for positions without. The keys are among ``peak`` (as
+                measured), ``semimajor`` and ``semiminor`` (arcsec) and
+                ``theta`` (position angle, degrees east of north). Values
+                of None, and those for parameters held fixed, are ignored.
 
         In particular, boxsize is in pixel coordinates as in
         fit_to_point, not in sky coordinates.
@@ -674,44 +1404,118 @@ class ImageData(object):
 
         if ids is not None:
             assert len(ids)==len(positions)
+        if priors is None:
+            priors = [None] * len(positions)
+        assert len(priors) == len(positions)
+
+        # Positions are converted to and from celestial coordinates for all
+        # the fits together.
+        fits = []
+        fit_indices = []
+        if len(positions):
+            pixel_x, pixel_y = self.wcs.s2p_many(
+                [(posn[0], posn[1]) for posn in positions])
+            # Priors for parameters held fixed would go unused.
+            held = {
+                'position': ('xbar', 'ybar'),
+                'position+shape': ('xbar', 'ybar', 'semimajor', 'semiminor',
+                                   'theta'),
+            }.get(fixed, ())
+            priors = self._pixel_priors(positions, pixel_x, pixel_y, priors,
+                                        held)
+        for idx, posn in enumerate(positions):
+            x, y = pixel_x[idx], pixel_y[idx]
+            if numpy.isnan(x) or numpy.isnan(y):
+                logger.warning("Input coordinates (%.2f, %.2f) invalid: ",
+                                posn[0], posn[1])
+                continue
+            try:
+                measurement = self._measure_at_point(float(x), float(y),
+                                                     boxsize=boxsize,
+                                                     threshold=threshold,
+                                                     fixed=fixed,
+                                                     local_background=
+                                                     local_background,
+                                                     prior=priors[idx])
+            except IndexError as e:
+                logger.warning("Input pixel coordinates (%.2f, %.2f) "
+                                "could not be fit because: " + e.message,
+                                posn[0], posn[1])
+                continue
+            if measurement is None:
+                # We were unable to get a good fit
+                continue
+            fits.append(extract.Detection(measurement, self,
+                                          physical_coordinates=False))
+            fit_indices.append(idx)
 
         successful_fits = []
         successful_ids = []
-        for idx, posn in enumerate(positions):
-            try:
-                x, y, = self.wcs.s2p((posn[0], posn[1]))
-            except RuntimeError, e:
-                if (str(e).startswith("wcsp2s error: 8:") or
-                    str(e).startswith("wcsp2s error: 9:")):
-                    logger.warning("Input coordinates (%.2f, %.2f) invalid: ",
-                                    posn[0], posn[1])
-                else:
-                    raise
+        for fit_results, idx, located in zip(
+            fits, fit_indices, extract.calculate_physical_coordinates(fits)
+        ):
+            if not located:
+                continue
+            if ( fit_results.ra.error == float('inf') or
+                  fit_results.dec.error == float('inf')):
+                logging.warning("position errors extend outside image")
             else:
-                try:
-                    fit_results = self.fit_to_point(x, y,
-                                                boxsize=boxsize,
-                                                threshold=threshold,
-                                                fixed=fixed)
-                    if not fit_results:
-                        # We were unable to get a good fit
-                        continue
-                    if ( fit_results.ra.error == float('inf') or
-                          fit_results.dec.error == float('inf')):
-                        logging.warning("position errors extend outside image")
-                    else:
-                        successful_fits.append(fit_results)
-                        if ids:
-                            successful_ids.append(ids[idx])
-
-                except IndexError as e:
-                    logger.warning("Input pixel coordinates (%.2f, %.2f) "
-                                    "could not be fit because: " + e.message,
-                                    posn[0], posn[1])
+                successful_fits.append(fit_results)
+                if ids:
+                    successful_ids.append(ids[idx])
         if ids:
             return successful_fits, successful_ids
         return successful_fits
 
+    def _pixel_priors(self, positions, pixel_x, pixel_y, priors, held=()):
+        """Convert the priors of fit_fixed_positions() into the pixel terms
+        of fit_to_point(), leaving out those for the parameters in held.
+
+        Only priors on the shape need converting. The pixel scale and the
+        orientation of local north are found for all the positions with
+        such priors at once, from the pixel positions of points a small
+        step towards the equator from each.
+        """
+        pixel_priors = [None] * len(priors)
+        shaped = []
+        for idx, prior in enumerate(priors):
+            if not prior or numpy.isnan(pixel_x[idx]):
+                continue
+            pixel_priors[idx] = dict(
+                (key, value) for key, value in prior.items()
+                if value is not None and key not in held)
+            if any(key in pixel_priors[idx]
+                   for key in ('semimajor', 'semiminor', 'theta')):
+                shaped.append(idx)
+
+        if shaped:
+            ra = numpy.array([float(positions[idx][0]) for idx in shaped])
+            dec = numpy.array([float(positions[idx][1]) for idx in shaped])
+            step = numpy.where(dec > 0, -PRIOR_STEP, PRIOR_STEP)
+            step_x, step_y = self.wcs.s2p_many(zip(ra, dec + step))
+            north_x = ((numpy.asarray(step_x) - pixel_x[shaped]) *
+                       numpy.sign(step))
+            north_y = ((numpy.asarray(step_y) - pixel_y[shaped]) *
+                       numpy.sign(step))
+            arcsec_per_pixel = (PRIOR_STEP * 3600. /
+                                numpy.hypot(north_x, north_y))
+            # Theta is measured from the positive y-axis towards negative x,
+            # which is the sense in which position angles run east of north.
+            north_theta = numpy.arctan2(-north_x, north_y)
+
+            for i, idx in enumerate(shaped):
+                prior = pixel_priors[idx]
+                for key in ('semimajor', 'semiminor'):
+                    if key in prior:
+                        prior[key] = prior[key] / arcsec_per_pixel[i]
+                if 'theta' in prior:
+                    prior['theta'] = (numpy.radians(prior['theta']) +
+                                      north_theta[i])
+
+        return [prior if prior and numpy.isfinite(prior.values()).all()
+                else None
+                for prior in pixel_priors]
+
     def label_islands(self, detectionthresholdmap, analysisthresholdmap):
         """
         Return a lablled array of pixels for fitting.
@@ -729,7 +1533,7 @@ class ImageData(object):
             labelled islands (numpy.ndarray)
         """
         # If there is no usable data, we return an empty set of islands.
-        if not len(self.rmsmap.compressed()):
+        if numpy.ma.getmaskarray(self.rmsmap).all():
             logging.warning("RMS map masked; sourcefinding skipped")
             return [], numpy.zeros(self.data_bgsubbed.shape, dtype=numpy.int)
 
@@ -748,48 +1552,28 @@ class ImageData(object):
         # which contain no usable data; for example, the parts of the image
         # falling outside the circular region produced by awimager.
         RMS_FILTER = 0.001
-        clipped_data = numpy.ma.where(
-            (self.data_bgsubbed > analysisthresholdmap) &
-            (self.rmsmap >= (RMS_FILTER * numpy.ma.median(self.rmsmap))),
-            1, 0
-        ).filled(fill_value=0)
+        clipped_data = _island_pixels(self.data_bgsubbed, analysisthresholdmap,
+                                      self.rmsmap,
+                                      RMS_FILTER * self.rms_median)
         labelled_data, num_labels = ndimage.label(clipped_data, STRUCTURING_ELEMENT)
 
-        labels_below_det_thr, labels_above_det_thr = [], []
+        labels_above_det_thr = []
         if num_labels > 0:
             # Select the labels of the islands above the analysis threshold
             # that have maximum values values above the detection threshold.
             # Like above we make sure not to select anything where either
             # the data or the noise map are masked.
-            # We fill these pixels in above_det_thr with -1 to make sure
-            # its labels will not be in labels_above_det_thr.
-            # NB data_bgsubbed, and hence above_det_thr, is a masked array;
-            # filled() sets all mased values equal to -1.
-            above_det_thr = (
-                self.data_bgsubbed - detectionthresholdmap
-            ).filled(fill_value=-1)
-            # Note that we avoid label 0 (the background).
-            maximum_values = ndimage.maximum(
-                above_det_thr, labelled_data, numpy.arange(1, num_labels + 1)
-            )
-
-            # If there's only one island, ndimage.maximum will return a float,
-            # rather than a list. The rest of this function assumes that it's
-            # always a list, so we need to convert it.
-            if isinstance(maximum_values, float):
-                maximum_values = [maximum_values]
-
-            # We'll filter out the insignificant islands
-            for i, x in enumerate(maximum_values, 1):
-                if x < 0:
-                    labels_below_det_thr.append(i)
-                else:
-                    labels_above_det_thr.append(i)
+            maximum_values = _island_peaks(labelled_data, num_labels,
+                                           self.data_bgsubbed,
+                                           detectionthresholdmap)
+
+            # We'll filter out the insignificant islands, using a lookup
+            # table of the labels to keep; label 0 is the background.
+            keep = numpy.zeros(num_labels + 1, dtype=bool)
+            keep[1:] = ~(maximum_values < 0)
+            labels_above_det_thr = numpy.flatnonzero(keep).tolist()
             # Set to zero all labelled islands that are below det_thr:
-            labelled_data = numpy.where(
-                numpy.in1d(labelled_data.ravel(), labels_above_det_thr).reshape(labelled_data.shape),
-                labelled_data, 0
-            )
+            labelled_data[~keep[labelled_data]] = 0
 
         return labels_above_det_thr, labelled_data
 
@@ -841,26 +1625,28 @@ class ImageData(object):
 
         for label in labels:
             chunk = slices[label-1]
-            analysis_threshold = (analysisthresholdmap[chunk] /
-                                  self.rmsmap[chunk]).max()
+            analysis_threshold = float((analysisthresholdmap[chunk] /
+                                        self.rmsmap[chunk]).max())
             # In selected_data only the pixels with the "correct"
             # (see above) labels are retained. Other pixel values are
             # set to -(bignum).
             # In this way, disconnected pixels within (rectangular)
             # slices around islands (particularly the large ones) do
             # not affect the source measurements.
+            # Whatever the precision of the image, islands are fitted in
+            # double precision.
             selected_data = numpy.ma.where(
                 labelled_data[chunk] == label,
                 self.data_bgsubbed[chunk].data, -extract.BIGNUM
-            ).filled(fill_value=-extract.BIGNUM)
+            ).filled(fill_value=-extract.BIGNUM).astype(numpy.float64)
 
             island_list.append(
                 extract.Island(
                     selected_data,
-                    self.rmsmap[chunk],
+                    self.rmsmap[chunk].astype(numpy.float64),
                     chunk,
                     analysis_threshold,
-                    detectionthresholdmap[chunk],
+                    detectionthresholdmap[chunk].astype(numpy.float64),
                     self.beam,
                     deblend_nthresh,
                     DEBLEND_MINCONT,
@@ -869,13 +1655,20 @@ class ImageData(object):
             )
 
         # If required, we can save the 'left overs' from the deblending and
-        # fitting processes for later analysis. This needs setting up here:
+        # fitting processes for later analysis. Only the cutouts about each
+        # island are kept; they are assembled into maps of the whole image
+        # if those are asked for. This needs setting up here:
+        del(self.residuals_from_deblending)
+        del(self.residuals_from_gauss_fitting)
+        self._residual_cutouts = None
         if self.residuals:
-            self.residuals_from_gauss_fitting = numpy.zeros(self.data.shape)
-            self.residuals_from_deblending = numpy.zeros(self.data.shape)
-            for island in island_list:
-                self.residuals_from_deblending[island.chunk] += (
-                    island.data.filled(fill_value=0.))
+            deblending_cutouts = [
+                (island.chunk, island.data.filled(fill_value=0.), 1)
+                for island in island_list
+            ]
+            gauss_fitting_cutouts = []
+            self._residual_cutouts = {'deblending': deblending_cutouts,
+                                      'gauss_fitting': gauss_fitting_cutouts}
 
         # Deblend each of the islands to its consituent parts, if necessary
         if deblend_nthresh:
@@ -891,61 +1684,69 @@ class ImageData(object):
         else:
             fixed = None
 
-        # Iterate over the list of islands and measure the source in each,
-        # appending it to the results list.
-        results = containers.ExtractionResults()
-        for island in island_list:
-            fit_results = island.fit(fixed=fixed)
+        # Measure the source in each of the islands, then iterate over the
+        # list of islands appending the measurements to the results list.
+        detections = []
+        for island, fit_results in zip(
+            island_list, self._fit_islands(island_list, fixed)
+        ):
             if fit_results:
                 measurement, residual = fit_results
             else:
                 # Failed to fit; drop this island and go to the next.
                 continue
-            try:
-                det = extract.Detection(measurement, self, chunk=island.chunk)
-                if (det.ra.error == float('inf') or
-                        det.dec.error == float('inf')):
-                    logger.warn('Bad fit from blind extraction at pixel coords:'
-                                  '%f %f - measurement discarded'
-                                  '(increase fitting margin?)', det.x, det.y )
-                else:
-                    results.append(det)
-            except RuntimeError as e:
-                logger.error("Island not processed; unphysical?")
+            detections.append(extract.Detection(
+                measurement, self, chunk=island.chunk,
+                physical_coordinates=False))
 
             if self.residuals:
-                self.residuals_from_deblending[island.chunk] -= (
-                    island.data.filled(fill_value=0.))
-                self.residuals_from_gauss_fitting[island.chunk] += residual
-
-
-        def is_usable(det):
-            # Check that both ends of each axis are usable; that is, that they
-            # fall within an unmasked part of the image.
-            # The axis will not likely fall exactly on a pixel number, so
-            # check all the surroundings.
-            def check_point(x, y):
-                x = (int(x), int(numpy.ceil(x)))
-                y = (int(y), int(numpy.ceil(y)))
-                for position in itertools.product(x, y):
-                    try:
-                        if self.data.mask[position[0], position[1]]:
-                            # Point falls in mask
-                            return False
-                    except IndexError:
-                        # Point falls completely outside image
-                        return False
-                # Point is ok
-                return True
-            for point in (
-                (det.start_smaj_x, det.start_smaj_y),
-                (det.start_smin_x, det.start_smin_y),
-                (det.end_smaj_x, det.end_smaj_y),
-                (det.end_smin_x, det.end_smin_y)
-            ):
-                if not check_point(*point):
-                    logger.debug("Unphysical source at pixel %f, %f" % (det.x.value, det.y.value))
-                    return False
-            return True
+                deblending_cutouts.append(
+                    (island.chunk, island.data.filled(fill_value=0.), -1))
+                gauss_fitting_cutouts.append((island.chunk, residual, 1))
+
+        # The celestial coordinates of all the detections are calculated
+        # together.
+        results = containers.ExtractionResults()
+        for det, located in zip(
+            detections, extract.calculate_physical_coordinates(detections)
+        ):
+            if not located:
+                logger.error("Island not processed; unphysical?")
+            elif (det.ra.error == float('inf') or
+                    det.dec.error == float('inf')):
+                logger.warn('Bad fit from blind extraction at pixel coords:'
+                              '%f %f - measurement discarded'
+                              '(increase fitting margin?)', det.x, det.y )
+            else:
+                results.append(det)
+
+
+        def masked(x, y):
+            return self.data.mask[x, y]
         # Filter will return a list; ensure we return an ExtractionResults.
-        return containers.ExtractionResults(filter(is_usable, results))
+        return containers.ExtractionResults(
+            filter(lambda det: _is_usable(det, masked), results))
+
+    def _fit_islands(self, island_list, fixed):
+        """
+        Fit each of the islands in island_list.
+
+        If fit_workers is larger than one, the islands are fitted
+        concurrently by a pool of that many workers.
+
+        Args:
+
+            island_list (list): :class:`tkp.sourcefinder.extract.Island`
+                instances to fit.
+
+            fixed (dict): parameters to hold fixed; see
+                :func:`tkp.sourcefinder.extract.Island.fit`.
+
+        Returns:
+
+            list: the result of Island.fit() for each island, in the same
+            order as island_list.
+        """
+        return _fit_island_list(
+            island_list, fixed, self.fit_workers, self.fit_threads,
+            self.moments_max_beams, self.moments_max_sig)
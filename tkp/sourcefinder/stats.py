@@ -55,73 +55,416 @@ def unbiased_sigma(N_indep):
     return 1.4142135623730951 * erfcinv(0.5 / N_indep)
 
 
-def sigma_clip(data, beam, sigma=unbiased_sigma, max_iter=100,
-               centref=numpy.median, distf=numpy.var, my_iterations=0,
-               corr_clip=1.):
-    """Iterative clipping
+def clip_about_median(data, limit, max_iter=None):
+    """Iterative clipping about the median
 
-    By default, this performs clipping of the standard deviation about the
-    median of the data. But by tweaking centref/distf, it could be much
-    more general.
+    Each iteration leaves out the values further than a limit from their
+    median, until an iteration leaves out nothing more. The data are copied
+    once into a working buffer; the values retained are compacted, in
+    their original order, into a second buffer of the same size, and the
+    two swap roles in every iteration. The median is found by partitioning
+    a scratch buffer, and the variance and the values to keep are
+    calculated into preallocated arrays as well. Nothing is allocated per
+    iteration, and there is no recursion, however many iterations clipping
+    takes.
 
-    max_iter sets the maximum number of iterations used.
+    Args:
 
-    my_iterations is a counter for recursive operation of the code; leave it
-    alone unless you really want to pretend to jump into the middle of a loop.
+        data (numpy.ndarray): the values to clip, of any shape. Masked
+            values of a MaskedArray are ignored.
 
-    sigma is subtle: if a callable is given, it is passed a copy of the data
-    array and can calculate a clipping limit. See, for e.g., unbiased_sigma()
-    defined above. However, if it isn't callable, sigma is assumed to just set
-    a hard limit.
+        limit (callable): called with the number of values retained and
+            their variance (without Bessel's correction) in each
+            iteration. It returns the clipping limit about the median, or
+            None if the values are too few to clip.
 
-    To do: Improve documentation
-            -Returns???
-            -How does it make use of the beam? (It estimates the noise correlation)
-    """
-    if my_iterations >= max_iter:
-        # Exceeded maximum number of iterations; return
-        return data, my_iterations
+    Kwargs:
+
+        max_iter (int): maximum number of clipping iterations, or None for
+            no limit.
 
-    # Numpy 1.1 breaks std() for MaskedArray: see
-    # <http://www.scipy.org/scipy/numpy/wiki/MaskedArray>.
-    # MaskedArray.compressed() returns a 1-D array of non-masked data.
+    Returns:
+
+        tuple: the values retained, as a 1D array, their median and the
+        number of clipping iterations. Where max_iter is reached, the
+        values retained by the last iteration are returned without
+        clipping them any further. If limit returns None, None is
+        returned.
+    """
     if isinstance(data, MaskedArray):
         data = data.compressed()
-    centre = centref(data)
-    N = numpy.size(data)
-    N_indep = indep_pixels(N, beam)
-    if N_indep < 1:
-        # This chunk is too small for processing; return an empty array.
+    data = numpy.ravel(data)
+    if not numpy.issubdtype(data.dtype, numpy.floating):
+        data = data.astype(float)
+    # The values retained live at the start of work, compacted into spare
+    # in each iteration; scratch takes partitions and deviations.
+    work = data.copy()
+    spare = numpy.empty_like(work)
+    scratch = numpy.empty_like(work)
+    keep = numpy.empty(len(work), dtype=bool)
+
+    N = len(work)
+    iterations = 0
+    while True:
+        retained = work[:N]
+        part = scratch[:N]
+        if N:
+            # As numpy.median(), but without allocating.
+            part[...] = retained
+            part.partition(((N - 1) // 2, N // 2))
+            centre = part[(N - 1) // 2:N // 2 + 1].mean()
+            # As numpy.var(), ditto.
+            numpy.subtract(retained, retained.mean(), out=part)
+            numpy.multiply(part, part, out=part)
+            variance = part.mean()
+        else:
+            centre = variance = numpy.nan
+        my_limit = limit(N, variance)
+        if my_limit is None:
+            return None
+        if not N or (max_iter is not None and iterations >= max_iter):
+            break
+
+        numpy.subtract(retained, centre, out=part)
+        numpy.absolute(part, out=part)
+        numpy.less_equal(part, my_limit, out=keep[:N])
+        new_N = numpy.count_nonzero(keep[:N])
+        if new_N == N:
+            break
+        elif new_N == 0:
+            # Clipping has removed all the data.
+            N = 0
+            break
+        numpy.compress(keep[:N], retained, out=spare[:new_N])
+        work, spare = spare, work
+        N = new_N
+        iterations += 1
+    return work[:N], centre, iterations
+
+
+def sigma_clip(data, beam, sigma=unbiased_sigma, max_iter=100):
+    """Iterative clipping
+
+    This performs clipping of the standard deviation about the median of
+    the data, using clip_about_median(). The standard deviation is
+    corrected for the correlation of the noise between pixels and for the
+    clipping of the distribution.
+
+    sigma is subtle: if a callable is given, it is passed the number of
+    independent pixels and can calculate a clipping limit. See, for e.g.,
+    unbiased_sigma() defined above. However, if it isn't callable, sigma is
+    assumed to just set a hard limit.
+
+    Args:
+
+        data (numpy.ndarray): the pixels to clip. Masked pixels of a
+            MaskedArray are ignored.
+
+        beam (tuple): beam parameters (semimaj, semimin, theta), used to
+            estimate the number of independent pixels.
+
+    Kwargs:
+
+        sigma: clipping limit, see above.
+
+        max_iter (int): maximum number of clipping iterations.
+
+    Returns:
+
+        tuple: the pixels retained, their unbiased standard deviation and
+        median, and the number of clipping iterations. If there are fewer
+        pixels than independent ones, (numpy.array([]), 0, 0, 0) is
+        returned.
+    """
+    # The unbiased standard deviation of the latest iteration, and the
+    # clipping correction for the next.
+    state = {'std': 0., 'corr_clip': 1.}
+
+    def limit(N, variance):
+        N_indep = indep_pixels(N, beam)
+        if N_indep < 1:
+            # This chunk is too small for processing.
+            return None
+
+        # If sigma is callable, use it to dynamically calculate the
+        # clipping limits.
+        if callable(sigma):
+            my_sigma = sigma(N_indep)
+        else:
+            my_sigma = sigma
+
+        # The variance is that of the N pixels, which is biased by a
+        # factor (N-1)/N. So, we are going to remove that and replace it
+        # by N_indep/(N_indep-1).
+        clipped_var = variance * (N - 1.) * N_indep / (N * (N_indep - 1.))
+        unbiased_var = state['corr_clip'] * clipped_var
+
+        # There is an extra factor c4 needed to get a unbiased standard
+        # deviation, unbiased if we disregard clipping bias, see
+        # http://en.wikipedia.org/wiki/Unbiased_estimation_of_standard_deviation\
+        #         #Results_for_the_normal_distribution
+        c4 = 1. - 0.25 / N_indep - 0.21875 / N_indep**2
+        state['std'] = numpy.sqrt(unbiased_var) / c4
+        # Should this iteration clip any pixels, the next one corrects
+        # for that.
+        state['corr_clip'] = var_helper(my_sigma)
+        return my_sigma * state['std']
+
+    clipped = clip_about_median(data, limit, max_iter)
+    if clipped is None:
         return numpy.array([]), 0, 0, 0
+    newdata, centre, iterations = clipped
+    return newdata, state['std'], centre, iterations
+
+
+def _bisect_tiles(ordered, rows, start, stop, centre, limit, inside):
+    """Find, for each of the given rows of ordered, the first index in
+    [start, stop) at which "abs(value - centre) <= limit" equals inside;
+    stop if there is none.
+
+    The rows of ordered are sorted, so that condition is monotonic over
+    each half of a row split at its median.
+    """
+    lower, upper = start.copy(), stop.copy()
+    searching = lower < upper
+    while searching.any():
+        middle = (lower + upper) // 2
+        found = (
+            abs(ordered[rows, numpy.minimum(middle, ordered.shape[1] - 1)] -
+                centre) <= limit
+        ) == inside
+        upper = numpy.where(searching & found, middle, upper)
+        lower = numpy.where(searching & ~found, middle + 1, lower)
+        searching = lower < upper
+    return lower
+
+
+def sigma_clip_tiles(tiles, beam, sigma=unbiased_sigma, max_iter=100,
+                     seed=None, return_state=False):
+    """Iterative clipping of many tiles at once
+
+    This performs the same clipping of the standard deviation about the
+    median as sigma_clip(), with the same bias corrections, but does so
+    for every row of a 2D (tiles, pixels) array simultaneously. It is used
+    to calculate the background and RMS grids of an image in a handful of
+    array operations rather than by calling sigma_clip() for each tile.
+
+    Each tile is sorted once. Clipping about the median retains values
+    within an interval, so the data retained always form a contiguous run
+    of the sorted tile. A tile is then described by the bounds of that
+    run: its median is read off directly, its mean and variance follow
+    from cumulative sums, and clipping reduces to a binary search for the
+    new bounds.
+
+    Args:
 
-    # If sigma is callable, use it to dynamically calculate the clipping
-    # limits.
-    if callable(sigma):
-        my_sigma = sigma(N_indep)
-    else:
-        my_sigma = sigma
-
-    # distf=numpy.var is a sample variance with the factor N/(N-1)
-    # already built in, N being the number of pixels. So, we are
-    # going to remove that and replace it by N_indep/(N_indep-1)
-    clipped_var = distf(data) * (N - 1.) * N_indep / (N * (N_indep - 1.))
-    unbiased_var = corr_clip * clipped_var
-
-    # There is an extra factor c4 needed to get a unbiased standard
-    # deviation, unbiased if we disregard clipping bias, see
-    # http://en.wikipedia.org/wiki/Unbiased_estimation_of_standard_deviation\
-    #         #Results_for_the_normal_distribution
-    c4 = 1. - 0.25 / N_indep - 0.21875 / N_indep**2
-    unbiased_std = numpy.sqrt(unbiased_var) / c4
-
-    limit = my_sigma * unbiased_std
-
-    newdata = data.compress(abs(data - centre) <= limit)
-
-    if len(newdata) != len(data) and len(newdata) > 0:
-        corr_clip = var_helper(my_sigma)
-        my_iterations += 1
-        return sigma_clip(newdata, beam, sigma, max_iter, centref, distf,
-                          my_iterations, corr_clip)
-    else:
-        return newdata, unbiased_std, centre, my_iterations
+        tiles (numpy.ma.MaskedArray): 2D array, each row holding the pixels
+            of one tile. Masked pixels are ignored.
+
+        beam (tuple): beam parameters (semimaj, semimin, theta), used to
+            estimate the number of independent pixels.
+
+    Kwargs:
+
+        sigma: clipping limit, as for sigma_clip().
+
+        max_iter (int): maximum number of clipping iterations per tile.
+
+        seed (tuple): the final clipping state of similar data (such as
+            the previous image of the same field), as returned with
+            return_state. Where its centre and limit are finite, a tile
+            starts out with the pixels within limit of centre, rather than
+            with all its pixels, and is then clipped until it reaches a set
+            of pixels which clipping leaves unchanged. That set need not
+            be the one clipping from scratch ends up with, so the
+            statistics of a warm started tile differ from those of a cold
+            started one, typically by up to a few per cent.
+
+        return_state (bool): also return the final clipping state, to seed
+            the clipping of the next image.
+
+    Returns:
+
+        tuple: arrays of length ntiles holding, for every tile, the
+        unbiased standard deviation, the median and the mean of the
+        clipped data, the number of clipping iterations and a boolean
+        which is False where the tile holds no usable data (that is,
+        where sigma_clip() would have returned an empty array, or where
+        only zero valued pixels survive clipping). With return_state, a
+        sixth item follows: a tuple of arrays holding the centre and
+        clipping limit of each tile in its final iteration.
+    """
+    ntiles, npix = tiles.shape
+    # Masked pixels are sorted to the end of each row, beyond upper.
+    ordered = numpy.sort(numpy.ma.filled(tiles, numpy.inf), axis=1)
+    rows = numpy.arange(ntiles)
+    lower = numpy.zeros(ntiles, dtype=numpy.intp)
+    upper = numpy.ma.count(tiles, axis=1).astype(numpy.intp)
+    valid = upper > 0
+    count = upper.copy()
+
+    # The cumulative sums are taken relative to the median of the unclipped
+    # data, which keeps rounding errors in the variance small.
+    shift = numpy.zeros(ntiles)
+    shift[valid] = 0.5 * (
+        ordered[rows, (upper - 1) // 2] + ordered[rows, upper // 2]
+    )[valid]
+    cumsum = numpy.zeros((ntiles, npix + 1))
+    cumsum_sq = numpy.zeros((ntiles, npix + 1))
+    with numpy.errstate(invalid='ignore'):
+        numpy.subtract(ordered, shift[:, numpy.newaxis], out=cumsum[:, 1:])
+        numpy.square(cumsum[:, 1:], out=cumsum_sq[:, 1:])
+        numpy.cumsum(cumsum[:, 1:], axis=1, out=cumsum[:, 1:])
+        numpy.cumsum(cumsum_sq[:, 1:], axis=1, out=cumsum_sq[:, 1:])
+
+    corr_clip = numpy.ones(ntiles)
+    std = numpy.zeros(ntiles)
+    centre = numpy.zeros(ntiles)
+    mean = numpy.zeros(ntiles)
+    limits = numpy.zeros(ntiles)
+    iterations = numpy.zeros(ntiles, dtype=numpy.int)
+    active = valid.copy()
+
+    # Warm started tiles may take back pixels as well as leave them out, so
+    # their bounds are searched for over the whole of the tile.
+    warm = numpy.zeros(ntiles, dtype=bool)
+    if seed is not None:
+        seed_centre, seed_limit = (
+            numpy.asarray(value, dtype=float) for value in seed)
+        warm = valid & numpy.isfinite(seed_centre) & numpy.isfinite(seed_limit)
+        idx = numpy.flatnonzero(warm)
+        seed_lower = (ordered[idx] <
+                      (seed_centre[idx] - seed_limit[idx])[:, numpy.newaxis]
+                      ).sum(axis=1)
+        seed_upper = (ordered[idx] <=
+                      (seed_centre[idx] + seed_limit[idx])[:, numpy.newaxis]
+                      ).sum(axis=1)
+        # Tiles with no pixels within the seeded limits start from scratch.
+        started = seed_upper > seed_lower
+        warm[idx[~started]] = False
+        idx = idx[started]
+        lower[idx] = seed_lower[started]
+        upper[idx] = seed_upper[started]
+
+    while active.any():
+        idx = numpy.flatnonzero(active)
+        N = upper[idx] - lower[idx]
+        N_indep = indep_pixels(N, beam)
+
+        # These tiles are too small for processing.
+        too_small = N_indep < 1
+        valid[idx[too_small]] = False
+        active[idx[too_small]] = False
+        idx, N, N_indep = idx[~too_small], N[~too_small], N_indep[~too_small]
+        if not len(idx):
+            break
+
+        lower_median = lower[idx] + (N - 1) // 2
+        upper_median = lower[idx] + N // 2
+        my_centre = 0.5 * (ordered[idx, lower_median] +
+                           ordered[idx, upper_median])
+        my_sum = cumsum[idx, upper[idx]] - cumsum[idx, lower[idx]]
+        my_sum_sq = cumsum_sq[idx, upper[idx]] - cumsum_sq[idx, lower[idx]]
+        my_mean = my_sum / N
+        my_var = numpy.maximum(my_sum_sq / N - my_mean**2, 0.)
+        my_mean += shift[idx]
+
+        if callable(sigma):
+            my_sigma = sigma(N_indep)
+        else:
+            my_sigma = sigma * numpy.ones(len(idx))
+
+        # See sigma_clip() for the derivation of these corrections.
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            clipped_var = my_var * (N - 1.) * N_indep / (N * (N_indep - 1.))
+            unbiased_var = corr_clip[idx] * clipped_var
+            c4 = 1. - 0.25 / N_indep - 0.21875 / N_indep**2
+            unbiased_std = numpy.sqrt(unbiased_var) / c4
+            limit = my_sigma * unbiased_std
+
+            # Everything between new_lower and new_upper lies within limit
+            # of the median.
+            new_lower = _bisect_tiles(ordered, idx,
+                                      numpy.where(warm[idx], 0, lower[idx]),
+                                      lower_median + 1, my_centre, limit,
+                                      True)
+            new_upper = _bisect_tiles(ordered, idx, upper_median,
+                                      numpy.where(warm[idx], count[idx],
+                                                  upper[idx]),
+                                      my_centre, limit, False)
+        new_N = numpy.maximum(new_upper - new_lower, 0)
+
+        std[idx] = unbiased_std
+        centre[idx] = my_centre
+        mean[idx] = my_mean
+        limits[idx] = limit
+
+        clipped = (((new_lower != lower[idx]) | (new_upper != upper[idx])) &
+                   (new_N > 0))
+        clipped_idx = idx[clipped]
+        lower[clipped_idx] = new_lower[clipped]
+        upper[clipped_idx] = new_upper[clipped]
+        corr_clip[clipped_idx] = var_helper(my_sigma[clipped])
+        iterations[clipped_idx] += 1
+
+        # Clipping has converged, or removed all the data.
+        valid[idx[new_N == 0]] = False
+        active[idx[~clipped]] = False
+        # Tiles which reach the iteration limit keep the values from their
+        # last iteration.
+        active[clipped_idx[iterations[clipped_idx] >= max_iter]] = False
+
+    # A tile where only zeros survive clipping is not usable either.
+    valid &= ((ordered[rows, lower] != 0) |
+              (ordered[rows, numpy.maximum(upper - 1, 0)] != 0))
+
+    if return_state:
+        return (std, centre, mean, iterations, valid,
+                (centre, limits))
+    return std, centre, mean, iterations, valid
+
+
+def fdr_threshold(prob, alpha, num_tests=None):
+    """The probability at the last undercrossing of the False Detection Rate
+    procedure.
+
+    With the probabilities sorted in ascending order, that is the largest
+    prob[i - 1] (counting i from 1) for which prob[i - 1] < alpha * i /
+    num_tests. See, e.g., fig. 9 in Miller et al., AJ 122, 3492 (2001).
+
+    Rather than sorting the probabilities, note that the i'th smallest of
+    them lies below alpha * i / num_tests exactly when at least i of them
+    do. Counting how many probabilities lie below each of those limits is
+    a single histogram, so the undercrossing is found in linear time, and
+    only the probability there is selected from the rest.
+
+    Args:
+
+        prob (numpy.ndarray): the probabilities, in any order.
+
+        alpha (float): the false detection rate.
+
+    Kwargs:
+
+        num_tests (int): the number of tests made, if not len(prob).
+
+    Returns:
+
+        float: the probability at the last undercrossing, or None if there
+        is none.
+    """
+    prob = numpy.ravel(prob)
+    if num_tests is None:
+        num_tests = len(prob)
+    if not len(prob):
+        return None
+    # prob[j] lies below the limit for i exactly when its bin is below i.
+    bins = numpy.floor(prob * (num_tests / float(alpha)))
+    bins = bins[bins < len(prob)].astype(numpy.intp)
+    below = numpy.cumsum(numpy.bincount(bins, minlength=len(prob)))
+    undercrossings = numpy.flatnonzero(
+        below >= numpy.arange(1, len(prob) + 1))
+    if not len(undercrossings):
+        return None
+    index = undercrossings[-1]
+    return numpy.partition(prob, index)[index]
@@ -0,0 +1,506 @@
+"""
+Source extraction on images too large to hold in memory.
+
+:class:`TiledImageData` runs the same source extraction as
+:class:`tkp.sourcefinder.image.ImageData`, but reads the image one tile at a
+time, so that it can work from a memory mapped array (see the ``memmap``
+option of :class:`tkp.accessors.fitsimage.FitsImage`). Peak memory use is
+determined by the tile size rather than by the size of the image.
+"""
+
+import logging
+import numpy
+from tkp.utility import containers
+from tkp.sourcefinder import extract
+from tkp.sourcefinder import utils
+from tkp.sourcefinder.image import (
+    DEBLEND_MINCONT, STRUCTURING_ELEMENT, _clip_tiles, _background_grids,
+    _grid_map, _is_usable, _fit_island_list, _island_pixels, _island_peaks
+)
+try:
+    import ndimage
+except ImportError:
+    from scipy import ndimage
+
+
+logger = logging.getLogger(__name__)
+
+RMS_FILTER = 0.001   # As in ImageData.label_islands()
+ISLAND_BATCH = 1000  # Number of islands deblended and fitted in one go
+MEDIAN_BINS = 256    # Histogram bins per pass when locating the RMS median
+
+
+def _tiles(chunk, tile_size_x, tile_size_y):
+    """Cut the region chunk (a pair of slices) into tiles, in raster order"""
+    for xstart in xrange(chunk[0].start, chunk[0].stop, tile_size_x):
+        for ystart in xrange(chunk[1].start, chunk[1].stop, tile_size_y):
+            yield (slice(xstart, min(xstart + tile_size_x, chunk[0].stop)),
+                   slice(ystart, min(ystart + tile_size_y, chunk[1].stop)))
+
+
+def _kth_value(values, k, limit):
+    """
+    Return the k-th smallest (counting from 0) of the values in a sequence
+    of arrays which is too large to sort in memory.
+
+    values() returns a fresh iterator over the arrays on each call. Each pass
+    narrows down the range of values holding the k-th by histogramming, until
+    at most limit values are left, which are then sorted.
+    """
+    lo, hi = -numpy.inf, numpy.inf
+    below = 0    # Number of values smaller than lo
+    edges = None
+    while True:
+        count, vmin, vmax = 0, numpy.inf, -numpy.inf
+        collected = []
+        if edges is not None:
+            histogram = numpy.zeros(len(edges) - 1, dtype=numpy.int64)
+        for value in values():
+            value = value.astype(numpy.float64)
+            value = value[(value >= lo) & (value < hi)]
+            if not len(value):
+                continue
+            count += len(value)
+            vmin, vmax = min(vmin, value.min()), max(vmax, value.max())
+            if collected is not None:
+                collected.append(value)
+                if count > limit:
+                    collected = None
+            if edges is not None:
+                bins = numpy.minimum(
+                    numpy.searchsorted(edges, value, 'right') - 1,
+                    len(edges) - 2)
+                histogram += numpy.bincount(bins, minlength=len(histogram))
+        if collected is not None:
+            return numpy.sort(numpy.concatenate(collected))[k - below]
+        if vmin == vmax:
+            return vmin
+        if edges is not None:
+            cumulative = numpy.cumsum(histogram)
+            selected = numpy.searchsorted(cumulative, k - below, 'right')
+            if selected:
+                below += cumulative[selected - 1]
+            lo = edges[selected]
+            if selected == len(histogram) - 1:
+                hi = numpy.nextafter(edges[-1], numpy.inf)
+            else:
+                hi = edges[selected + 1]
+        # The next pass histograms the values left in [lo, hi).
+        edges = numpy.linspace(max(lo, vmin), min(hi, vmax), MEDIAN_BINS + 1)
+
+
+def _find(parents, node):
+    """Root of node in the union-find forest parents, compressing the path"""
+    root = node
+    while parents[root] != root:
+        root = parents[root]
+    while parents[node] != root:
+        parents[node], node = root, parents[node]
+    return root
+
+
+class TiledImageData(object):
+    """Source extraction on an image processed in tiles.
+
+    The image is read tile by tile for each stage of the extraction:
+
+    * The background and RMS grids are calculated over blocks of grid tiles,
+      aligned to the same origin as for the image as a whole;
+    * The median of the RMS map is located by successive histogramming;
+    * Islands are labelled per tile, and those which cross tile boundaries
+      are joined up;
+    * Each island is finally cut out of the image and measured.
+
+    Pixel values, islands and measurements are identical to those of
+    :meth:`tkp.sourcefinder.image.ImageData.extract` on the whole image, but
+    no residual maps are made.
+    """
+
+    def __init__(self, data, beam, wcs, margin=0, radius=0, back_size_x=32,
+                 back_size_y=32, tile_size=2048, fit_workers=0,
+                 fit_threads=False, dtype=None, moments_max_beams=0,
+                 moments_max_sig=0
+    ):
+        """Sets up a TiledImageData object.
+
+        *Args:*
+          - data (2D array): image data. Anything which can be sliced like a
+            numpy.ndarray will do; typically a memory mapped array, which
+            is read only a tile at a time.
+          - wcs (utility.coordinates.wcs): world coordinate system
+            specification
+          - beam (3-tuple): beam shape specification as
+            (semimajor, semiminor, theta)
+
+        *Kwargs:*
+          - tile_size (int): size in pixels of the (square) tiles the image
+            is read in.
+          - margin, radius, back_size_x, back_size_y, fit_workers,
+            fit_threads, dtype, moments_max_beams, moments_max_sig: as for
+            :class:`tkp.sourcefinder.image.ImageData`.
+        """
+        if dtype is None:
+            dtype = numpy.float64
+        self.rawdata = data
+        self.dtype = numpy.dtype(dtype)
+        self.wcs = wcs   # a utility.coordinates.wcs instance
+        self.beam = beam   # tuple of (semimaj, semimin, theta)
+
+        self.back_size_x = back_size_x
+        self.back_size_y = back_size_y
+        self.margin = margin
+        self.radius = radius
+        self.tile_size = tile_size
+        self.fit_workers = fit_workers
+        self.fit_threads = fit_threads
+        self.moments_max_beams = moments_max_beams
+        self.moments_max_sig = moments_max_sig
+        self._useful_chunk = None
+        self._grids = None
+
+    def __getstate__(self):
+        # Leave the (potentially huge) pixel data behind.
+        state = self.__dict__.copy()
+        state['rawdata'] = None
+        state['_grids'] = None
+        return state
+
+    @property
+    def xdim(self):
+        """X pixel dimension of (unmasked) data"""
+        return self.rawdata.shape[0]
+
+    @property
+    def ydim(self):
+        """Y pixel dimension of (unmasked) data"""
+        return self.rawdata.shape[1]
+
+    def _mask(self, chunk, rawdata):
+        """Mask of rawdata, the image pixels in chunk.
+
+        The same mask as ImageData.data: margin, radius and NaNs.
+        """
+        x = numpy.arange(chunk[0].start, chunk[0].stop)[:, numpy.newaxis]
+        y = numpy.arange(chunk[1].start, chunk[1].stop)[numpy.newaxis, :]
+        mask = numpy.isnan(rawdata)
+        if self.margin:
+            mask |= ((x < self.margin) | (x >= self.xdim - self.margin) |
+                     (y < self.margin) | (y >= self.ydim - self.margin))
+        if self.radius:
+            centre_x, centre_y = (self.xdim-1)/2.0, (self.ydim-1)/2.0
+            x = numpy.arange(-centre_x, self.xdim-centre_x)[chunk[0]]
+            y = numpy.arange(-centre_y, self.ydim-centre_y)[chunk[1]]
+            mask |= (x[:, numpy.newaxis]**2 + y[numpy.newaxis, :]**2 >=
+                     self.radius * self.radius)
+        return mask
+
+    def _data(self, chunk):
+        """Masked image data within chunk"""
+        rawdata = numpy.array(self.rawdata[chunk], dtype=self.dtype)
+        return numpy.ma.array(rawdata, mask=self._mask(chunk, rawdata))
+
+    def _masked(self, x, y):
+        """Mask at a single pixel, indexed as a numpy array"""
+        position = []
+        for index, dim in ((x, self.xdim), (y, self.ydim)):
+            if not -dim <= index < dim:
+                raise IndexError("index %d is out of bounds" % index)
+            position.append(slice(index % dim, index % dim + 1))
+        return self._data(tuple(position)).mask[0, 0]
+
+    @property
+    def useful_chunk(self):
+        """Bounding box of the unmasked data; None if there is none"""
+        if self._useful_chunk is None:
+            lower = [numpy.inf, numpy.inf]
+            upper = [-numpy.inf, -numpy.inf]
+            for tile in _tiles((slice(0, self.xdim), slice(0, self.ydim)),
+                               self.tile_size, self.tile_size):
+                unmasked = ~self._data(tile).mask
+                for axis, other in ((0, 1), (1, 0)):
+                    used = numpy.flatnonzero(unmasked.any(axis=other))
+                    if len(used):
+                        lower[axis] = min(lower[axis],
+                                          tile[axis].start + used[0])
+                        upper[axis] = max(upper[axis],
+                                          tile[axis].start + used[-1] + 1)
+            if lower[0] == numpy.inf:
+                return None
+            self._useful_chunk = (slice(int(lower[0]), int(upper[0])),
+                                  slice(int(lower[1]), int(upper[1])))
+        return self._useful_chunk
+
+    @property
+    def grids(self):
+        """Gridded RMS and background data for interpolating"""
+        if self._grids is None:
+            useful_chunk = self.useful_chunk
+            # Blocks are made up of whole grid tiles, so that every grid tile
+            # holds the same pixels as for the image as a whole.
+            block_x = max(self.tile_size // self.back_size_x, 1)
+            block_y = max(self.tile_size // self.back_size_y, 1)
+            grid_shape = (
+                -(-(useful_chunk[0].stop - useful_chunk[0].start) //
+                  self.back_size_x),
+                -(-(useful_chunk[1].stop - useful_chunk[1].start) //
+                  self.back_size_y)
+            )
+            clipped = None
+            for block in _tiles(useful_chunk, block_x * self.back_size_x,
+                                block_y * self.back_size_y):
+                block_stats = _clip_tiles(self._data(block), self.back_size_x,
+                                          self.back_size_y, self.beam)
+                if clipped is None:
+                    clipped = [numpy.zeros(grid_shape, dtype=value.dtype)
+                               for value in block_stats]
+                gridx = (block[0].start - useful_chunk[0].start
+                         ) // self.back_size_x
+                gridy = (block[1].start - useful_chunk[1].start
+                         ) // self.back_size_y
+                for full, value in zip(clipped, block_stats):
+                    full[gridx:gridx + value.shape[0],
+                         gridy:gridy + value.shape[1]] = value
+            self._grids = _background_grids(*clipped)
+        return self._grids
+
+    def _maps(self, chunk):
+        """Masked data, background subtracted data and RMS map within chunk"""
+        data = self._data(chunk)
+        grid_map = lambda grid, roundup: _grid_map(
+            grid, data.mask, self.useful_chunk, chunk, self.back_size_x,
+            self.back_size_y, self.dtype, roundup)
+        backmap = grid_map(self.grids['bg'], False)
+        rmsmap = grid_map(self.grids['rms'], True)
+        return data, data - backmap, rmsmap
+
+    def _rms_median(self):
+        """Median of the RMS map, as numpy.ma.median() of the whole map"""
+        # Within the useful chunk, the RMS map is unmasked throughout.
+        size = ((self.useful_chunk[0].stop - self.useful_chunk[0].start) *
+                (self.useful_chunk[1].stop - self.useful_chunk[1].start))
+
+        def rms_values():
+            for tile in _tiles(self.useful_chunk, self.tile_size,
+                               self.tile_size):
+                yield self._maps(tile)[2].compressed()
+
+        # The median is calculated from the middle value(s) exactly as it
+        # would be for the whole map.
+        middle = [
+            _kth_value(rms_values, k, self.tile_size * self.tile_size)
+            for k in sorted(set(((size - 1) // 2, size // 2)))
+        ]
+        return numpy.ma.median(numpy.array(middle, dtype=self.dtype))
+
+    def label_islands(self, det, anl):
+        """
+        Find the islands which would be labelled by
+        ImageData.label_islands(), tile by tile.
+
+        Args:
+
+            det (float): detection threshold, as a multiple of the RMS noise.
+
+            anl (float): analysis threshold, as a multiple of the RMS noise.
+
+        Returns:
+
+            list of the bounding boxes (pairs of slices) of the islands
+            above the detection threshold, each together with the position
+            of the first pixel of the island, in order of label.
+        """
+        if (self.useful_chunk is None or
+                numpy.ma.getmask(self.grids['rms']).all()):
+            logger.warning("RMS map masked; sourcefinding skipped")
+            return []
+        self._rms_threshold = RMS_FILTER * self._rms_median()
+
+        # For each label in each tile: its bounding box, its first pixel in
+        # raster order, and its peak above the detection threshold.
+        boxes, first, peaks = [], [], []
+        # Pairs of labels touching each other across tile boundaries.
+        joins = []
+        num_labels = 0
+        bottom_edge = numpy.zeros(self.ydim, dtype=numpy.int64)
+        right_edge = None
+        for tile in _tiles(self.useful_chunk, self.tile_size,
+                           self.tile_size):
+            data, data_bgsubbed, rmsmap = self._maps(tile)
+            clipped_data = _island_pixels(data_bgsubbed, anl * rmsmap,
+                                          rmsmap, self._rms_threshold)
+            tile_labels, num = ndimage.label(clipped_data,
+                                             STRUCTURING_ELEMENT)
+            labelled_data = numpy.where(
+                tile_labels > 0, tile_labels + num_labels, 0
+            ).astype(numpy.int64)
+
+            if tile[1].start == self.useful_chunk[1].start:
+                right_edge = numpy.zeros(labelled_data.shape[0],
+                                         dtype=numpy.int64)
+            for ours, theirs in (
+                (labelled_data[0], bottom_edge[tile[1]]),
+                (labelled_data[:, 0], right_edge)
+            ):
+                touching = (ours > 0) & (theirs > 0)
+                joins.extend(zip(ours[touching], theirs[touching]))
+            bottom_edge[tile[1]] = labelled_data[-1]
+            right_edge = labelled_data[:, -1]
+
+            if num:
+                index = numpy.arange(1, num + 1)
+                for box in ndimage.find_objects(tile_labels):
+                    boxes.append((
+                        tile[0].start + box[0].start,
+                        tile[0].start + box[0].stop,
+                        tile[1].start + box[1].start,
+                        tile[1].start + box[1].stop,
+                    ))
+                position = (
+                    numpy.arange(tile[0].start, tile[0].stop,
+                                 dtype=numpy.int64)[:, numpy.newaxis] *
+                    self.ydim +
+                    numpy.arange(tile[1].start, tile[1].stop,
+                                 dtype=numpy.int64)[numpy.newaxis, :]
+                )
+                first.append(numpy.array(ndimage.minimum(
+                    position, tile_labels, index), dtype=numpy.int64))
+                peaks.append(_island_peaks(tile_labels, num, data_bgsubbed,
+                                           det * rmsmap).astype(numpy.float64))
+            num_labels += num
+
+        if not num_labels:
+            return []
+
+        # Join up the islands which cross tile boundaries.
+        parents = range(num_labels + 1)
+        for ours, theirs in joins:
+            root, other = _find(parents, ours), _find(parents, theirs)
+            if root != other:
+                parents[max(root, other)] = min(root, other)
+        island = numpy.array([_find(parents, label)
+                              for label in xrange(1, num_labels + 1)])
+        roots = numpy.unique(island)
+        boxes = numpy.array(boxes)
+        first = numpy.concatenate(first)
+        peaks = numpy.concatenate(peaks)
+        merged = [
+            ndimage.minimum(boxes[:, 0], island, roots),
+            ndimage.maximum(boxes[:, 1], island, roots),
+            ndimage.minimum(boxes[:, 2], island, roots),
+            ndimage.maximum(boxes[:, 3], island, roots),
+            ndimage.minimum(first, island, roots),
+            ndimage.maximum(peaks, island, roots),
+        ]
+        merged = [numpy.atleast_1d(value) for value in merged]
+
+        # Labels are numbered in the raster order of their first pixels.
+        islands = []
+        for i in numpy.argsort(merged[4], kind='mergesort'):
+            if merged[5][i] < 0:
+                continue
+            chunk = (slice(int(merged[0][i]), int(merged[1][i])),
+                     slice(int(merged[2][i]), int(merged[3][i])))
+            islands.append((chunk, divmod(int(merged[4][i]), self.ydim)))
+        return islands
+
+    def _island(self, chunk, first_pixel, det, anl, deblend_nthresh):
+        """Cut the island with the given first pixel out of the image"""
+        data, data_bgsubbed, rmsmap = self._maps(chunk)
+        # Every pixel connected to the first pixel falls within the
+        # bounding box, so labelling the box alone finds the island.
+        clipped_data = _island_pixels(data_bgsubbed, anl * rmsmap, rmsmap,
+                                      self._rms_threshold)
+        labelled_data = ndimage.label(clipped_data, STRUCTURING_ELEMENT)[0]
+        label = labelled_data[first_pixel[0] - chunk[0].start,
+                              first_pixel[1] - chunk[1].start]
+        analysis_threshold = float((anl * rmsmap / rmsmap).max())
+        selected_data = numpy.ma.where(
+            labelled_data == label, data_bgsubbed.data, -extract.BIGNUM
+        ).filled(fill_value=-extract.BIGNUM).astype(numpy.float64)
+        return extract.Island(
+            selected_data,
+            rmsmap.astype(numpy.float64),
+            chunk,
+            analysis_threshold,
+            (det * rmsmap).astype(numpy.float64),
+            self.beam,
+            deblend_nthresh,
+            DEBLEND_MINCONT,
+            STRUCTURING_ELEMENT
+        )
+
+    def extract(self, det, anl, deblend_nthresh=0, force_beam=False):
+        """
+        Kick off conventional (ie, RMS island finding) source extraction.
+
+        See :meth:`tkp.sourcefinder.image.ImageData.extract`; user supplied
+        maps and labels are not supported.
+
+        Returns:
+             :class:`tkp.utility.containers.ExtractionResults`
+        """
+        if anl > det:
+            logger.warn(
+                "Analysis threshold is higher than detection threshold"
+            )
+
+        # If the image data is flat we may as well crash out here with a
+        # sensible error message, otherwise the RMS estimation code will
+        # crash out with a confusing error later.
+        extremes = set()
+        if self.useful_chunk is not None:
+            for tile in _tiles(self.useful_chunk, self.tile_size,
+                               self.tile_size):
+                data = self._data(tile).compressed()
+                if len(data):
+                    extremes.update((data.min(), data.max()))
+        if len(extremes) < 2:
+            raise RuntimeError("Bad data: Image data is flat")
+
+        islands = self.label_islands(det, anl)
+
+        # Set up the fixed fit parameters if 'force beam' is on:
+        if force_beam:
+            fixed = {'semimajor': self.beam[0],
+                     'semiminor': self.beam[1],
+                     'theta': self.beam[2]}
+        else:
+            fixed = None
+
+        # Islands are measured a batch at a time, to keep no more than a
+        # batch of them in memory.
+        results = containers.ExtractionResults()
+        for start in xrange(0, len(islands), ISLAND_BATCH):
+            island_list = [
+                self._island(chunk, first_pixel, det, anl, deblend_nthresh)
+                for chunk, first_pixel in islands[start:start + ISLAND_BATCH]
+            ]
+            if deblend_nthresh:
+                island_list = list(utils.flatten(
+                    [island.deblend() for island in island_list]))
+            detections = [
+                extract.Detection(fit_results[0], self, chunk=island.chunk,
+                                  physical_coordinates=False)
+                for island, fit_results in zip(
+                    island_list, _fit_island_list(
+                        island_list, fixed, self.fit_workers,
+                        self.fit_threads, self.moments_max_beams,
+                        self.moments_max_sig))
+                # Islands which failed to fit are dropped.
+                if fit_results
+            ]
+            for detection, located in zip(
+                detections,
+                extract.calculate_physical_coordinates(detections)
+            ):
+                if not located:
+                    logger.error("Island not processed; unphysical?")
+                elif (detection.ra.error == float('inf') or
+                        detection.dec.error == float('inf')):
+                    logger.warn('Bad fit from blind extraction at pixel '
+                                'coords: %f %f - measurement discarded '
+                                '(increase fitting margin?)',
+                                detection.x, detection.y)
+                elif _is_usable(detection, self._masked):
+                    results.append(detection)
+        return results
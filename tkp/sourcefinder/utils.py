@@ -5,8 +5,10 @@ This module contain utilities for the source finding routines
 import numpy
 import math
 import scipy.integrate
+import scipy.ndimage
 from tkp.sourcefinder.gaussian import gaussian
 from tkp.utility import coordinates
+from tkp.utility.memoize import BoundedMemoize
 
 def generate_subthresholds(min_value, max_value, num_thresholds):
     """
@@ -63,6 +65,37 @@ def get_error_radius(wcs, x_value, x_error, y_value, y_error):
     return error_radius
 
 
+def get_error_radii(wcs, x_values, x_errors, y_values, y_errors):
+    """
+    Estimate absolute angular errors on many positions at once.
+
+    As get_error_radius(), but the positions and their errors are arrays.
+    The error is infinite where the position, or its errors, fall outside
+    the coordinate system.
+    """
+    x_values, x_errors, y_values, y_errors = [
+        numpy.asarray(value, dtype=float)
+        for value in (x_values, x_errors, y_values, y_errors)]
+    centre_ra, centre_dec = wcs.p2s_many(
+        numpy.column_stack((x_values, y_values)))
+    error_radius = numpy.zeros(len(x_values))
+    unconvertible = numpy.isnan(centre_ra) | numpy.isnan(centre_dec)
+    # We check all possible combinations in case we have a nonlinear
+    # WCS.
+    for x_sign, y_sign in ((1, 1), (-1, 1), (1, -1), (-1, -1)):
+        error_ra, error_dec = wcs.p2s_many(numpy.column_stack((
+            x_values + x_sign * x_errors, y_values + y_sign * y_errors)))
+        unconvertible |= numpy.isnan(error_ra) | numpy.isnan(error_dec)
+        with numpy.errstate(invalid='ignore'):
+            error_radius = numpy.fmax(
+                error_radius,
+                coordinates.angsep_many(centre_ra, centre_dec,
+                                        error_ra, error_dec)
+            )
+    error_radius[unconvertible] = float('inf')
+    return error_radius
+
+
 def circular_mask(xdim, ydim, radius):
     """
     Returns a numpy array of shape (xdim, ydim). All points with radius of
@@ -73,6 +106,45 @@ def circular_mask(xdim, ydim, radius):
     return x*x + y*y >= radius*radius
 
 
+def bounding_box(unmasked):
+    """
+    Returns the bounding box of the True values of the 2D boolean array
+    unmasked, as a pair of slices, or None if there are none.
+    """
+    rows = numpy.flatnonzero(unmasked.any(axis=1))
+    if not len(rows):
+        return None
+    cols = numpy.flatnonzero(unmasked.any(axis=0))
+    return (slice(int(rows[0]), int(rows[-1]) + 1),
+            slice(int(cols[0]), int(cols[-1]) + 1))
+
+
+@BoundedMemoize(maxsize=8)
+def geometry_mask(xdim, ydim, margin, radius):
+    """Mask of the pixels of an image of shape (xdim, ydim) which lie within
+    margin of its edge or beyond radius from its centre.
+
+    Every image of the same shape, processed with the same margin and
+    radius, has the same geometry, so the most recently used masks are
+    cached rather than rebuilt for each image. They are shared, and hence
+    read only.
+
+    Returns:
+        tuple: (mask, chunk), where mask is a boolean array, True for the
+        pixels excluded, and chunk the bounding box of the pixels which are
+        not (see bounding_box()).
+    """
+    mask = numpy.zeros((xdim, ydim), dtype=bool)
+    if margin:
+        margin_mask = numpy.ones((xdim, ydim), dtype=bool)
+        margin_mask[margin:-margin, margin:-margin] = 0
+        mask = numpy.logical_or(mask, margin_mask)
+    if radius:
+        mask = numpy.logical_or(mask, circular_mask(xdim, ydim, radius))
+    mask.setflags(write=False)
+    return mask, bounding_box(~mask)
+
+
 def generate_result_maps(data, sourcelist):
     """Return a source and residual image
 
@@ -153,26 +225,11 @@ def fudge_max_pix(semimajor, semiminor, theta):
     position on the peak pixel and averaging over all possible
     corrections.  This overall correction makes use of the beamshape,
     so strictly speaking only accurate for unresolved sources.
-    """
-
-    # scipy.integrate.dblquad: Computes a double integral
-    # from the scipy docs:
-    #   Return the double (definite) integral of f1(y,x) from x=a..b
-    #   and y=f2(x)..f3(x).
-
-    log20 = numpy.log(2.0)
-    cos_theta = numpy.cos(theta)
-    sin_theta = numpy.sin(theta)
-
-    def landscape(y, x):
-        up = math.pow(((cos_theta * x + sin_theta * y) / semiminor ), 2)
-        down = math.pow(((cos_theta * y - sin_theta * x) / semimajor ), 2)
-        return numpy.exp(log20 * ( up + down ))
 
-    (correction, abserr) = scipy.integrate.dblquad(landscape, -0.5, 0.5,
-        lambda ymin: -0.5, lambda ymax: 0.5)
-
-    return correction
+    The result depends only on the beam, so is cached: see
+    max_pix_corrections().
+    """
+    return max_pix_corrections(semimajor, semiminor, theta)[0]
 
 
 def maximum_pixel_method_variance(semimajor, semiminor, theta):
@@ -190,6 +247,18 @@ def maximum_pixel_method_variance(semimajor, semiminor, theta):
     over the pixel area and dividing by the pixel area ( = 1).  This
     is just equal to integral of the true flux^2 over the pixel area
     - fudge_max_pix^2.
+
+    The result depends only on the beam, so is cached: see
+    max_pix_corrections().
+    """
+    return max_pix_corrections(semimajor, semiminor, theta)[1]
+
+
+def _integrate_max_pix(semimajor, semiminor, theta):
+    """Calculate the peak flux correction and variance of the maximum pixel
+    method by numerical integration over the pixel area.
+
+    See fudge_max_pix() and maximum_pixel_method_variance().
     """
 
     # scipy.integrate.dblquad: Computes a double integral
@@ -202,16 +271,125 @@ def maximum_pixel_method_variance(semimajor, semiminor, theta):
     sin_theta = numpy.sin(theta)
 
     def landscape(y, x):
+        up = math.pow(((cos_theta * x + sin_theta * y) / semiminor ), 2)
+        down = math.pow(((cos_theta * y - sin_theta * x) / semimajor ), 2)
+        return numpy.exp(log20 * ( up + down ))
+
+    def landscape_squared(y, x):
         return numpy.exp(2.0 * log20 *
                   ( math.pow(((cos_theta * x + sin_theta * y) / semiminor), 2) +
                     math.pow(((cos_theta * y - sin_theta * x) / semimajor), 2)
                   )
         )
 
-    (result, abserr) = scipy.integrate.dblquad(landscape, -0.5, 0.5, lambda ymin: -0.5, lambda ymax: 0.5)
-    variance = result - math.pow(fudge_max_pix(semimajor, semiminor, theta), 2)
+    (correction, abserr) = scipy.integrate.dblquad(landscape, -0.5, 0.5,
+        lambda ymin: -0.5, lambda ymax: 0.5)
+    (result, abserr) = scipy.integrate.dblquad(landscape_squared, -0.5, 0.5,
+        lambda ymin: -0.5, lambda ymax: 0.5)
+    variance = result - math.pow(correction, 2)
+
+    return correction, variance
+
+
+class MaxPixGrid(object):
+    """Tabulated maximum pixel method corrections.
+
+    The peak flux correction and variance of the maximum pixel method are
+    calculated once on a regular grid of beam shapes and subsequently
+    linearly interpolated, rather than integrated for every beam.
+
+    Both are unchanged by rotating the beam through a multiple of 90
+    degrees (which maps the pixel onto itself) and by reflecting it in the
+    pixel axes, so only position angles between 0 and 45 degrees need to be
+    tabulated.
+
+    Args:
+
+        semimajors (numpy.ndarray): regularly spaced semi-major axes
+            (pixels)
+
+        semiminors (numpy.ndarray): regularly spaced semi-minor axes
+            (pixels)
+
+    Kwargs:
+
+        n_theta (int): number of position angles tabulated.
+    """
+    def __init__(self, semimajors, semiminors, n_theta=10):
+        self.axes = [
+            numpy.asarray(semimajors, dtype=float),
+            numpy.asarray(semiminors, dtype=float),
+            numpy.linspace(0, numpy.pi / 4, n_theta)
+        ]
+        self.tables = numpy.empty((2,) + tuple(len(axis) for axis in self.axes))
+        for i, semimajor in enumerate(self.axes[0]):
+            for j, semiminor in enumerate(self.axes[1]):
+                for k, theta in enumerate(self.axes[2]):
+                    self.tables[:, i, j, k] = _integrate_max_pix(
+                        semimajor, semiminor, theta)
+
+    def __call__(self, semimajor, semiminor, theta):
+        """Interpolate the correction and variance for a given beam.
+
+        Returns:
+            tuple: (correction, variance), or None if the beam lies outside
+            the grid.
+        """
+        if semiminor > semimajor:
+            semimajor, semiminor = semiminor, semimajor
+            theta += numpy.pi / 2
+        theta = theta % (numpy.pi / 2)
+        theta = min(theta, numpy.pi / 2 - theta)
+
+        indices = []
+        for axis, value in zip(self.axes, (semimajor, semiminor, theta)):
+            if len(axis) == 1:
+                if value != axis[0]:
+                    return None
+                indices.append(0.)
+                continue
+            index = (value - axis[0]) / (axis[1] - axis[0])
+            if not 0 <= index <= len(axis) - 1:
+                return None
+            indices.append(index)
+        indices = numpy.array(indices)[:, numpy.newaxis]
+        return tuple(
+            scipy.ndimage.map_coordinates(table, indices, order=1)[0]
+            for table in self.tables
+        )
+
+
+# An optional MaxPixGrid; if set, beams within it are interpolated rather
+# than integrated. See set_max_pix_grid().
+max_pix_grid = None
+
+
+def set_max_pix_grid(grid):
+    """Use the given MaxPixGrid (or None, to always integrate) for
+    subsequent maximum pixel method corrections."""
+    global max_pix_grid
+    max_pix_grid = grid
+    max_pix_corrections.clear()
 
-    return variance
+
+@BoundedMemoize(maxsize=64)
+def max_pix_corrections(semimajor, semiminor, theta):
+    """Peak flux correction and variance of the maximum pixel method.
+
+    These depend only on the beam, which is the same for every source in an
+    image, so the most recently used results are cached rather than
+    integrated afresh for every source. If a grid has been set with
+    set_max_pix_grid(), and the beam lies within it, values are
+    interpolated from that grid instead.
+
+    Returns:
+        tuple: (fudge_max_pix, maximum_pixel_method_variance)
+    """
+    if max_pix_grid is not None:
+        corrections = max_pix_grid(semimajor, semiminor, theta)
+        if corrections is not None:
+            return corrections
+    return _integrate_max_pix(semimajor, semiminor, theta)
 
 
 def flatten(nested_list):
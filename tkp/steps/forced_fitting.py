@@ -3,6 +3,8 @@ from tkp.accessors import sourcefinder_image_from_accessor
 from tkp.db import general as dbgen
 from tkp.db import monitoringlist as dbmon
 from tkp.db import nulldetections as dbnd
+from tkp.steps.misc import image_cache_budget, image_dtype
+from tkp.utility.containers import serialize_detections, serialized_array
 
 logger = logging.getLogger(__name__)
 
@@ -24,25 +26,50 @@ def get_forced_fit_requests(image, expiration):
     return all_fit_positions, all_fit_ids
 
 
+def get_forced_fit_priors(fit_ids):
+    """
+    The peak of the last blind measurement of each null detection among
+    fit_ids, from which its forced fit may start (see
+    :func:`perform_forced_fits`). Forced fits hold the shape fixed to the
+    beam, so that of the measurement is not used. Monitoring sources, and
+    null detections without a measurement, get None, and start from
+    moments.
+    """
+    last = dbgen.last_measurements(
+        [fit_id[1] for fit_id in fit_ids if fit_id[0] == 'ff_nd'])
+    priors = []
+    for fit_id in fit_ids:
+        measured = last.get(fit_id[1]) if fit_id[0] == 'ff_nd' else None
+        if measured is None:
+            priors.append(None)
+        else:
+            priors.append({'peak': measured[0]})
+    return priors
+
+
 def insert_and_associate_forced_fits(image_id,successful_fits,successful_ids):
     assert len(successful_ids) == len(successful_fits)
 
-    nd_extractions=[]
+    successful_fits = serialized_array(successful_fits)
+    nd_indices=[]
     nd_runcats=[]
-    ms_extractions=[]
+    ms_indices=[]
     ms_ids = []
 
     for idx, id in enumerate(successful_ids):
         if id[0] == 'ff_nd':
-            nd_extractions.append(successful_fits[idx])
+            nd_indices.append(idx)
             nd_runcats.append(id[1])
         elif id[0] == 'ff_ms':
-            ms_extractions.append(successful_fits[idx])
+            ms_indices.append(idx)
             ms_ids.append(id[1])
         else:
             raise ValueError("Forced fit type id not recognised:" + id[0])
 
-    if nd_extractions:
+    nd_extractions = successful_fits[nd_indices]
+    ms_extractions = successful_fits[ms_indices]
+
+    if len(nd_extractions):
         logger.debug("adding null detections")
         dbgen.insert_extracted_sources(image_id, nd_extractions,
                                        extract_type='ff_nd',
@@ -51,7 +78,7 @@ def insert_and_associate_forced_fits(image_id,successful_fits,successful_ids):
     else:
         logger.debug("No successful nulldetection fits")
 
-    if ms_extractions:
+    if len(ms_extractions):
         dbgen.insert_extracted_sources(image_id, ms_extractions,
                                        extract_type='ff_ms',
                                        ff_monitor_ids=ms_ids)
@@ -61,7 +88,8 @@ def insert_and_associate_forced_fits(image_id,successful_fits,successful_ids):
         logger.debug("No successful monitor fits")
 
 
-def perform_forced_fits(fit_posns, fit_ids, accessor, extraction_params):
+def perform_forced_fits(fit_posns, fit_ids, accessor, extraction_params,
+                        background_grids=None, fit_priors=None):
     """
     Perform forced source measurements on an image based on a list of
     positions.
@@ -71,11 +99,19 @@ def perform_forced_fits(fit_posns, fit_ids, accessor, extraction_params):
         fit_ids: List of identifiers for each requested fit position.
         image_path (str): path to image for measurements.
         extraction_params (dict): source extraction parameters, as a dictionary.
+        background_grids (:class:`tkp.sourcefinder.image.BackgroundGrids`):
+            the background grids found by the blind extraction of the same
+            image, if any; they are then used rather than calculated again.
+        fit_priors (list): for each requested fit position, a dict of values
+            from which to start the fit, or None to start from moments; see
+            :func:`get_forced_fit_priors` and
+            :meth:`tkp.sourcefinder.image.ImageData.fit_fixed_positions`.
 
     Returns:
-        tuple: A matched pair of lists (serialized_fits, ids), corresponding to
-        successfully fitted positions.
-        NB returned lists may be shorter than input lists
+        tuple: A matched pair (serialized_fits, ids), corresponding to
+        successfully fitted positions. serialized_fits is a structured array
+        (see :data:`tkp.utility.containers.SERIALIZED_DTYPE`), ids a list.
+        NB returned sequences may be shorter than input lists
         if some fits are unsuccessful.
     """
     logger.debug("Forced fitting in image: %s" % (accessor.url))
@@ -91,18 +127,29 @@ def perform_forced_fits(fit_posns, fit_ids, accessor, extraction_params):
     data_image = sourcefinder_image_from_accessor(accessor, margin=margin,
                                                   radius=radius,
                                                   back_size_x=back_size_x,
-                                                  back_size_y=back_size_y)
+                                                  back_size_y=back_size_y,
+                                                  dtype=image_dtype(
+                                                      extraction_params),
+                                                  background_grids=
+                                                  background_grids,
+                                                  cache_budget=
+                                                  image_cache_budget(
+                                                      extraction_params))
 
     box_in_beampix = extraction_params['box_in_beampix']
     boxsize = box_in_beampix * max(data_image.beam[0], data_image.beam[1])
-    fits = data_image.fit_fixed_positions( fit_posns, boxsize, ids=fit_ids)
+    fits = data_image.fit_fixed_positions(
+        fit_posns, boxsize, ids=fit_ids,
+        local_background=extraction_params.get('forced_fit_local_background',
+                                               False),
+        priors=fit_priors)
     successful_fits, successful_ids = fits
+    logger.debug("Image cache of %s: %s", accessor.url,
+                 data_image.memo_cache.statistics())
     if successful_fits:
-        serialized = [
-            f.serialize(
-                extraction_params['ew_sys_err'],
-                extraction_params['ns_sys_err'])
-            for f in successful_fits]
+        serialized = serialize_detections(successful_fits,
+                                          extraction_params['ew_sys_err'],
+                                          extraction_params['ns_sys_err'])
         return serialized, successful_ids
     else:
         return [], []
@@ -16,6 +16,7 @@ from tkp.config import parse_to_dict
 from tkp.db.dump import dump_db
 
 import colorlog
+import numpy
 
 logger = logging.getLogger(__name__)
 
@@ -144,6 +145,64 @@ ImageMetadataForSort = namedtuple('ImageMetadataForSort', [
 ])
 
 
+def image_dtype(extraction_params):
+    """
+    The floating point type in which images are read and processed.
+
+    Args:
+        extraction_params (dict): source extraction parameters
+
+    Returns:
+        numpy.float32 if the ``single_precision`` parameter is set, or None
+        for the default (double) precision.
+    """
+    if extraction_params.get('single_precision', False):
+        return numpy.float32
+    return None
+
+
+def image_cache_budget(extraction_params):
+    """
+    The memory each image may hold in maps it can recalculate.
+
+    Args:
+        extraction_params (dict): source extraction parameters
+
+    Returns:
+        The ``image_cache_mb`` parameter in bytes, or None if it is not set
+        or zero, for no limit. See the cache_budget argument of
+        :class:`tkp.sourcefinder.image.ImageData`.
+    """
+    budget = extraction_params.get('image_cache_mb', 0)
+    if not budget:
+        return None
+    return int(budget * 2**20)
+
+
+def check_fit_workers(extraction_params, distributor):
+    """
+    Refuse concurrent island fitting with the ``multiproc`` distribution
+    method.
+
+    Its worker processes are daemonic and may not start processes of their
+    own, so ``fit_workers`` would be ignored.
+
+    Args:
+        extraction_params (dict): source extraction parameters
+        distributor (str): the name of the distribution method
+
+    Raises:
+        ValueError: if ``fit_workers`` is larger than one with ``multiproc``.
+    """
+    fit_workers = extraction_params.get('fit_workers', 0)
+    if fit_workers > 1 and distributor == 'multiproc':
+        msg = ("fit_workers = %s cannot be used with the multiproc "
+               "distribution method; set it to 0, or use the serial "
+               "method" % fit_workers)
+        logger.error(msg)
+        raise ValueError(msg)
+
+
 def group_per_timestep(metadatas):
     """
     groups a list of TRAP images per time step.
@@ -93,11 +93,18 @@ def store_images_in_db(images_metadata, extraction_radius_pix, dataset_id, bandw
     return image_ids
 
 
-def get_accessors(images):
+def get_accessors(images, dtype=None):
+    """
+    Open each of the images with the appropriate accessor.
+
+    If dtype is given, the image data is read as that floating point type;
+    see tkp.steps.misc.image_dtype().
+    """
+    kwargs = {'dtype': dtype} if dtype is not None else {}
     results = []
     for image in images:
         try:
-            accessor = tkp.accessors.open(image)
+            accessor = tkp.accessors.open(image, **kwargs)
         except TypeError as e:
             logger.error("Can't open image %s: %s" % (image, e))
             raise
@@ -1,6 +1,8 @@
 import logging
 from tkp.accessors import sourcefinder_image_from_accessor
-from collections import namedtuple
+from tkp.steps.misc import image_cache_budget, image_dtype
+from tkp.utility.containers import serialize_detections
+from collections import namedtuple, OrderedDict
 
 logger = logging.getLogger(__name__)
 
@@ -9,7 +11,88 @@ logger = logging.getLogger(__name__)
 ExtractionResults = namedtuple('ExtractionResults',
                                    ['sources',
                                     'rms_min',
-                                    'rms_max'])
+                                    'rms_max',
+                                    'background_grids'])
+
+
+class BackgroundCache(object):
+    """
+    The background clipping states of the most recently processed fields.
+
+    When a telescope produces image after image of the same field, each
+    image's background and RMS grids can be sigma clipped starting from
+    the previous image's final clipping limits, rather than from scratch
+    (see the clip_seed argument of
+    :class:`tkp.sourcefinder.image.ImageData`). States are kept per
+    field, band and image geometry; see :func:`background_key`.
+
+    The cache is held per process, so with the multiproc distribution
+    method each worker keeps its own.
+    """
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self.states = OrderedDict()
+        self.clear()
+
+    def get(self, key):
+        """Clipping state stored for key, or None"""
+        try:
+            state = self.states.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # Re-inserting moves this state to the most recently used end.
+        self.states[key] = state
+        return state
+
+    def put(self, key, state, iterations, warm):
+        """
+        Store the clipping state of an image, and count the clipping
+        iterations it took, which were warm started or not.
+        """
+        self.states.pop(key, None)
+        if len(self.states) >= self.maxsize:
+            self.states.popitem(last=False)
+        self.states[key] = state
+        if warm:
+            self.warm_iterations += iterations
+        else:
+            self.cold_iterations += iterations
+
+    def statistics(self):
+        """
+        Hits, misses and the total number of clipping iterations over all
+        background grid tiles of warm and cold started images.
+        """
+        return {'hits': self.hits, 'misses': self.misses,
+                'warm_iterations': self.warm_iterations,
+                'cold_iterations': self.cold_iterations}
+
+    def clear(self):
+        """Forget all states and statistics"""
+        self.states.clear()
+        self.hits = 0
+        self.misses = 0
+        self.warm_iterations = 0
+        self.cold_iterations = 0
+
+
+background_cache = BackgroundCache()
+
+
+def background_key(accessor, extraction_params):
+    """
+    The field (sky region), band and image geometry of an image, which must
+    match for one image's background clipping to warm start another's.
+    """
+    return (accessor.centre_ra, accessor.centre_decl,
+            accessor.freq_eff, accessor.freq_bw,
+            accessor.data.shape,
+            extraction_params['margin'],
+            extraction_params['extraction_radius_pix'],
+            extraction_params['back_size_x'],
+            extraction_params['back_size_y'])
 
 
 def extract_sources(accessor, extraction_params):
@@ -20,19 +103,41 @@ def extract_sources(accessor, extraction_params):
          images: a tuple of image DB object and accessor
         extraction_params: dictionary containing at least the detection and
             analysis threshold and the association radius, the last one a
-            multiplication factor of the de Ruiter radius.
+            multiplication factor of the de Ruiter radius. If its
+            ``warm_start_background`` entry is set, the background clipping
+            is warm started from the previous image of the same field (see
+            :class:`BackgroundCache`).
     returns:
-        list of ExtractionResults named tuples containing source measurements,
-        min RMS value and max RMS value
+        list of ExtractionResults named tuples containing source measurements
+        (as a structured array, see
+        :data:`tkp.utility.containers.SERIALIZED_DTYPE`), min RMS value,
+        max RMS value and, if the ``forced_fit_reuse_background`` entry of
+        extraction_params is set, the background grids of the image (see
+        :class:`tkp.sourcefinder.image.BackgroundGrids`) for the forced fits
+        of the same image to use; otherwise None.
     """
     logger.debug("Detecting sources in image %s at detection threshold %s",
                  accessor, extraction_params['detection_threshold'])
 
+    warm_start = extraction_params.get('warm_start_background', False)
+    clip_seed = None
+    if warm_start:
+        key = background_key(accessor, extraction_params)
+        clip_seed = background_cache.get(key)
+
     data_image = sourcefinder_image_from_accessor(accessor,
                     margin=extraction_params['margin'],
                     radius=extraction_params['extraction_radius_pix'],
                     back_size_x=extraction_params['back_size_x'],
-                    back_size_y=extraction_params['back_size_y'])
+                    back_size_y=extraction_params['back_size_y'],
+                    fit_workers=extraction_params.get('fit_workers', 0),
+                    moments_max_beams=extraction_params.get(
+                        'moments_max_beams', 0),
+                    moments_max_sig=extraction_params.get(
+                        'moments_max_sig', 0),
+                    dtype=image_dtype(extraction_params),
+                    clip_seed=clip_seed,
+                    cache_budget=image_cache_budget(extraction_params))
 
     logger.debug("Employing margin: %s extraction radius: %s deblend_nthresh: %s",
                  extraction_params['margin'],
@@ -48,13 +153,24 @@ def extract_sources(accessor, extraction_params):
         force_beam=extraction_params['force_beam']
     )
     logger.debug("Detected %d sources in image %s" % (len(results), accessor.url))
+    logger.debug("Image cache of %s: %s", accessor.url,
+                 data_image.memo_cache.statistics())
+
+    if warm_start and data_image.clip_state is not None:
+        background_cache.put(key, data_image.clip_state,
+                             data_image.clip_iterations, clip_seed is not None)
+        logger.debug("Background cache: %s", background_cache.statistics())
 
     ew_sys_err = extraction_params['ew_sys_err']
     ns_sys_err = extraction_params['ns_sys_err']
-    serialized = [r.serialize(ew_sys_err, ns_sys_err) for r in results]
+    serialized = serialize_detections(results, ew_sys_err, ns_sys_err)
+    background_grids = None
+    if extraction_params.get('forced_fit_reuse_background', False):
+        background_grids = data_image.background_grids
     return ExtractionResults(sources=serialized,
                              rms_min=float(data_image.rmsmap.min()),
-                             rms_max=float(data_image.rmsmap.max())
+                             rms_max=float(data_image.rmsmap.max()),
+                             background_grids=background_grids
                              )
 
 
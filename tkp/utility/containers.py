@@ -6,8 +6,76 @@ lightcurves, detections, sources, etc -- that the pipeline must handle.
 """
 
 import logging
+
+import numpy
+
 logger = logging.getLogger(__name__)
 
+
+#: Layout of serialized detections: one record per detection, with fields
+#: in the order of :meth:`tkp.sourcefinder.extract.Detection.serialize`
+#: and named after the corresponding columns of the extractedsource table.
+SERIALIZED_DTYPE = numpy.dtype([
+    ('ra', numpy.float64),
+    ('decl', numpy.float64),
+    ('ra_fit_err', numpy.float64),
+    ('decl_fit_err', numpy.float64),
+    ('f_peak', numpy.float64),
+    ('f_peak_err', numpy.float64),
+    ('f_int', numpy.float64),
+    ('f_int_err', numpy.float64),
+    ('det_sigma', numpy.float64),
+    ('semimajor', numpy.float64),
+    ('semiminor', numpy.float64),
+    ('pa', numpy.float64),
+    ('ew_sys_err', numpy.float64),
+    ('ns_sys_err', numpy.float64),
+    ('error_radius', numpy.float64),
+    ('fit_type', numpy.bool_),
+    ('chisq', numpy.float64),
+    ('reduced_chisq', numpy.float64),
+])
+
+
+def serialized_array(rows):
+    """
+    Pack serialized detections into a single structured array.
+
+    Args:
+        rows: sequence of serialized detections, each either a sequence of
+            values in the order of :data:`SERIALIZED_DTYPE` or a record of
+            an array with that dtype.
+
+    Returns:
+        numpy.ndarray: one record per detection, of :data:`SERIALIZED_DTYPE`.
+    """
+    if isinstance(rows, numpy.ndarray) and rows.dtype == SERIALIZED_DTYPE:
+        return rows
+    return numpy.array([tuple(row) for row in rows], dtype=SERIALIZED_DTYPE)
+
+
+def serialize_detections(detections, ew_sys_err, ns_sys_err):
+    """
+    Serialize detections for database storage.
+
+    Rather than a list of per-source rows, all the detections are packed
+    into a single structured array, which is much cheaper to keep around
+    and to pickle when passing results between workers.
+
+    Args:
+        detections: sequence of :class:`tkp.sourcefinder.extract.Detection`.
+        ew_sys_err (float): east-west systematic error, in arcsec.
+        ns_sys_err (float): north-south systematic error, in arcsec.
+
+    Returns:
+        numpy.ndarray: one record per detection, of :data:`SERIALIZED_DTYPE`.
+    """
+    return serialized_array(
+        detection.serialize(ew_sys_err, ns_sys_err)
+        for detection in detections
+    )
+
+
 class ObjectContainer(list):
     """A container class for objects.
 
@@ -83,3 +151,9 @@ class ExtractionResults(ObjectContainer):
 
     def __str__(self):
         return 'ExtractionResults: ' + str(len(self)) + ' detection(s).'
+
+    def serialize(self, ew_sys_err, ns_sys_err):
+        """
+        Serialize all the detections; see :func:`serialize_detections`.
+        """
+        return serialize_detections(self, ew_sys_err, ns_sys_err)
@@ -6,6 +6,7 @@ General purpose astronomical coordinate handling routines.
 
 import sys
 import math
+import numpy
 from astropy import wcs as pywcs
 import logging
 import datetime
@@ -346,6 +347,25 @@ def angsep(ra1, dec1, ra2, dec2):
     return 3600 * math.degrees(math.acos(temp))
 
 
+def angsep_many(ra1, dec1, ra2, dec2):
+    """Find the angular separations of many pairs of sources, in
+    arcseconds.
+
+    As angsep(), but the arguments are arrays of decimal degrees. A NaN in
+    any coordinate of a pair gives a NaN separation.
+    """
+    b = (math.pi / 2) - numpy.radians(dec1)
+    c = (math.pi / 2) - numpy.radians(dec2)
+    temp = (numpy.cos(b) * numpy.cos(c)) + (
+        numpy.sin(b) * numpy.sin(c) *
+        numpy.cos(numpy.radians(numpy.subtract(ra1, ra2))))
+
+    # Truncate the value of temp at +- 1, as in angsep().
+    temp = numpy.clip(temp, -1.0, 1.0)
+
+    return 3600 * numpy.degrees(numpy.arccos(temp))
+
+
 def alphasep(ra1, ra2, dec1, dec2):
     """Find the angular separation of two sources in RA, in arcseconds
 
@@ -409,6 +429,22 @@ def alpha_inflate(theta, decl):
     else:
         return math.degrees(abs(math.atan(math.sin(math.radians(theta)) / math.sqrt(abs(math.cos(math.radians(decl - theta)) * math.cos(math.radians(decl + theta)))))))
 
+
+def alpha_inflate_many(theta, decl):
+    """Compute the ra expansion for many values of theta and decl.
+
+    As alpha_inflate(), but the arguments are arrays of decimal degrees.
+    """
+    theta = numpy.asarray(theta, dtype=float)
+    decl = numpy.asarray(decl, dtype=float)
+    polar = numpy.abs(decl) + theta > 89.9
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        alpha = numpy.degrees(numpy.abs(numpy.arctan(
+            numpy.sin(numpy.radians(theta)) / numpy.sqrt(numpy.abs(
+                numpy.cos(numpy.radians(decl - theta)) *
+                numpy.cos(numpy.radians(decl + theta)))))))
+    return numpy.where(polar, 180.0, alpha)
+
 # Find the RA of a point in a radio image, given l,m and field centre
 def delta(l, m, delta0):
     """Convert a coordinate in l, m into an coordinate in Dec
@@ -563,6 +599,19 @@ def eq_to_cart(ra, dec):
             math.sin(math.radians(dec)))  # Cartesian z
 
 
+def eq_to_cart_many(ra, dec):
+    """Find the cartesian co-ordinates of many positions on the unit sphere.
+
+    As eq_to_cart(), but ra and dec are arrays of degrees; returns a tuple of
+    arrays.
+    """
+    ra = numpy.radians(ra)
+    dec = numpy.radians(dec)
+    return (numpy.cos(dec) * numpy.cos(ra),  # Cartesian x
+            numpy.cos(dec) * numpy.sin(ra),  # Cartesian y
+            numpy.sin(dec))  # Cartesian z
+
+
 class CoordSystem(object):
     """A container for constant strings representing different coordinate
     systems."""
@@ -654,6 +703,29 @@ class WCS(object):
         else:
             super(WCS, self).__getattr__(attrname)
 
+    def __getstate__(self):
+        # Pickle just the attributes which define the coordinate system:
+        # pywcs.WCS pickles itself by way of a FITS header, which is larger
+        # and loses precision. Those never set (such as crota, which has no
+        # default) are left out.
+        state = {}
+        for attrname in self.WCS_ATTRS:
+            try:
+                values = getattr(self, attrname)
+            except AttributeError:
+                continue
+            if attrname in ("ctype", "cunit"):
+                state[attrname] = tuple(str(value) for value in values)
+            else:
+                state[attrname] = tuple(float(value) for value in values)
+        return state
+
+    def __setstate__(self, state):
+        self.__init__()
+        for attrname in self.WCS_ATTRS:
+            if attrname in state:
+                setattr(self, attrname, state[attrname])
+
     def p2s(self, pixpos):
         """
         Pixel to Spatial coordinate conversion.
@@ -685,3 +757,42 @@ class WCS(object):
         if math.isnan(x) or math.isnan(y):
             raise RuntimeError("Pixel position is not a number")
         return float(x), float(y)
+
+    def p2s_many(self, pixpos):
+        """
+        Pixel to Spatial coordinate conversion of many positions at once.
+
+        Args:
+            pixpos (array): sequence of [x, y] pixel positions, shape (N, 2)
+
+        Returns:
+            tuple: ra (numpy.ndarray) Right ascensions of the positions
+                   dec (numpy.ndarray) Declinations of the positions
+
+            Both are NaN where a position cannot be converted; p2s() would
+            raise RuntimeError.
+        """
+        pixpos = numpy.asarray(pixpos, dtype=float).reshape(-1, 2)
+        ra, dec = self.wcs.wcs_pix2world(pixpos[:, 0], pixpos[:, 1],
+                                         self.ORIGIN)
+        return ra, dec
+
+    def s2p_many(self, spatialpos):
+        """
+        Spatial to Pixel coordinate conversion of many positions at once.
+
+        Args:
+            spatialpos (array): sequence of [ra, dec] spatial positions,
+                shape (N, 2)
+
+        Returns:
+            tuple: X pixel values (numpy.ndarray) of the positions,
+                   Y pixel values (numpy.ndarray) of the positions
+
+            Both are NaN where a position cannot be converted; s2p() would
+            raise RuntimeError.
+        """
+        spatialpos = numpy.asarray(spatialpos, dtype=float).reshape(-1, 2)
+        x, y = self.wcs.wcs_world2pix(spatialpos[:, 0], spatialpos[:, 1],
+                                      self.ORIGIN)
+        return x, y
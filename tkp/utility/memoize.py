@@ -3,20 +3,28 @@
 #
 # Memoization.
 #
+import time
+from collections import OrderedDict
 from weakref import WeakKeyDictionary
 from functools import update_wrapper
 
+import numpy
+
 
 class Memoize(object):
     """Decorator to cache the results of methods.
 
-    Examples in e.g. image.py::
+    The values of all instances are held by the decorator, without a limit
+    on the memory they take, until the instance is garbage collected or
+    the value deleted. For example::
 
         @Memoize
         def _grids(self):
             return self.__grids()
         grids = property(fget=_grids, fdel=_grids.delete)
 
+    ImageData uses CachedMemoize instead, which holds each image's values
+    within a memory budget.
     """
 
     def __init__(self, funct):
@@ -35,3 +43,190 @@ class Memoize(object):
             del(self.memo[instance])
         except KeyError:
             pass
+
+
+class BoundedMemoize(object):
+    """Decorator to cache the results of functions, holding at most maxsize
+    results.
+
+    The function's positional arguments, which must be hashable, are used as
+    the key. When the cache is full, the least recently used result is
+    discarded. For example::
+
+        @BoundedMemoize(maxsize=32)
+        def expensive(semimajor, semiminor, theta):
+            ...
+
+    The number of cache hits and misses are counted, and the cache may be
+    emptied with ``expensive.clear()``.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.memo = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, funct):
+        def wrapper(*args):
+            try:
+                result = self.memo.pop(args)
+                self.hits += 1
+            except KeyError:
+                result = funct(*args)
+                self.misses += 1
+                if self.memo and len(self.memo) >= self.maxsize:
+                    self.memo.popitem(last=False)
+            # (Re-)inserting moves this result to the most recently used end.
+            self.memo[args] = result
+            return result
+        update_wrapper(wrapper, funct)
+        wrapper.cache = self
+        wrapper.clear = self.clear
+        return wrapper
+
+    def clear(self):
+        """Forget all memoized values"""
+        self.memo.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+def _nbytes(value):
+    """Memory held by the arrays within value, in bytes"""
+    if isinstance(value, numpy.ndarray):
+        nbytes = value.nbytes
+        mask = numpy.ma.getmask(value)
+        if mask is not numpy.ma.nomask:
+            nbytes += mask.nbytes
+        return nbytes
+    if isinstance(value, dict):
+        return sum(_nbytes(item) for item in value.values())
+    if isinstance(value, (tuple, list)):
+        return sum(_nbytes(item) for item in value)
+    return 0
+
+
+class MemoCache(object):
+    """The memoized values of a single object, held within a memory budget.
+
+    Values are stored under the name of the method which calculated them.
+    Those marked evictable, such as maps which are large but quick to
+    recalculate, are discarded least recently used first whenever the
+    memory they hold together exceeds the budget; others are kept until
+    forgotten. The value most recently calculated is always kept, even if
+    it alone exceeds the budget.
+
+    Hits, misses, evictions, the memory held and the time spent calculating
+    values are counted; see statistics(). The values are not pickled with
+    the object, and are calculated afresh after unpickling.
+    """
+
+    def __init__(self, budget=None):
+        """
+        Args:
+            budget (int): memory to hold at most in evictable values, in
+                bytes; None for no limit.
+        """
+        self.budget = budget
+        self.values = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.compute_time = 0.
+
+    def __getstate__(self):
+        return {'budget': self.budget}
+
+    def __setstate__(self, state):
+        self.__init__(state['budget'])
+
+    def lookup(self, name, compute, evictable=False):
+        """The value stored under name, calculated by compute() if it is
+        not held."""
+        try:
+            value, nbytes, evictable = self.values.pop(name)
+            self.hits += 1
+        except KeyError:
+            start = time.time()
+            value = compute()
+            self.compute_time += time.time() - start
+            self.misses += 1
+            nbytes = _nbytes(value)
+        # (Re-)inserting moves this value to the most recently used end.
+        self.values[name] = (value, nbytes, evictable)
+        if evictable and self.budget is not None:
+            self._evict(keep=name)
+        return value
+
+    def _evict(self, keep):
+        held = self.evictable_bytes
+        for name, (value, nbytes, evictable) in list(self.values.items()):
+            if held <= self.budget:
+                break
+            if evictable and name != keep:
+                del self.values[name]
+                held -= nbytes
+                self.evictions += 1
+
+    def forget(self, name):
+        """Forget the value stored under name, if any"""
+        self.values.pop(name, None)
+
+    def clear(self):
+        """Forget all values; the counters are kept"""
+        self.values.clear()
+
+    @property
+    def nbytes(self):
+        """Memory held by all values, in bytes"""
+        return sum(nbytes for value, nbytes, evictable in self.values.values())
+
+    @property
+    def evictable_bytes(self):
+        """Memory held by evictable values, in bytes"""
+        return sum(nbytes for value, nbytes, evictable in self.values.values()
+                   if evictable)
+
+    def statistics(self):
+        """Hits, misses, evictions, the memory held in bytes and the time
+        spent calculating values in seconds"""
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'bytes': self.nbytes,
+                'compute_time': self.compute_time}
+
+
+class CachedMemoize(object):
+    """Decorator to cache the results of methods in the MemoCache held by
+    each instance as its memo_cache attribute.
+
+    Used like Memoize, in e.g. image.py::
+
+        @CachedMemoize(evictable=True)
+        def _backmap(self):
+            ...
+        backmap = property(fget=_backmap, fdel=_backmap.delete)
+
+    Unlike Memoize, each instance holds its own values, within its own
+    memory budget. Values which are large but quick to recalculate should
+    be marked evictable.
+    """
+
+    def __init__(self, evictable=False):
+        self.evictable = evictable
+
+    def __call__(self, funct):
+        name = funct.__name__
+        evictable = self.evictable
+
+        def wrapper(instance):
+            return instance.memo_cache.lookup(
+                name, lambda: funct(instance), evictable)
+
+        def delete(instance):
+            """Forget a memoized value"""
+            instance.memo_cache.forget(name)
+
+        update_wrapper(wrapper, funct)
+        wrapper.delete = delete
+        return wrapper
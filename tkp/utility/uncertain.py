@@ -8,6 +8,8 @@
 # http://aspn.activestate.com/ASPN/Cookbook/Python/Recipe/535164
 import math
 
+import numpy
+
 
 class Uncertain(object):
     """Represents a numeric value with a known small uncertainty (error,
@@ -120,3 +122,127 @@ class Uncertain(object):
 
     def min(self):
         return self.value - self.error
+
+
+class UncertainArray(object):
+    """An array of numeric values, each with a known small uncertainty.
+
+    This is the array counterpart of Uncertain: the operators are
+    overloaded to work elementwise, on other UncertainArray, Uncertain or
+    numeric objects (including numpy arrays), with the same formulae for
+    the propagation of errors, so that each element of the result is the
+    same as Uncertain would give for the corresponding elements. An
+    Uncertain operand must come second: Uncertain does not know about
+    UncertainArray. Indexing with an integer gives an Uncertain; any other
+    index an UncertainArray.
+    """
+
+    def __init__(self, value=(), error=0.):
+        self.value = numpy.asarray(value, dtype=float)
+        self.error = numpy.array(
+            numpy.broadcast_to(numpy.abs(error), self.value.shape),
+            dtype=float)
+
+    @classmethod
+    def from_uncertains(cls, uncertains):
+        """An UncertainArray of the values and errors of a sequence of
+        Uncertain"""
+        uncertains = list(uncertains)
+        return cls([u.value for u in uncertains],
+                   [u.error for u in uncertains])
+
+    def __str__(self):
+        return "%s+-%s" % (self.value, self.error)
+
+    def __repr__(self):
+        return "UncertainArray(%r, %r)" % (self.value, self.error)
+
+    def __len__(self):
+        return len(self.value)
+
+    def __getitem__(self, index):
+        value, error = self.value[index], self.error[index]
+        if numpy.ndim(value):
+            return UncertainArray(value, error)
+        return Uncertain(value, error)
+
+    def __iter__(self):
+        for value, error in zip(self.value, self.error):
+            yield Uncertain(value, error)
+
+    def __abs__(self):
+        return UncertainArray(numpy.abs(self.value), self.error)
+
+    def __add__(self, other):
+        if isinstance(other, (Uncertain, UncertainArray)):
+            v = self.value + other.value
+            e = numpy.power(numpy.power(self.error, 2) +
+                            numpy.power(other.error, 2), .5)
+            return UncertainArray(v, e)
+        else:
+            return UncertainArray(self.value + other, self.error)
+
+    def __radd__(self, other):
+        return self + other  # __add__
+
+    def __sub__(self, other):
+        return self + (-other)  # other.__neg__ and __add__
+
+    def __rsub__(self, other):
+        return -self + other  # __neg__ and __add__
+
+    def __mul__(self, other):
+        if isinstance(other, (Uncertain, UncertainArray)):
+            v = self.value * other.value
+            e = numpy.power(numpy.power(self.error * other.value, 2) +
+                            numpy.power(other.error * self.value, 2), .5)
+            return UncertainArray(v, e)
+        else:
+            return UncertainArray(self.value * other, self.error * other)
+
+    def __rmul__(self, other):
+        return self * other  # __mul__
+
+    def __neg__(self):
+        return self * -1  # __mul__
+
+    def __pos__(self):
+        return self
+
+    def __div__(self, other):
+        return self * (1. / other)  # other.__rdiv__ and __mul__
+
+    def __rdiv__(self, other):
+        return (self / other)**-1.  # __pow__ and __div__
+
+    def __pow__(self, other):
+        if isinstance(other, (Uncertain, UncertainArray)):
+            v = numpy.power(self.value, other.value)
+            e = numpy.power(
+                numpy.power(self.error * other.value *
+                            numpy.power(self.value, other.value - 1.0), 2) +
+                numpy.power(other.error * numpy.log(self.value) *
+                            numpy.power(self.value, other.value), 2),
+                .5)
+            return UncertainArray(v, e)
+        else:
+            return UncertainArray(
+                numpy.power(self.value, other),
+                self.error * other * numpy.power(self.value, other - 1))
+
+    def __rpow__(self, other):
+        return UncertainArray(
+            numpy.power(other, self.value),
+            self.error * numpy.log(other) * numpy.power(other, self.value))
+
+    def exp(self):
+        return math.e**self
+
+    def log(self):
+        return UncertainArray(numpy.log(self.value), self.error / self.value)
+
+    def max(self):
+        return self.value + self.error
+
+    def min(self):
+        return self.value - self.error